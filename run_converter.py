@@ -18,29 +18,33 @@ def main():
     # sys.argv[0] is the script name, actual args start from sys.argv[1]
     script_args = sys.argv[1:]
 
-    # Heuristic to identify path arguments (input_file, output_file)
-    # This assumes they are the first two non-option arguments.
-    # A more robust solution would involve some level of pre-parsing or fixed positions.
-    
-    # Let's find the input_file and output_file arguments.
-    # Argparse in src/main.py expects input_file and output_file as positional.
-    
-    processed_positional_args = 0
+    # Positional arguments (input and output files) and the values of path options are
+    # paths relative to the original CWD.
+
+    def adjust(path_arg):
+        # Paths are relative to the original CWD; make them relative to package_dir
+        return os.path.relpath(os.path.abspath(path_arg), package_dir)
+
+    # Options whose value is a path, and options whose value is passed through as is
+    path_options = {"--output-dir", "--include-path", "-I", "--report-json", "--budget-file"}
+    value_options = {"--budget"}
+
+    expects = None
     for arg in script_args:
-        if not arg.startswith("-"):
-            processed_positional_args += 1
-            if processed_positional_args <= 2: # input_file or output_file
-                # Prepend "../" to make it relative to 'package_dir'
-                # This assumes 'arg' was originally relative to 'script_root_dir'
-                # os.path.abspath resolves it from the current CWD (script_root_dir)
-                # then os.path.relpath makes it relative to package_dir
-                abs_path = os.path.abspath(arg)
-                relative_to_package_dir = os.path.relpath(abs_path, package_dir)
-                adjusted_args.append(relative_to_package_dir)
-            else: # Other positional args, pass as is
+        if expects is not None:
+            adjusted_args.append(adjust(arg) if expects == "path" else arg)
+            expects = None
+        elif arg.startswith("-"):
+            option = arg.split("=", 1)[0]
+            if "=" in arg and option in path_options:
+                adjusted_args.append(f"{option}={adjust(arg.split('=', 1)[1])}")
+            else:
                 adjusted_args.append(arg)
-        else: # Option arguments like --verbose
-            adjusted_args.append(arg)
+                if "=" not in arg:
+                    expects = "path" if option in path_options else "value" if option in value_options else None
+        else:
+            # Positional arguments (input and output files) are paths
+            adjusted_args.append(adjust(arg))
 
     cmd = [
         "python", "-m", "src.main"
@@ -0,0 +1,86 @@
+# Library API for the XSHD to TextMate converter.
+#
+# Every function here is side-effect free apart from the files it is asked to write:
+# nothing is printed, no module-level state is kept, and failures raise the typed
+# errors from errors.py. The functions are safe to call concurrently, e.g. from a
+# concurrent.futures.ThreadPoolExecutor or a server's request handlers.
+
+import os
+
+from .errors import (ConverterError, XshdParseError, XshdImportError, GrammarGenerationError, GrammarWriteError,
+                     GrammarBudgetError)
+from .xshd_parser import load_xshd, parse_xshd_string
+from .xshd_loader import DefinitionLoader, load_definition
+from .textmate_generator import build_textmate_grammar, write_textmate_grammar
+from .grammar_metrics import measure_grammar, check_budget, enforce_budget
+
+__all__ = [
+    "ConverterError", "XshdParseError", "XshdImportError", "GrammarGenerationError", "GrammarWriteError",
+    "GrammarBudgetError",
+    "load_xshd", "parse_xshd_string", "DefinitionLoader", "load_definition",
+    "build_textmate_grammar", "write_textmate_grammar", "measure_grammar", "check_budget", "enforce_budget",
+    "convert_string", "convert_file", "convert_files",
+]
+
+
+def convert_string(xshd_text: str) -> dict:
+    """
+    Converts .xshd content held in memory into a TextMate grammar dictionary.
+
+    Raises:
+        XshdParseError: If the text is not a valid XSHD definition.
+        GrammarGenerationError: If the definition cannot be converted.
+    """
+    return build_textmate_grammar(parse_xshd_string(xshd_text))
+
+
+def convert_file(input_path: str, output_path: str = None) -> dict:
+    """
+    Converts an .xshd file into a TextMate grammar.
+
+    Args:
+        input_path: Path to the .xshd file.
+        output_path: Optional path to write the grammar JSON to.
+
+    Returns:
+        The TextMate grammar as a dictionary.
+
+    Raises:
+        XshdParseError, GrammarGenerationError, GrammarWriteError
+    """
+    grammar = build_textmate_grammar(load_xshd(input_path))
+    if output_path is not None:
+        write_textmate_grammar(grammar, output_path)
+    return grammar
+
+
+def convert_files(input_paths, output_dir: str = None, search_paths=(), loader: DefinitionLoader = None) -> dict:
+    """
+    Converts several .xshd files, resolving RuleSet references across files.
+
+    All conversions share one DefinitionLoader, so a base definition referenced by
+    several inputs is parsed once.
+
+    Args:
+        input_paths: Paths to the .xshd files.
+        output_dir: Optional directory to write each grammar to, as <stem>.tmLanguage.json.
+        search_paths: Directories searched for referenced definitions.
+        loader: Optional loader to share with other calls; search_paths is ignored then.
+
+    Returns:
+        A dict mapping each input path to its TextMate grammar dictionary.
+
+    Raises:
+        XshdParseError, XshdImportError, GrammarGenerationError, GrammarWriteError
+    """
+    loader = loader or DefinitionLoader(search_paths)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    grammars = {}
+    for input_path in input_paths:
+        grammar = build_textmate_grammar(loader.load(input_path))
+        if output_dir is not None:
+            stem = os.path.splitext(os.path.basename(input_path))[0]
+            write_textmate_grammar(grammar, os.path.join(output_dir, f"{stem}.tmLanguage.json"))
+        grammars[input_path] = grammar
+    return grammars
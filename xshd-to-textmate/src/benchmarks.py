@@ -0,0 +1,291 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import build_textmate_grammar, convert_string
+from .folding import BracketIndex
+from .span_scanner import DEFAULT_CHUNK_SIZE, SpanScanner, build_span_regex, regex_scan
+from .textmate_tokenizer import load_grammar, split_lines
+from .viewport import ViewportTokenizer
+from .workload import generate_xshd
+
+# Benchmarks for the converter library. Run with:
+#   python -m xshd-to-textmate.src.benchmarks <benchmark> [options]
+
+
+def bench_thread_scaling(worker_counts=(1, 2, 4, 8), jobs: int = 32, categories: int = 6,
+                         keys_per_category: int = 400, seed: int = 0) -> list:
+    """
+    Converts `jobs` distinct synthetic definitions on ThreadPoolExecutors of several sizes.
+
+    Every run is checked against a serial reference: each result must be identical to
+    the grammar converted on its own, and nothing may be written to stdout or stderr.
+
+    Returns:
+        A list of dicts with workers, seconds, conversions_per_second and speedup.
+    """
+    definitions = [
+        generate_xshd(seed=seed + i, rulesets=2, categories=categories,
+                      keys_per_category=keys_per_category, spans=6, nesting_depth=1,
+                      name=f"Bench Lang {i}")
+        for i in range(jobs)
+    ]
+    reference = [json.dumps(convert_string(text), sort_keys=True) for text in definitions]
+
+    results = []
+    for workers in worker_counts:
+        captured = io.StringIO()
+        with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                grammars = list(pool.map(convert_string, definitions))
+            elapsed = time.perf_counter() - start
+
+        if captured.getvalue():
+            raise AssertionError(f"conversions wrote output with {workers} workers: {captured.getvalue()[:200]!r}")
+        for index, grammar in enumerate(grammars):
+            if json.dumps(grammar, sort_keys=True) != reference[index]:
+                raise AssertionError(f"result {index} differs from the serial reference with {workers} workers")
+
+        results.append({"workers": workers, "seconds": elapsed, "conversions_per_second": jobs / elapsed})
+
+    base = results[0]["seconds"]
+    for row in results:
+        row["speedup"] = base / row["seconds"]
+    return results
+
+
+def _string_heavy_source(lines: int) -> str:
+    return "\n".join(
+        f'var s{i} = "label {i} with \\"escaped\\" quotes and \\\\ slashes {i}"; var c{i} = \'\\n\'; var d{i} = \'x\';'
+        for i in range(lines)
+    )
+
+
+def bench_string_tokenization(xshd_data: dict, lines: int = 20000, samples: int = 3) -> list:
+    """
+    Tokenizes a string-heavy source with the generated string rules and with the previous
+    shape of those rules (begin/end spans re-entering a "\\." pattern for every escape,
+    the end pattern being retried at every character), plus every string as begin/end
+    with possessive runs, the shape of multi-line strings.
+
+    Returns:
+        A list of dicts with variant, seconds (best of `samples`), lines_per_second and speedup.
+    """
+    legacy_data = dict(xshd_data, strings=[
+        dict(string, stopateol=False, escapecharacter="\\") for string in xshd_data.get("strings", [])
+    ])
+    runs = build_textmate_grammar(legacy_data)
+    legacy = json.loads(json.dumps(runs))
+    for rule in legacy["repository"]["strings"]["patterns"]:
+        rule["patterns"] = [child for child in rule.get("patterns", []) if "name" in child or "include" in child]
+    variants = [("begin/end with escape pattern", legacy),
+                ("begin/end, possessive runs", runs),
+                ("escapecharacter, possessive", build_textmate_grammar(xshd_data))]
+    source_lines = split_lines(_string_heavy_source(lines))
+
+    results = []
+    for variant, grammar_dict in variants:
+        grammar = load_grammar(grammar_dict)
+        best = None
+        for _ in range(samples):
+            start = time.perf_counter()
+            for _ in grammar.tokenize_lines(source_lines):
+                pass
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"variant": variant, "seconds": best, "lines_per_second": lines / best})
+
+    base = results[0]["seconds"]
+    for row in results:
+        row["speedup"] = base / row["seconds"]
+    return results
+
+
+def bench_span_scanning(xshd_data: dict, source: str, megabytes: float = 8.0, samples: int = 3) -> list:
+    """
+    Finds the comment and string spans of `source`, repeated to about `megabytes` of text,
+    with a regex alternation of the span patterns and with the Aho-Corasick SpanScanner,
+    whole and in chunks. All variants must find the same spans.
+
+    Returns:
+        A list of dicts with variant, seconds (best of `samples`), mb_per_second and speedup.
+    """
+    text = (source.rstrip("\n") + "\n") * max(1, int(megabytes * 1_000_000 / max(1, len(source))))
+    scanner = SpanScanner(xshd_data)
+    pattern = build_span_regex(scanner.delimiters)
+    variants = [
+        ("regex alternation", lambda: regex_scan(text, scanner.delimiters, pattern)),
+        ("aho-corasick", lambda: scanner.scan(text)),
+        ("aho-corasick, chunked", lambda: list(scanner.iter_spans(
+            text[i:i + DEFAULT_CHUNK_SIZE] for i in range(0, len(text), DEFAULT_CHUNK_SIZE)))),
+    ]
+
+    reference = None
+    results = []
+    for variant, run in variants:
+        best = None
+        for _ in range(samples):
+            start = time.perf_counter()
+            spans = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if reference is None:
+            reference = spans
+        elif spans != reference:
+            raise AssertionError(f"{variant} found different spans than {variants[0][0]}")
+        results.append({"variant": variant, "seconds": best, "mb_per_second": len(text) / 1_000_000 / best})
+
+    base = results[0]["seconds"]
+    for row in results:
+        row["speedup"] = base / row["seconds"]
+    return results
+
+
+def bench_bracket_index(xshd_data: dict, source: str, megabytes: float = 4.0, edits: int = 50) -> list:
+    """
+    Indexes `source`, repeated to about `megabytes` of text, with BracketIndex, then types
+    `edits` characters into the middle, updating the index after each one incrementally
+    and, for comparison, by rebuilding it. Both must end with the same index.
+
+    Returns:
+        A list of dicts with variant, seconds (per index or edit) and speedup.
+    """
+    text = (source.rstrip("\n") + "\n") * max(1, int(megabytes * 1_000_000 / max(1, len(source))))
+    start = time.perf_counter()
+    index = BracketIndex(xshd_data, text)
+    build = time.perf_counter() - start
+
+    typed = ("a -> (b [] c) -> {Skip}\n" * (edits // 24 + 1))[:edits]
+    middle = len(text) // 2
+    start = time.perf_counter()
+    for offset, char in enumerate(typed, middle):
+        index.apply_edit(offset, offset, char)
+    incremental = (time.perf_counter() - start) / edits
+
+    rebuilt = None
+    rebuild_edits = min(edits, 3)
+    start = time.perf_counter()
+    current = text
+    for offset, char in enumerate(typed[:rebuild_edits], middle):
+        current = current[:offset] + char + current[offset:]
+        rebuilt = BracketIndex(xshd_data, current)
+    rebuild = (time.perf_counter() - start) / rebuild_edits
+    if rebuild_edits == edits and (list(rebuilt.positions) != list(index.positions) or rebuilt.links != index.links):
+        raise AssertionError("the incrementally updated index differs from a rebuilt one")
+
+    return [
+        {"variant": f"index {len(text) / 1_000_000:.1f} MB", "seconds": build, "speedup": 1.0},
+        {"variant": "edit: rebuild", "seconds": rebuild, "speedup": build / rebuild},
+        {"variant": "edit: incremental", "seconds": incremental, "speedup": build / incremental},
+    ]
+
+
+def bench_viewport(grammar, source: str, megabytes: float = 4.0, viewport_lines: int = 60) -> list:
+    """
+    Writes `source`, repeated to about `megabytes`, to a file and paints a viewport near
+    its end with ViewportTokenizer: first from a fresh index, then one screen further
+    down. For comparison, tokenizes every line up to the same viewport. All three must
+    give the same tokens.
+
+    Returns:
+        A list of dicts with variant, seconds, lines tokenized and speedup.
+    """
+    grammar = load_grammar(grammar)
+    text = (source.rstrip("\n") + "\n") * max(1, int(megabytes * 1_000_000 / max(1, len(source))))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "source")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        start = time.perf_counter()
+        viewport = ViewportTokenizer(grammar, path)
+        index = time.perf_counter() - start
+        first = len(viewport) * 9 // 10
+        start = time.perf_counter()
+        painted = viewport.tokenize(first, first + viewport_lines)
+        paint = time.perf_counter() - start
+        paint_lines = viewport.stats["tokenized_lines"]
+        start = time.perf_counter()
+        scrolled = viewport.tokenize(first + viewport_lines, first + 2 * viewport_lines)
+        scroll = time.perf_counter() - start
+        viewport.close()
+
+    start = time.perf_counter()
+    lines = split_lines(text)[:first + 2 * viewport_lines]
+    full = [tokens for tokens, _ in grammar.tokenize_lines(lines)]
+    full_seconds = time.perf_counter() - start
+    if full[first:] != painted + scrolled:
+        raise AssertionError("viewport tokens differ from a full tokenization")
+
+    return [
+        {"variant": f"full to line {first + 1}", "seconds": full_seconds, "lines": len(lines), "speedup": 1.0},
+        {"variant": "index", "seconds": index, "lines": 0, "speedup": full_seconds / index},
+        {"variant": "first paint", "seconds": paint, "lines": paint_lines, "speedup": full_seconds / paint},
+        {"variant": "scroll", "seconds": scroll, "lines": viewport_lines, "speedup": full_seconds / scroll},
+    ]
+
+
+def _print_table(rows, columns):
+    print("  ".join(f"{name:>22}" for name in columns))
+    for row in rows:
+        print("  ".join(f"{row[name]:>22.3f}" if isinstance(row[name], float) else f"{row[name]:>22}"
+                        for name in columns))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run converter benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    threads_parser = subparsers.add_parser("threads", help="Conversion throughput across a ThreadPoolExecutor")
+    threads_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    threads_parser.add_argument("--jobs", type=int, default=32)
+    threads_parser.add_argument("--keys", type=int, default=400, help="Keys per KeyWords category")
+
+    strings_parser = subparsers.add_parser("strings", help="Tokenizing string-heavy sources")
+    strings_parser.add_argument("xshd", help="Path to the .xshd definition")
+    strings_parser.add_argument("--lines", type=int, default=20000)
+
+    spans_parser = subparsers.add_parser("spans", help="Finding comment and string spans in sources")
+    spans_parser.add_argument("xshd", help="Path to the .xshd definition")
+    spans_parser.add_argument("source", help="Source file, repeated to the benchmark size")
+    spans_parser.add_argument("--megabytes", type=float, default=8.0)
+
+    brackets_parser = subparsers.add_parser("brackets", help="Bracket and folding index, full and after edits")
+    brackets_parser.add_argument("xshd", help="Path to the .xshd definition")
+    brackets_parser.add_argument("source", help="Source file, repeated to the benchmark size")
+    brackets_parser.add_argument("--megabytes", type=float, default=4.0)
+    brackets_parser.add_argument("--edits", type=int, default=50)
+
+    viewport_parser = subparsers.add_parser("viewport", help="Tokenizing a viewport near the end of a large file")
+    viewport_parser.add_argument("grammar", help="Path to the .tmLanguage.json grammar")
+    viewport_parser.add_argument("source", help="Source file, repeated to the benchmark size")
+    viewport_parser.add_argument("--megabytes", type=float, default=4.0)
+
+    args = parser.parse_args()
+    if args.benchmark == "viewport":
+        with open(args.source, "r", encoding="utf-8-sig") as f:
+            _print_table(bench_viewport(args.grammar, f.read(), args.megabytes),
+                         ["variant", "seconds", "lines", "speedup"])
+    elif args.benchmark == "brackets":
+        from .xshd_parser import load_xshd
+        with open(args.source, "r", encoding="utf-8-sig") as f:
+            _print_table(bench_bracket_index(load_xshd(args.xshd), f.read(), args.megabytes, args.edits),
+                         ["variant", "seconds", "speedup"])
+    elif args.benchmark == "spans":
+        from .xshd_parser import load_xshd
+        with open(args.source, "r", encoding="utf-8-sig") as f:
+            _print_table(bench_span_scanning(load_xshd(args.xshd), f.read(), args.megabytes),
+                         ["variant", "seconds", "mb_per_second", "speedup"])
+    elif args.benchmark == "strings":
+        from .xshd_parser import load_xshd
+        _print_table(bench_string_tokenization(load_xshd(args.xshd), args.lines),
+                     ["variant", "seconds", "lines_per_second", "speedup"])
+    elif args.benchmark == "threads":
+        _print_table(bench_thread_scaling(args.workers, args.jobs, keys_per_category=args.keys),
+                     ["workers", "seconds", "conversions_per_second", "speedup"])
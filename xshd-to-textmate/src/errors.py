@@ -0,0 +1,59 @@
+# Exception types raised by the converter library API.
+# The CLI catches ConverterError and reports it; library callers can catch the
+# specific subclasses.
+
+
+class ConverterError(Exception):
+    """Base class for all errors raised by the XSHD to TextMate converter."""
+
+
+class XshdParseError(ConverterError):
+    """Raised when an .xshd definition cannot be read or is not valid XML."""
+
+    def __init__(self, message: str, path: str = None):
+        super().__init__(message)
+        self.path = path
+
+
+class GrammarGenerationError(ConverterError):
+    """Raised when parsed XSHD data cannot be turned into a TextMate grammar."""
+
+
+class GrammarWriteError(ConverterError):
+    """Raised when a generated grammar cannot be written to its output path."""
+
+    def __init__(self, message: str, path: str = None):
+        super().__init__(message)
+        self.path = path
+
+
+class XshdImportError(XshdParseError):
+    """
+    Raised when a cross-file RuleSet reference cannot be resolved, or when RuleSet
+    references and imports form a cycle.
+
+    Attributes:
+        path: The definition containing the failing reference.
+        reference: The reference, e.g. "Common/Comments".
+        chain: For cycles, the "path#RuleSet" entries of the cycle, first one repeated last.
+    """
+
+    def __init__(self, message: str, path: str = None, reference: str = None, chain: list = None):
+        super().__init__(message, path)
+        self.reference = reference
+        self.chain = chain or []
+
+
+class GrammarBudgetError(ConverterError):
+    """
+    Raised when a generated grammar exceeds a complexity budget (see grammar_metrics.py).
+
+    Attributes:
+        scope_name: The scopeName of the grammar.
+        violations: One dict per exceeded budget, with "metric", "value" and "limit".
+    """
+
+    def __init__(self, message: str, scope_name: str = None, violations: list = None):
+        super().__init__(message)
+        self.scope_name = scope_name
+        self.violations = violations or []
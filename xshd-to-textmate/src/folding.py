@@ -0,0 +1,405 @@
+import bisect
+import re
+from array import array
+from collections import namedtuple
+from itertools import accumulate
+from operator import add
+
+from .span_scanner import build_span_regex, span_delimiters
+
+# Bracket pairs and folding ranges of a source text, kept up to date across edits.
+#
+# One left-to-right pass finds the comment and string spans of the definition (the
+# same spans as span_scanner) and, in the text between them, the brackets. Brackets
+# are paired with a stack: a closing bracket pairs with the innermost open bracket if
+# it is of the same type and is unmatched otherwise; open brackets never closed stay
+# unmatched. Everything is stored in flat integer arrays indexed by bracket number.
+#
+# After an edit only a window around it is lexed again: from the last point before the
+# edit known to be outside every span, to the first point after it where the new text
+# is outside every span at a place the old text was too. Pairing restarts from the
+# open brackets at the start of the window; if the open brackets at its end are of the
+# same types as before the edit, the brackets after the window keep their pairs.
+# Otherwise only the closing brackets at the top level of the rest of the text are
+# paired again, since pairs nested below them do not depend on the edit. Pairs are
+# stored as the distance to the partner and offsets after the last edit carry a
+# pending shift, so an edit costs time in the size of the window, the nesting depth
+# and the distance from the previous edit, not in the size of the text. Edits that
+# change the number of open brackets also rewrite the depths after them.
+
+BRACKETS = "()[]{}"
+
+# Bracket codes: the index in BRACKETS, even for open brackets, odd for closing ones
+_CODES = bytes.maketrans(BRACKETS.encode(), bytes(range(len(BRACKETS))))
+_BRACKET = re.compile("[" + re.escape(BRACKETS) + "]")
+
+SPAN_KINDS = ("comment", "string")
+
+# A folding range in 0-based lines, as the LSP textDocument/foldingRange request
+# returns: the lines start_line + 1 .. end_line are hidden. kind is "region" for
+# brackets and "comment" for block comments.
+FoldingRange = namedtuple("FoldingRange", ["start_line", "end_line", "kind"])
+
+
+class OffsetArray:
+    """
+    A sorted array of text offsets that can be shifted after an edit cheaply.
+
+    Elements from `split` on are stored `shift` too low. An edit moves the split to
+    its own position, so its cost grows with the distance from the previous edit
+    rather than with the number of elements after it.
+    """
+
+    def __init__(self, values=()):
+        self.values = array("q", values)
+        self.split = len(self.values)
+        self.shift = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += len(self.values)
+        return self.values[index] + (self.shift if index >= self.split else 0)
+
+    def __iter__(self):
+        split, shift = self.split, self.shift
+        yield from self.values[:split]
+        yield from map(shift.__add__, self.values[split:])
+
+    def bisect_left(self, offset: int) -> int:
+        index = bisect.bisect_left(self.values, offset, 0, self.split)
+        return index if index < self.split else bisect.bisect_left(self.values, offset - self.shift, self.split)
+
+    def bisect_right(self, offset: int) -> int:
+        index = bisect.bisect_right(self.values, offset, 0, self.split)
+        return index if index < self.split else bisect.bisect_right(self.values, offset - self.shift, self.split)
+
+    def splice(self, first: int, after: int, new, delta: int):
+        """Replaces elements [first, after) with the offsets new and moves the elements after them by delta."""
+        values, split, shift = self.values, self.split, self.shift
+        if split < after:
+            values[split:after] = array("q", map(shift.__add__, values[split:after]))
+        elif split > after:
+            values[after:split] = array("q", map((-shift).__add__, values[after:split]))
+        values[first:after] = array("q", new)
+        self.split = first + len(new)
+        self.shift = shift + delta
+
+
+class BracketIndex:
+    """
+    Bracket pairs, comment and string spans and folding ranges of one text.
+
+    Brackets are numbered in text order. Per bracket, `positions` holds its offset,
+    `kinds` its code (the index in BRACKETS), `links` the distance to its partner (0:
+    unmatched) and `depths` the number of open brackets around it. Spans are held in
+    `span_starts`, `span_ends` (exclusive) and `span_kinds` (index in SPAN_KINDS), and
+    `line_starts` holds the offset of every line.
+
+    Args:
+        xshd_data: Parsed XSHD data; its comment and string spans are skipped.
+        text: The initial text.
+        fold_brackets: Open brackets whose pairs are folding ranges.
+
+    Attributes:
+        stats: "paired_brackets", the number of brackets visited one by one to pair
+            them (by reset() and apply_edit()).
+    """
+
+    def __init__(self, xshd_data: dict, text: str = "", fold_brackets: str = "{"):
+        self.delimiters = span_delimiters(xshd_data)
+        self.fold_codes = bytes(BRACKETS.index(bracket) for bracket in fold_brackets)
+        # Begin literal -> first delimiter with it. Named groups would keep the regex
+        # engine from skipping ahead to the possible first characters.
+        self._begins = {}
+        for index, delimiter in enumerate(self.delimiters):
+            self._begins.setdefault(delimiter.begin, index)
+        self._begin = re.compile("|".join(map(re.escape, sorted(self._begins, key=len, reverse=True)))
+                                 ) if self._begins else None
+        self._spans = [build_span_regex([delimiter]) for delimiter in self.delimiters]
+        self._max_begin = max((len(delimiter.begin) for delimiter in self.delimiters), default=1)
+        self.stats = {"paired_brackets": 0}
+        self.reset(text)
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def __len__(self) -> int:
+        """The number of brackets."""
+        return len(self.kinds)
+
+    def reset(self, text: str):
+        """Indexes a new text from scratch."""
+        self._text = text
+        positions, kinds, (starts, ends, span_kinds), _ = self._lex(text, 0)
+        self.positions, self.kinds = OffsetArray(positions), kinds
+        self.span_starts, self.span_ends, self.span_kinds = OffsetArray(starts), OffsetArray(ends), span_kinds
+        self.links = array("q", bytes(8 * len(kinds)))
+        self.depths = array("q", bytes(8 * len(kinds)))
+        self._pair(0, [])
+        lines = text.split("\n")
+        self.line_starts = OffsetArray([0])
+        self.line_starts.values.extend(map(add, accumulate(map(len, lines[:-1])), range(1, len(lines))))
+        self.line_starts.split = len(self.line_starts)
+
+    def _lex(self, text: str, start: int, resync: int = None, delta: int = 0):
+        """
+        Finds the brackets and spans from start, an offset outside every span.
+
+        Stops at the end of the text or, if resync is given, at the first offset from
+        resync on that is outside the spans of the new text and, shifted back by delta,
+        of the old one. Returns (positions, kinds, (span starts, ends, kinds), stop).
+        """
+        positions, kinds = array("q"), array("b")
+        span_starts, span_ends, span_kinds = array("q"), array("q"), array("b")
+        pos = start
+        while True:
+            match = self._begin.search(text, pos) if self._begin else None
+            gap_end = match.start() if match else len(text)
+            if resync is not None and max(pos, resync) <= gap_end and self._outside(max(pos, resync) - delta):
+                stop = max(pos, resync)
+            elif match is None:
+                stop = len(text)
+            else:
+                stop = None
+            segment = text[pos:gap_end if stop is None else stop]
+            found = _BRACKET.findall(segment)
+            if found:
+                # The k-th bracket follows k brackets and the text pieces before them
+                pieces = map(len, _BRACKET.split(segment)[:-1])
+                positions.extend(map(add, accumulate(pieces), range(pos, pos + len(found))))
+                kinds.frombytes("".join(found).encode().translate(_CODES))
+            if stop is not None:
+                return positions, kinds, (span_starts, span_ends, span_kinds), stop
+
+            index = self._begins[match.group()]
+            end = self._spans[index].match(text, gap_end).end()
+            span_starts.append(gap_end)
+            span_ends.append(end)
+            span_kinds.append(SPAN_KINDS.index(self.delimiters[index].kind))
+            pos = end
+
+    def _outside(self, offset: int) -> bool:
+        """Tells whether an offset is outside (or at the start of) every span."""
+        index = self.span_starts.bisect_right(offset) - 1
+        return index < 0 or self.span_ends[index] <= offset
+
+    def _pair(self, start: int, stack: list, stop: int = None) -> list:
+        """Pairs the brackets from number start to stop with the given open brackets; returns the stack."""
+        kinds, links, depths = self.kinds, self.links, self.depths
+        push, pop = stack.append, stack.pop
+        stop = len(kinds) if stop is None else stop
+        self.stats["paired_brackets"] += stop - start
+        for index in range(start, stop):
+            code = kinds[index]
+            depths[index] = len(stack)
+            if not code & 1:
+                push(index)
+            elif stack and kinds[stack[-1]] == code - 1:
+                opening = pop()
+                links[index] = opening - index
+                links[opening] = index - opening
+                depths[index] -= 1
+        return stack
+
+    def _repair_tail(self, tail: int, stack: list, old_open: int):
+        """
+        Pairs the brackets from number tail on with new open brackets before them.
+
+        Pairs within the tail do not depend on what precedes it, so only the closing
+        brackets at the tail's top level are paired again. The depths of the brackets
+        between them move by the change in the number of open brackets below.
+        """
+        kinds, links, depths = self.kinds, self.links, self.depths
+        count = len(kinds)
+        index = segment = tail
+        visited = 0
+        while index < count:
+            visited += 1
+            link = links[index]
+            if not kinds[index] & 1:
+                if not link:
+                    break  # An open bracket no later one closes hides everything after it
+                index += link + 1
+                continue
+            self._shift_depths(segment, index, len(stack) - old_open)
+            old_open = depths[index]  # The old number of open brackets after this one
+            if stack and kinds[stack[-1]] == kinds[index] - 1:
+                opening = stack.pop()
+                links[index] = opening - index
+                links[opening] = index - opening
+            else:
+                links[index] = 0
+            depths[index] = len(stack)
+            index = segment = index + 1
+        self._shift_depths(segment, count, len(stack) - old_open)
+        self.stats["paired_brackets"] += visited
+
+    def _shift_depths(self, start: int, stop: int, delta: int):
+        if delta and start < stop:
+            self.depths[start:stop] = array("q", map(delta.__add__, self.depths[start:stop]))
+
+    def partner(self, number: int) -> int:
+        """The number of the bracket paired with bracket `number`, or -1 if it is unmatched."""
+        link = self.links[number]
+        return number + link if link else -1
+
+    def _stack_at(self, number: int) -> list:
+        """The numbers of the open brackets before bracket `number`, outermost first."""
+        kinds, links = self.kinds, self.links
+        if number < len(kinds):
+            remaining = self.depths[number] + (kinds[number] & 1 and links[number] != 0)
+        elif kinds:
+            remaining = self.depths[-1] + (not kinds[-1] & 1)
+        else:
+            remaining = 0
+        stack = []
+        index = number - 1
+        while remaining:
+            if not kinds[index] & 1:
+                stack.append(index)
+                remaining -= 1
+                index -= 1
+            else:  # Skip a closed pair, or an unmatched closing bracket
+                index += links[index] - 1
+        stack.reverse()
+        return stack
+
+    def apply_edit(self, start: int, end: int, new_text: str):
+        """Replaces text[start:end] with new_text and updates the index around the edit."""
+        old_text = self._text
+        text = old_text[:start] + new_text + old_text[end:]
+        delta = len(new_text) - (end - start)
+
+        # Restart before any span or multi-character begin delimiter the edit may change
+        restart = max(0, start - self._max_begin + 1)
+        index = self.span_ends.bisect_left(restart)
+        if index < len(self.span_starts) and self.span_starts[index] < restart:
+            restart = self.span_starts[index]
+        positions, kinds, (starts, ends, span_kinds), stop = self._lex(
+            text, restart, resync=start + len(new_text), delta=delta)
+        old_stop = stop - delta
+
+        first = self.span_starts.bisect_left(restart)
+        after = self.span_starts.bisect_left(old_stop)
+        self.span_starts.splice(first, after, starts, delta)
+        self.span_ends.splice(first, after, ends, delta)
+        self.span_kinds[first:after] = span_kinds
+
+        # Bracket numbers [first, after) are replaced by the window's
+        first = self.positions.bisect_left(restart)
+        after = self.positions.bisect_left(old_stop)
+        stack = self._stack_at(first)
+        old_stack = self._stack_at(after)
+        # The brackets after the window pair against old_stack by kind alone
+        old_open = [(self.kinds[opening], self.partner(opening)) for opening in old_stack]
+        shift = len(kinds) - (after - first)
+        self.positions.splice(first, after, positions, delta)
+        self.kinds[first:after] = kinds
+        self.links[first:after] = array("q", bytes(8 * len(kinds)))
+        self.depths[first:after] = array("q", bytes(8 * len(kinds)))
+        for opening in stack:
+            self.links[opening] = 0
+        stack = self._pair(first, stack, first + len(kinds))
+        if [self.kinds[opening] for opening in stack] == [code for code, _ in old_open]:
+            # The brackets after the window pair as before, each closing one with the
+            # open bracket at the same stack level, which may now be another one
+            for opening, (_, closing) in zip(stack, old_open):
+                if closing >= 0:
+                    closing += shift
+                    self.links[opening] = closing - opening
+                    self.links[closing] = opening - closing
+        else:
+            self._repair_tail(first + len(kinds), stack, len(old_open))
+
+        line = self.line_starts.bisect_right(start)
+        line_end = self.line_starts.bisect_right(end)
+        added = [start + match.end() for match in re.finditer("\n", new_text)]
+        self.line_starts.splice(line, line_end, added, delta)
+        self._text = text
+
+    def bracket_at(self, offset: int):
+        """Returns the number of the bracket at an offset, or None."""
+        index = self.positions.bisect_left(offset)
+        return index if index < len(self.positions) and self.positions[index] == offset else None
+
+    def matching_bracket(self, offset: int):
+        """Returns the offset of the bracket matching the one at offset, or None."""
+        index = self.bracket_at(offset)
+        if index is None or not self.links[index]:
+            return None
+        return self.positions[index + self.links[index]]
+
+    def enclosing_pair(self, offset: int):
+        """Returns the offsets (open, close) of the innermost bracket pair around offset, or None."""
+        for opening in reversed(self._stack_at(self.positions.bisect_left(offset))):
+            if self.links[opening]:
+                return self.positions[opening], self.positions[opening + self.links[opening]]
+        return None
+
+    def line_of(self, offset: int) -> int:
+        """The 0-based line of an offset."""
+        return self.line_starts.bisect_right(offset) - 1
+
+    def pairs(self):
+        """Yields the offsets (open, close) of every matched pair, by open bracket."""
+        positions = self.positions
+        for index, link in enumerate(self.links):
+            if link > 0:
+                yield positions[index], positions[index + link]
+
+    def folding_ranges(self) -> list:
+        """
+        Returns the folding ranges, ordered by start line.
+
+        A pair of fold_brackets spanning lines folds up to the line before its closing
+        bracket; a comment spanning lines folds up to its last line.
+        """
+        ranges = []
+        line_of, positions, links = self.line_of, self.positions, self.links
+        opening = re.compile(b"[" + re.escape(self.fold_codes) + b"]")
+        for match in opening.finditer(self.kinds.tobytes()):
+            index = match.start()
+            if links[index]:
+                start_line, end_line = line_of(positions[index]), line_of(positions[index + links[index]]) - 1
+                if end_line > start_line:
+                    ranges.append(FoldingRange(start_line, end_line, "region"))
+        comment = SPAN_KINDS.index("comment")
+        for start, end, kind in zip(self.span_starts, self.span_ends, self.span_kinds):
+            if kind == comment:
+                start_line, end_line = line_of(start), line_of(end - 1)
+                if end_line > start_line:
+                    ranges.append(FoldingRange(start_line, end_line, "comment"))
+        ranges.sort()
+        return ranges
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from .xshd_parser import load_xshd
+
+    parser = argparse.ArgumentParser(description="Index the brackets and folding ranges of a source file.")
+    parser.add_argument("xshd", help="Path to the .xshd definition of the language")
+    parser.add_argument("source", help="Path to the source file")
+    parser.add_argument("--repeat", type=int, default=1, help="Index the source repeated this many times")
+    args = parser.parse_args()
+
+    with open(args.source, encoding="utf-8-sig") as f:
+        source = f.read() * args.repeat
+    started = time.perf_counter()
+    bracket_index = BracketIndex(load_xshd(args.xshd), source)
+    elapsed = time.perf_counter() - started
+    unmatched = bracket_index.links.count(0)
+    print(f"{len(source) / 1e6:.1f} MB: {len(bracket_index)} brackets ({unmatched} unmatched), "
+          f"{len(bracket_index.span_starts)} spans, {len(bracket_index.folding_ranges())} folding ranges "
+          f"in {elapsed * 1000:.1f} ms")
+    middle = len(source) // 2
+    started = time.perf_counter()
+    for offset in range(middle, middle + 100):
+        bracket_index.apply_edit(offset, offset, "x" if offset % 10 else "(")
+    print(f"typing 100 characters: {(time.perf_counter() - started) * 10:.2f} ms per edit")
@@ -0,0 +1,326 @@
+import re
+import time
+
+from .errors import GrammarBudgetError
+from .textmate_generator import KeywordPattern
+from .textmate_tokenizer import _translate_regex
+
+# Complexity metrics for generated TextMate grammars, and budgets that fail a
+# conversion when a grammar grows past them.
+#
+# Rules are located by JSON pointer into the grammar ("/repository/keywords/patterns/0"),
+# like the rule keys of textmate_tokenizer.Grammar. The include graph has one node per
+# repository entry plus "$self" for the grammar's top-level patterns; "#self", "$self",
+# "$base" and the grammar's own scopeName all lead back to "$self". Compile times are
+# measured with Python's `re`, the engine of textmate_tokenizer.py, so they are an
+# estimate of what an editor's Oniguruma pays rather than the same number.
+
+REGEX_KEYS = ("match", "begin", "end", "while")
+CAPTURE_KEYS = ("captures", "beginCaptures", "endCaptures", "whileCaptures")
+
+# Metrics a budget can limit; each budget is a maximum
+BUDGET_METRICS = ("rules", "repository", "includes", "total_regex_length", "largest_regex_length",
+                  "max_keyword_alternatives", "include_depth", "include_cycles", "compile_ms")
+
+# The generator's keyword rules: \b(longest|...|shortest)\b, optionally (?i)
+_KEYWORD_RULE = re.compile(r"^(?:\(\?i\))?\\b\((.*)\)\\b$", re.S)
+
+
+def _pointer_token(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _rules(rule: dict, pointer: str):
+    """Yields (pointer, rule) for a rule and every rule nested in its patterns and captures."""
+    yield pointer, rule
+    for index, child in enumerate(rule.get("patterns") or ()):
+        yield from _rules(child, f"{pointer}/patterns/{index}")
+    for key in CAPTURE_KEYS:
+        for group, capture in (rule.get(key) or {}).items():
+            yield from _rules(capture, f"{pointer}/{key}/{_pointer_token(group)}")
+
+
+def _regex_length(regex) -> int:
+    if isinstance(regex, KeywordPattern):
+        return sum(len(chunk) for chunk in regex.chunks())
+    return len(regex)
+
+
+def _top_level_alternatives(body: str) -> int:
+    """Counts the alternatives of a regex outside of groups and character classes."""
+    count, depth, index, in_class = 1, 0, 0, False
+    while index < len(body):
+        char = body[index]
+        if char == "\\":
+            index += 1
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+            if body.startswith("]", index + 1):  # A leading ] is a literal
+                index += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            count += 1
+        index += 1
+    return count
+
+
+def keyword_alternatives(regex):
+    """Returns the number of keywords of a keyword rule's match regex, or None for other regexes."""
+    if isinstance(regex, KeywordPattern):
+        return len(regex.keywords)
+    m = _KEYWORD_RULE.match(regex)
+    return _top_level_alternatives(m.group(1)) if m else None
+
+
+def _compile_ms(regex) -> float:
+    start = time.perf_counter()
+    try:
+        re.compile(_translate_regex(str(regex)))
+    except re.error:
+        pass  # The tokenizer disables such rules; the time spent finding out still counts
+    return (time.perf_counter() - start) * 1000
+
+
+def _include_target(include: str, scope_name: str, repository: dict):
+    """Returns (node, kind) for an include: kind is "local", "external" or "unresolved"."""
+    if include in ("$self", "#self", "$base") or include == scope_name:
+        return "$self", "local"
+    if include.startswith("#"):
+        return (include, "local") if include[1:] in repository else (include, "unresolved")
+    return include, "external"
+
+
+def _include_graph(grammar: dict):
+    """Returns ({node: [local include targets]}, external includes, unresolved includes)."""
+    scope_name = grammar.get("scopeName")
+    repository = grammar.get("repository") or {}
+    roots = {"$self": [(f"/patterns/{index}", rule) for index, rule in enumerate(grammar.get("patterns") or ())]}
+    for name, entry in repository.items():
+        roots[f"#{name}"] = [(f"/repository/{_pointer_token(name)}", entry)]
+    graph, external, unresolved = {}, [], []
+    for node, tops in roots.items():
+        targets = graph[node] = []
+        for top_pointer, top in tops:
+            for pointer, rule in _rules(top, top_pointer):
+                if "include" not in rule:
+                    continue
+                target, kind = _include_target(rule["include"], scope_name, repository)
+                if kind == "local":
+                    if target not in targets:
+                        targets.append(target)
+                else:
+                    (external if kind == "external" else unresolved).append({"pointer": pointer, "include": target})
+    return graph, external, unresolved
+
+
+def _include_depth(graph: dict):
+    """
+    Returns (depth, cycles): the longest chain of includes from "$self" that does not
+    revisit a rule, and the include cycles reachable from "$self".
+
+    Edges that close a cycle are found by a depth-first search and then left out, so
+    the depth is the longest path of the remaining acyclic graph.
+    """
+    cycles, back_edges, stack, on_stack, visited = [], set(), [], set(), set()
+
+    def visit(node):
+        visited.add(node)
+        stack.append(node)
+        on_stack.add(node)
+        for target in graph.get(node, ()):
+            if target in on_stack:
+                back_edges.add((node, target))
+                cycles.append(stack[stack.index(target):] + [target])
+            elif target not in visited:
+                visit(target)
+        stack.pop()
+        on_stack.discard(node)
+
+    visit("$self")
+    longest = {}
+
+    def depth(node):
+        if node not in longest:
+            longest[node] = max((1 + depth(target) for target in graph.get(node, ())
+                                 if (node, target) not in back_edges), default=0)
+        return longest[node]
+
+    return depth("$self"), cycles
+
+
+def measure_grammar(grammar: dict, compile_regexes: bool = True) -> dict:
+    """
+    Measures how heavy a TextMate grammar is for an editor to load.
+
+    Args:
+        grammar: A grammar dictionary, as built by build_textmate_grammar() (with or
+            without lazy_keywords).
+        compile_regexes: Time the compilation of every regex. Off, "compile_ms" is None.
+
+    Returns:
+        A dict with "scope_name"; counts of "rules" (excluding includes), "includes"
+        and "repository" entries; "regexes", "total_regex_length",
+        "largest_regex_length" and "largest_regex" (its pointer); "keyword_rules"
+        (pointer, scope name and number of "alternatives" of every keyword rule,
+        largest first) and "max_keyword_alternatives"; "include_depth",
+        "include_cycles" (the number of cycles) and "cycles" (each a list of nodes
+        such as ["$self", "#comments", "$self"]); "external_includes" and
+        "unresolved_includes" (pointer and include); "compile_ms" and
+        "slowest_regex" (pointer and ms).
+    """
+    tops = [(f"/patterns/{index}", rule) for index, rule in enumerate(grammar.get("patterns") or ())]
+    tops += [(f"/repository/{_pointer_token(name)}", entry) for name, entry in (grammar.get("repository") or {}).items()]
+    rules = includes = regexes = total_length = largest_length = 0
+    largest, keyword_rules = None, []
+    compile_ms, slowest = (0.0 if compile_regexes else None), None
+    if compile_regexes:
+        re.purge()  # Patterns compiled earlier must not be timed as cache hits
+    for top_pointer, top in tops:
+        for pointer, rule in _rules(top, top_pointer):
+            if "include" in rule:
+                includes += 1
+                continue
+            rules += 1
+            for key in REGEX_KEYS:
+                regex = rule.get(key)
+                if regex is None:
+                    continue
+                regexes += 1
+                length = _regex_length(regex)
+                total_length += length
+                if length > largest_length:
+                    largest_length, largest = length, f"{pointer}/{key}"
+                if key == "match":
+                    alternatives = keyword_alternatives(regex)
+                    if alternatives is not None:
+                        keyword_rules.append({"pointer": pointer, "name": rule.get("name"),
+                                              "alternatives": alternatives})
+                if compile_regexes:
+                    ms = _compile_ms(regex)
+                    compile_ms += ms
+                    if slowest is None or ms > slowest["ms"]:
+                        slowest = {"pointer": f"{pointer}/{key}", "ms": ms}
+    keyword_rules.sort(key=lambda entry: -entry["alternatives"])
+    graph, external, unresolved = _include_graph(grammar)
+    include_depth, cycles = _include_depth(graph)
+    return {
+        "scope_name": grammar.get("scopeName"),
+        "rules": rules,
+        "includes": includes,
+        "repository": len(grammar.get("repository") or {}),
+        "regexes": regexes,
+        "total_regex_length": total_length,
+        "largest_regex_length": largest_length,
+        "largest_regex": largest,
+        "keyword_rules": keyword_rules,
+        "max_keyword_alternatives": keyword_rules[0]["alternatives"] if keyword_rules else 0,
+        "include_depth": include_depth,
+        "include_cycles": len(cycles),
+        "cycles": cycles,
+        "external_includes": external,
+        "unresolved_includes": unresolved,
+        "compile_ms": compile_ms,
+        "slowest_regex": slowest,
+    }
+
+
+def parse_budget(spec: str):
+    """Parses a "metric=maximum" budget, as given on the command line."""
+    metric, separator, limit = spec.partition("=")
+    metric = metric.strip().replace("-", "_")
+    if not separator or metric not in BUDGET_METRICS:
+        raise ValueError(f"expected METRIC=MAX with METRIC one of {', '.join(BUDGET_METRICS)}: {spec!r}")
+    try:
+        return metric, float(limit) if metric == "compile_ms" else int(limit)
+    except ValueError:
+        raise ValueError(f"budget {metric} needs a number: {spec!r}") from None
+
+
+def check_budget(metrics: dict, budget: dict) -> list:
+    """
+    Returns the budget violations of a measure_grammar() result, as dicts with
+    "metric", "value" and "limit". Budgets on metrics that were not measured
+    (compile_ms without compile_regexes) are skipped.
+
+    Raises:
+        ValueError: If the budget names an unknown metric.
+    """
+    violations = []
+    for metric, limit in budget.items():
+        if metric not in BUDGET_METRICS:
+            raise ValueError(f"Unknown budget metric {metric!r}; expected one of {', '.join(BUDGET_METRICS)}")
+        value = metrics.get(metric)
+        if limit is not None and value is not None and value > limit:
+            violations.append({"metric": metric, "value": value, "limit": limit})
+    return violations
+
+
+def enforce_budget(metrics: dict, budget: dict):
+    """
+    Raises:
+        GrammarBudgetError: If the grammar measured exceeds any of the budgets.
+    """
+    violations = check_budget(metrics, budget)
+    if violations:
+        details = "; ".join(f"{v['metric']} {_number(v['value'])} > {_number(v['limit'])}" for v in violations)
+        raise GrammarBudgetError(f"Grammar {metrics['scope_name']} exceeds its complexity budget: {details}",
+                                 metrics["scope_name"], violations)
+
+
+def _number(value) -> str:
+    return f"{value:,.4g}" if isinstance(value, float) else f"{value:,}"
+
+
+def format_metrics(metrics: dict, keyword_rules: int = 5) -> str:
+    """Formats a measure_grammar() result for the terminal, listing the largest keyword rules."""
+    out = [f"{metrics['scope_name']}: {metrics['rules']} rules, {metrics['repository']} repository entries, "
+           f"{metrics['includes']} includes"]
+    out.append(f"  regexes: {metrics['regexes']}, {_number(metrics['total_regex_length'])} chars, "
+               f"largest {_number(metrics['largest_regex_length'])} at {metrics['largest_regex']}")
+    for entry in metrics["keyword_rules"][:keyword_rules]:
+        out.append(f"  keyword rule {entry['name']} at {entry['pointer']}: {_number(entry['alternatives'])} alternatives")
+    if len(metrics["keyword_rules"]) > keyword_rules:
+        out.append(f"  ... {len(metrics['keyword_rules']) - keyword_rules} more keyword rules")
+    cycles = ", ".join(" -> ".join(cycle) for cycle in metrics["cycles"]) or "none"
+    out.append(f"  include depth: {metrics['include_depth']}; cycles: {cycles}")
+    for entry in metrics["unresolved_includes"]:
+        out.append(f"  unresolved include {entry['include']} at {entry['pointer']}")
+    if metrics["compile_ms"] is not None:
+        slowest = metrics["slowest_regex"]
+        out.append(f"  estimated compile time: {metrics['compile_ms']:.1f} ms"
+                   + (f" (slowest {slowest['ms']:.1f} ms at {slowest['pointer']})" if slowest else ""))
+    return "\n".join(out)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Report the complexity of TextMate grammars.")
+    parser.add_argument("grammars", nargs="+", help="Paths to .tmLanguage.json grammars")
+    parser.add_argument("--budget", action="append", default=[], metavar="METRIC=MAX",
+                        help=f"Fail if a grammar exceeds MAX (repeatable); metrics: {', '.join(BUDGET_METRICS)}")
+    parser.add_argument("--no-compile", action="store_true", help="Skip timing regex compilation")
+    parser.add_argument("--json", action="store_true", help="Print the metrics as JSON")
+    args = parser.parse_args()
+
+    try:
+        budgets = dict(parse_budget(spec) for spec in args.budget)
+    except ValueError as e:
+        parser.error(str(e))
+    failed = False
+    for path in args.grammars:
+        with open(path, "r", encoding="utf-8") as f:
+            measured = measure_grammar(json.load(f), compile_regexes=not args.no_compile)
+        print(json.dumps(measured, indent=2) if args.json else format_metrics(measured))
+        for violation in check_budget(measured, budgets):
+            failed = True
+            print(f"BUDGET {path}: {violation['metric']} {_number(violation['value'])} "
+                  f"> {_number(violation['limit'])}")
+    sys.exit(1 if failed else 0)
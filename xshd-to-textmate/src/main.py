@@ -1,4 +1,5 @@
 import argparse
+import json
 import sys
 import os
 
@@ -8,8 +9,10 @@ import os
 
 # These relative imports are standard for execution as part of a package
 # e.g., when running `python -m xshd_to_textmate.src.main ...`
-from .xshd_parser import parse_xshd
-from .textmate_generator import generate_textmate_grammar
+from .errors import ConverterError
+from .grammar_metrics import BUDGET_METRICS, enforce_budget, format_metrics, measure_grammar, parse_budget
+from .xshd_loader import DefinitionLoader
+from .textmate_generator import build_textmate_grammar, write_textmate_grammar, write_textmate_grammar_stream
 
 
 def main_cli():
@@ -17,38 +20,128 @@ def main_cli():
     Command-line interface for the XSHD to TextMate converter.
     """
     parser = argparse.ArgumentParser(description="Convert .xshd syntax highlighting files to TextMate .JSON-tmLanguage grammar.")
-    parser.add_argument("input_file", help="Path to the input .xshd file.")
-    parser.add_argument("output_file", help="Path for the generated TextMate grammar JSON file (e.g., mylang.tmLanguage.json).")
+    parser.add_argument(
+        "paths", nargs="+", metavar="PATH",
+        help="The input .xshd file and the path for the generated TextMate grammar JSON file "
+             "(e.g., mylang.tmLanguage.json), or with --output-dir one or more input .xshd files."
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Convert every input file, writing <name>.tmLanguage.json files into this directory. "
+             "Definitions referenced by several inputs are parsed once."
+    )
+    parser.add_argument(
+        "-I", "--include-path",
+        action="append", default=[],
+        help="Directory searched for definitions referenced as rule=\"Definition/RuleSet\" "
+             "(after the referencing file's directory). Can be given several times."
+    )
     parser.add_argument(
         "-v", "--verbose", 
         action="store_true", 
         help="Enable verbose output."
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write keyword patterns straight to the output instead of building them in memory "
+             "(for definitions with very large keyword lists). The output is identical."
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Print a complexity report for each generated grammar: rule and repository counts, regex "
+             "sizes, keyword alternations, include depth and cycles, and an estimated regex compile time."
+    )
+    parser.add_argument(
+        "--report-json",
+        help="Write the complexity reports of all generated grammars to this JSON file."
+    )
+    parser.add_argument(
+        "--budget",
+        action="append", default=[], metavar="METRIC=MAX",
+        help=f"Fail the conversion, without writing the grammar, if METRIC exceeds MAX. Can be given several "
+             f"times. Metrics: {', '.join(BUDGET_METRICS)}."
+    )
+    parser.add_argument(
+        "--budget-file",
+        help="JSON object of METRIC: MAX budgets; --budget options override its entries."
+    )
 
     args = parser.parse_args()
 
+    args.budgets = {}
+    try:
+        if args.budget_file:
+            with open(args.budget_file, "r", encoding="utf-8") as f:
+                args.budgets.update(parse_budget(f"{metric}={limit}") for metric, limit in json.load(f).items())
+        args.budgets.update(parse_budget(spec) for spec in args.budget)
+    except (OSError, ValueError, AttributeError) as e:
+        parser.error(f"invalid budget: {e}")
+
+    if args.output_dir:
+        jobs = [(path, os.path.join(args.output_dir, os.path.splitext(os.path.basename(path))[0] + ".tmLanguage.json"))
+                for path in args.paths]
+        os.makedirs(args.output_dir, exist_ok=True)
+    elif len(args.paths) == 2:
+        jobs = [tuple(args.paths)]
+    else:
+        parser.error("expected an input file and an output file, or --output-dir")
+
+    # One loader for the whole run: shared base definitions are parsed once
+    loader = DefinitionLoader(args.include_path)
+    reports = []
+    try:
+        for input_file, output_file in jobs:
+            _convert(loader, input_file, output_file, args, reports)
+    finally:
+        # Also written when a budget stops the run, so the build can show what grew
+        if args.report_json:
+            with open(args.report_json, "w", encoding="utf-8") as f:
+                json.dump(reports, f, indent=2)
+    if args.verbose and len(jobs) > 1:
+        print(f"Converted {len(jobs)} definitions ({loader.stats['parsed']} files parsed).")
+
+
+def _check_complexity(grammars: list, output_file: str, args, reports: list):
+    """Measures generated grammars for --report/--report-json and enforces the budgets."""
+    if not (args.report or args.report_json or args.budgets):
+        return
+    # Compiling every regex costs about as much as an editor loading the grammar; skip it when unused
+    timed = bool(args.report or args.report_json or "compile_ms" in args.budgets)
+    for grammar in grammars:
+        metrics = measure_grammar(grammar, compile_regexes=timed)
+        reports.append(dict(metrics, output=output_file))
+        if args.report:
+            print(format_metrics(metrics))
+        enforce_budget(metrics, args.budgets)
+
+
+def _convert(loader: DefinitionLoader, input_file: str, output_file: str, args, reports: list):
+    """Converts one definition with the options of main_cli(); complexity reports are appended to reports."""
     if args.verbose:
         print(f"Starting conversion...")
-        print(f"Input XSHD file: {args.input_file}")
-        print(f"Output TextMate file: {args.output_file}")
+        print(f"Input XSHD file: {input_file}")
+        print(f"Output TextMate file: {output_file}")
 
     # Validate input file existence
-    if not os.path.exists(args.input_file):
-        print(f"Error: Input file not found: {args.input_file}")
+    if not os.path.exists(input_file):
+        print(f"Error: Input file not found: {input_file}")
         sys.exit(1)
     
     # Validate output file extension (optional, but good practice)
-    if not args.output_file.endswith((".JSON-tmLanguage", ".tmLanguage.json", ".tmLanguage")):
-        print(f"Warning: Output file '{args.output_file}' does not have a standard TextMate grammar extension (e.g., .tmLanguage.json).")
+    if not output_file.endswith((".JSON-tmLanguage", ".tmLanguage.json", ".tmLanguage")):
+        print(f"Warning: Output file '{output_file}' does not have a standard TextMate grammar extension (e.g., .tmLanguage.json).")
 
 
     if args.verbose:
         print("Parsing XSHD file...")
     
-    xshd_data = parse_xshd(args.input_file)
-
-    if not xshd_data:
-        print(f"Failed to parse XSHD file: {args.input_file}")
+    try:
+        xshd_data = loader.load(input_file)
+    except ConverterError as e:
+        print(f"Error: {e}")
+        print(f"Failed to parse XSHD file: {input_file}")
         sys.exit(1)
 
     if args.verbose:
@@ -59,15 +152,22 @@ def main_cli():
     if args.verbose:
         print("Generating TextMate grammar...")
 
-    generate_textmate_grammar(xshd_data, args.output_file)
-    # generate_textmate_grammar already prints success/error, so no need to duplicate unless we want more CLI-specific messages.
-    # We can assume if it returns without error, it was successful.
-    # The generate_textmate_grammar function has its own print statements for success or failure.
+    try:
+        if args.stream:
+            # Measured on a lazily built copy: keyword patterns are materialized one at a time
+            _check_complexity([build_textmate_grammar(xshd_data, lazy_keywords=True)], output_file, args, reports)
+            write_textmate_grammar_stream(xshd_data, output_file)
+        else:
+            grammar = build_textmate_grammar(xshd_data)
+            _check_complexity([grammar], output_file, args, reports)
+            write_textmate_grammar(grammar, output_file)
+    except ConverterError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"TextMate grammar successfully generated at {output_file}")
 
     if args.verbose:
         print("Conversion process completed.")
-    # A final success message from the CLI itself might be good.
-    # print(f"TextMate grammar generated successfully at {args.output_file}") -> This is already in generate_textmate_grammar
 
 if __name__ == "__main__":
     main_cli()
@@ -0,0 +1,319 @@
+import asyncio
+import codecs
+import os
+import re
+import time
+
+from .verify import parse_verdict
+
+# Streaming parser for PAT result files (<model>.patout).
+#
+# PAT writes one block per assertion:
+#
+#   *******************************************************
+#   Assertion: P() deadlockfree
+#   ********Verification Result********
+#   The Assertion (P() deadlockfree) is VALID.
+#   <counterexample or witness trace>
+#   ********Verification Setting********
+#   Search Engine: Breadth First Search
+#   ********Verification Statistics********
+#   Visited States:1234
+#   Total Transitions:5678
+#   Time Used:0.0123s
+#   Estimated Memory Used:8536.32KB
+#
+# The parser consumes the file in arbitrary chunks and keeps only the current partial
+# line and the fields of the current block, so memory stays bounded however long the
+# output or its traces get. Events are plain dicts with a "type" key:
+#
+#   {"type": "assertion", "index", "assertion"}             an assertion block started
+#   {"type": "verdict", "index", "assertion", "verdict", "probability"}
+#   {"type": "result", "index", "assertion", "verdict", "probability", "visited_states",
+#    "total_transitions", "time_seconds", "memory_kb", "trace_lines", "settings"}
+#   {"type": "reset"}                                       the file was rewritten
+
+DEFAULT_MAX_LINE_LENGTH = 64 * 1024
+
+_ASSERTION = re.compile(r"^\s*Assertion\s*:\s*(.*?)\s*$")
+_SECTION = re.compile(r"^\*+\s*(.*?)\s*\*+$")
+_FIELD = re.compile(r"^\s*([A-Za-z][A-Za-z ]*?)\s*:\s*(.*?)\s*$")
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+# Statistics fields and the result keys they are stored under
+_STATISTICS = {
+    "visited states": "visited_states",
+    "total transitions": "total_transitions",
+    "time used": "time_seconds",
+    "estimated memory used": "memory_kb",
+}
+
+
+def _number(value: str):
+    match = _NUMBER.search(value)
+    if not match:
+        return None
+    number = float(match.group())
+    return int(number) if number.is_integer() and "." not in match.group() else number
+
+
+class PatoutParser:
+    """
+    Incremental .patout parser.
+
+    Feed text chunks of any size with feed(); each call returns the events completed
+    by that chunk. Call close() at the end of the output to flush the last block.
+
+    Args:
+        max_line_length: Characters kept of a single line. Longer lines (typically
+            traces) are truncated, so a runaway line cannot grow memory.
+    """
+
+    def __init__(self, max_line_length: int = DEFAULT_MAX_LINE_LENGTH):
+        self.max_line_length = max_line_length
+        self.reset()
+
+    def reset(self):
+        """Forgets all state, e.g. after the file was truncated."""
+        self._partial = []
+        self._partial_length = 0
+        self._count = 0
+        self._current = None
+        self._section = None
+
+    def feed(self, text: str) -> list:
+        events = []
+        start = 0
+        while True:
+            newline = text.find("\n", start)
+            if newline < 0:
+                self._append_partial(text[start:])
+                return events
+            self._append_partial(text[start:newline])
+            line = "".join(self._partial)
+            self._partial = []
+            self._partial_length = 0
+            self._parse_line(line.rstrip("\r"), events)
+            start = newline + 1
+
+    def close(self) -> list:
+        """Parses any unterminated last line and flushes the current block."""
+        events = []
+        if self._partial:
+            line = "".join(self._partial)
+            self._partial = []
+            self._partial_length = 0
+            self._parse_line(line.rstrip("\r"), events)
+        self._finish(events)
+        return events
+
+    def _append_partial(self, piece: str):
+        room = self.max_line_length - self._partial_length
+        if room <= 0 or not piece:
+            return
+        piece = piece[:room]
+        self._partial.append(piece)
+        self._partial_length += len(piece)
+
+    def _finish(self, events):
+        if self._current is not None:
+            events.append(dict(type="result", **self._current))
+            self._current = None
+        self._section = None
+
+    def _parse_line(self, line: str, events: list):
+        match = _ASSERTION.match(line)
+        if match:
+            self._finish(events)
+            self._current = {
+                "index": self._count, "assertion": match.group(1), "verdict": None, "probability": None,
+                "visited_states": None, "total_transitions": None, "time_seconds": None, "memory_kb": None,
+                "trace_lines": 0, "settings": {},
+            }
+            self._count += 1
+            events.append({"type": "assertion", "index": self._current["index"], "assertion": match.group(1)})
+            return
+
+        current = self._current
+        if current is None:
+            return
+        match = _SECTION.match(line)
+        if match:
+            self._section = match.group(1).lower() or None
+            return
+        if not line.strip():
+            return
+
+        if self._section == "verification result":
+            if current["verdict"] is None:
+                verdict, probability = parse_verdict(line)
+                if verdict is not None:
+                    current["verdict"] = verdict
+                    current["probability"] = probability
+                    events.append({"type": "verdict", "index": current["index"], "assertion": current["assertion"],
+                                   "verdict": verdict, "probability": probability})
+                    return
+            current["trace_lines"] += 1
+            return
+
+        match = _FIELD.match(line)
+        if not match:
+            return
+        name, value = match.group(1).lower(), match.group(2)
+        if self._section == "verification setting":
+            current["settings"][match.group(1)] = value
+        elif self._section == "verification statistics" and name in _STATISTICS:
+            current[_STATISTICS[name]] = _number(value)
+            if name == "estimated memory used":
+                # The last line PAT writes for a block: report it without waiting for the next one
+                self._finish(events)
+
+
+def parse_patout(path: str, chunk_size: int = 64 * 1024) -> list:
+    """Parses a complete .patout file and returns its "result" events."""
+    parser = PatoutParser()
+    results = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            results.extend(event for event in parser.feed(chunk) if event["type"] == "result")
+    results.extend(event for event in parser.close() if event["type"] == "result")
+    return results
+
+
+class _Tail:
+    """Reads what was appended to a file since the last poll, starting over when it is rewritten."""
+
+    # Bytes before the read position that are compared to detect a rewrite
+    FINGERPRINT_SIZE = 256
+
+    def __init__(self, path: str, chunk_size: int, max_line_length: int):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.parser = PatoutParser(max_line_length)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.position = 0
+        self.signature = None  # (device, inode, mtime_ns, size) when the file was last read
+        self.fingerprint = b""  # The last bytes read, up to FINGERPRINT_SIZE of them
+
+    def _rewritten(self, stat, f) -> bool:
+        """Whether the file was replaced or rewritten since the last read, rather than appended to."""
+        if (stat.st_dev, stat.st_ino) != self.signature[:2] or stat.st_size < self.position:
+            return True
+        # A new run's output may already be as long as what was read of the previous one
+        f.seek(self.position - len(self.fingerprint))
+        return f.read(len(self.fingerprint)) != self.fingerprint
+
+    def poll(self) -> list:
+        """Returns the events for newly appended data; an empty list if nothing changed."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            stat = os.fstat(f.fileno())
+            signature = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if signature == self.signature:
+                return []
+            events = []
+            if self.signature is not None and self._rewritten(stat, f):
+                self.position = 0
+                self.fingerprint = b""
+                self.parser.reset()
+                self.decoder.reset()
+                events.append({"type": "reset"})
+            self.signature = signature
+            f.seek(self.position)
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                self.position += len(data)
+                self.fingerprint = (self.fingerprint + data)[-self.FINGERPRINT_SIZE:]
+                events.extend(self.parser.feed(self.decoder.decode(data)))
+        return events
+
+    def close(self) -> list:
+        events = self.parser.feed(self.decoder.decode(b"", final=True))
+        return events + self.parser.close()
+
+
+def follow_patout(path: str, poll_interval: float = 0.2, idle_timeout: float = None, stop=None,
+                  chunk_size: int = 64 * 1024, max_line_length: int = DEFAULT_MAX_LINE_LENGTH):
+    """
+    Tails a .patout file while it grows and yields events as soon as they are complete.
+
+    The file does not need to exist yet. If it is replaced, shrinks, or its contents up
+    to the position read so far change (PAT rewrites it on every run), it is read again
+    from the start after a {"type": "reset"} event.
+
+    Args:
+        path: The .patout file.
+        poll_interval: Seconds between checks for new data.
+        idle_timeout: Stop after this many seconds without new data (default: never).
+        stop: Optional callable; following ends once it returns True (e.g. when the
+            checker process has exited). Data written before that is still read.
+        chunk_size: Bytes read per read() call.
+        max_line_length: See PatoutParser.
+
+    Yields:
+        Event dicts, see the module comment.
+    """
+    tail = _Tail(path, chunk_size, max_line_length)
+    last_data = time.monotonic()
+    while True:
+        stopping = stop is not None and stop()
+        events = tail.poll()
+        if events:
+            last_data = time.monotonic()
+            yield from events
+        if stopping or (idle_timeout is not None and time.monotonic() - last_data >= idle_timeout):
+            break
+        time.sleep(poll_interval)
+    yield from tail.close()
+
+
+async def afollow_patout(path: str, poll_interval: float = 0.2, idle_timeout: float = None, stop=None,
+                         chunk_size: int = 64 * 1024, max_line_length: int = DEFAULT_MAX_LINE_LENGTH):
+    """Asynchronous version of follow_patout(), for use with `async for`. File reads run in a worker thread."""
+    tail = _Tail(path, chunk_size, max_line_length)
+    loop = asyncio.get_running_loop()
+    last_data = loop.time()
+    while True:
+        stopping = stop is not None and stop()
+        events = await asyncio.to_thread(tail.poll)
+        if events:
+            last_data = loop.time()
+            for event in events:
+                yield event
+        if stopping or (idle_timeout is not None and loop.time() - last_data >= idle_timeout):
+            break
+        await asyncio.sleep(poll_interval)
+    for event in tail.close():
+        yield event
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Follow a PAT .patout file and print verdicts as they appear.")
+    parser.add_argument("patout", help="Path to the .patout file")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="Stop after this many seconds without new output")
+    parser.add_argument("--json", action="store_true", help="Print every event as a JSON line")
+    args = parser.parse_args()
+
+    try:
+        for event in follow_patout(args.patout, idle_timeout=args.idle_timeout):
+            if args.json:
+                print(json.dumps(event), flush=True)
+            elif event["type"] == "verdict":
+                print(f"[{event['index']}] {event['verdict'].upper():<8} {event['assertion']}", flush=True)
+            elif event["type"] == "result":
+                print(f"    {event['visited_states']} states, {event['total_transitions']} transitions, "
+                      f"{event['time_seconds']} s", flush=True)
+    except KeyboardInterrupt:
+        pass
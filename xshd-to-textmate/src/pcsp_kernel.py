@@ -0,0 +1,391 @@
+import asyncio
+import hashlib
+import json
+import os
+import shlex
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .span_scanner import SpanScanner
+from .symbol_index import SourceLexicon, extract_symbols
+from .textmate_generator import build_textmate_grammar
+from .textmate_tokenizer import load_grammar, split_lines
+from .verify import (DEFAULT_CHECKER, checker_arguments, derive_model, find_assertions, merge_results,
+                     resolve_includes, run_checker)
+
+# Warm execution of PCSP notebook cells.
+#
+# A PcspSession is created once per kernel and keeps everything a check needs resident:
+# the lexicon and compiled grammar built from the XSHD definition, a process pool whose
+# workers stay alive between cells, the contents of #include'd models (re-read only when
+# their mtime or size changes) and a cache of reports keyed by the checked model.
+#
+# Cells without assertions are definition cells; they form the prelude of every later
+# cell, in execution order. A re-run cell replaces its earlier version: cells are
+# identified by their notebook cell id, or by their content when there is none, and a
+# definition cell also replaces earlier ones declaring any of the same symbols, so no
+# process is declared twice. "%reset" clears them. A cell with assertions is checked as
+# prelude + cell, each assertion in its own checker process. Cells go through an asyncio
+# queue and are checked one at a time, in submission order; a cell identical to a cached
+# or running one waits for that result instead of running the checker again.
+
+DEFAULT_CACHE_SIZE = 256
+
+
+def _sha1(*parts) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _warm_up():
+    """Runs in each pool worker once, so the first cell does not pay for process start-up."""
+    return os.getpid()
+
+
+class PcspSession:
+    """
+    Resident state for checking PCSP cells.
+
+    Args:
+        xshd_data: Parsed XSHD data; provides assertions, comments and keywords.
+        checker: Checker command template, see verify.verify_model().
+        workers: Size of the resident process pool (default: the number of CPUs).
+        timeout: Optional per-assertion timeout in seconds.
+        cache_size: Number of cell reports kept.
+        base_dir: Directory relative #include paths are resolved against (default: cwd).
+        grammar: TextMate grammar (dict, path or Grammar) for completion and inspection;
+            generated from xshd_data if omitted.
+    """
+
+    def __init__(self, xshd_data: dict, checker: str = DEFAULT_CHECKER, workers: int = None,
+                 timeout: float = None, cache_size: int = DEFAULT_CACHE_SIZE, base_dir: str = None,
+                 grammar=None):
+        self.lexicon = SourceLexicon(xshd_data)
+        self.comments = SpanScanner(xshd_data, kinds=("comment",))
+        self.grammar = load_grammar(grammar if grammar is not None else build_textmate_grammar(xshd_data))
+        self.checker = checker
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.base_dir = os.path.abspath(base_dir or os.getcwd())
+        self.definitions = OrderedDict()  # Cell id or content hash -> definition cell
+        self.symbols = {}  # Name -> kind, from the definition cells
+        self._declared = {}  # Cell id or content hash -> [(name, kind)] the definition cell declares
+        self.stats = {"cells": 0, "cache_hits": 0, "checker_runs": 0}
+
+        self._reports = OrderedDict()
+        self._running = {}  # Cache key -> future of a queued or running cell
+        self._includes = {}  # Absolute path -> (mtime_ns, size, text hash, nested includes)
+        self._pool = None
+        self._queue = None
+        self._consumer = None
+        self._work_dir = None
+
+    async def start(self):
+        """Starts the worker pool and the cell queue. Called by run_cell() if needed."""
+        if self._consumer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._work_dir = tempfile.TemporaryDirectory(prefix="pcsp-kernel-")
+        workers = self.workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _warm_up) for _ in range(workers)))
+        self._queue = asyncio.Queue()
+        self._consumer = loop.create_task(self._consume())
+
+    async def close(self):
+        """Stops the queue and the worker pool; queued cells are cancelled."""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+        for future in self._running.values():
+            future.cancel()
+        self._running.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._work_dir is not None:
+            self._work_dir.cleanup()
+            self._work_dir = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def run_cell(self, code: str, cell_id: str = None) -> dict:
+        """
+        Runs one cell.
+
+        Args:
+            code: The cell's source.
+            cell_id: The notebook cell id, if known. A definition cell run again under
+                the same id replaces its earlier version.
+
+        Returns:
+            A dict with "kind":
+            - "reset": the cell was "%reset" and the definitions were cleared;
+            - "definitions": the cell was added to the prelude; "symbols" lists what it declared;
+            - "report": the cell's assertions were checked. The dict is a verify_model()
+              report with lines relative to the cell, plus "cached".
+        """
+        await self.start()
+        self.stats["cells"] += 1
+        if code.strip() == "%reset":
+            self.definitions.clear()
+            self.symbols.clear()
+            self._declared.clear()
+            return {"kind": "reset"}
+
+        if not find_assertions(code, None, self.lexicon):
+            declared, _ = extract_symbols(code, self.lexicon)
+            symbols = [(name, kind) for name, kind, _, _ in declared]
+            self._define(cell_id or _sha1(code), code, symbols)
+            return {"kind": "definitions", "symbols": symbols}
+
+        prelude = "".join(text if text.endswith("\n") else text + "\n" for text in self.definitions.values())
+        model, includes = self._resolve_includes(prelude + code)
+        key = _sha1(self.checker, str(self.timeout), model, *includes)
+
+        report = self._reports.get(key)
+        if report is not None:
+            self._reports.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return dict(report, cached=True)
+        future = self._running.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._running[key] = future
+            await self._queue.put((key, model, prelude.count("\n"), future))
+        else:
+            self.stats["cache_hits"] += 1
+        return dict(await asyncio.shield(future), cached=False)
+
+    def _define(self, key: str, code: str, symbols: list):
+        """Adds a definition cell, replacing the earlier version of the cell and cells declaring the same symbols."""
+        names = {name for name, _ in symbols}
+        for other in [other for other, declared in self._declared.items()
+                      if other != key and names.intersection(name for name, _ in declared)]:
+            del self.definitions[other], self._declared[other]
+        self.definitions[key] = code
+        self._declared[key] = symbols
+        self.symbols = {name: kind for declared in self._declared.values() for name, kind in declared}
+
+    async def _consume(self):
+        while True:
+            key, model, prelude_lines, future = await self._queue.get()
+            try:
+                if not future.done():
+                    report = await self._check(key, model, prelude_lines)
+                    self._reports[key] = report
+                    while len(self._reports) > self.cache_size:
+                        self._reports.popitem(last=False)
+                    future.set_result(report)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._running.pop(key, None)
+                self._queue.task_done()
+
+    async def _check(self, key: str, model: str, prelude_lines: int) -> dict:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        assertions = find_assertions(model, None, self.lexicon)
+        cell_dir = os.path.join(self._work_dir.name, key[:16])
+        os.makedirs(cell_dir, exist_ok=True)
+        jobs = []
+        for assertion in assertions:
+            derived_path = os.path.join(cell_dir, f"cell.assert{assertion.index}.pcsp")
+            output_path = derived_path + ".patout"
+            with open(derived_path, "w", encoding="utf-8") as f:
+                f.write(derive_model(model, assertions, assertion.index))
+            jobs.append(loop.run_in_executor(self._pool, run_checker,
+                                             checker_arguments(self.checker, derived_path, output_path),
+                                             output_path, self.timeout))
+        self.stats["checker_runs"] += len(jobs)
+        results = await asyncio.gather(*jobs)
+
+        entries, summary = merge_results(assertions, results)
+        for entry in entries:
+            entry["line"] -= prelude_lines
+        return {"kind": "report", "model": f"cell {key[:8]}", "wall_seconds": time.perf_counter() - start,
+                "summary": summary, "assertions": entries}
+
+    def _resolve_includes(self, text: str):
+        """
+        Rewrites relative #include paths to absolute ones (the checked models live in a
+        temporary directory) and returns (text, hashes of the included files' contents).
+        """
+        text, paths = resolve_includes(text, self.base_dir, self.comments)
+        return text, [digest for path in paths for digest in self._include_hashes(path, set())]
+
+    def _include_hashes(self, path: str, seen: set) -> list:
+        """Content hashes of an included file and, recursively, of the files it includes."""
+        if path in seen:
+            return []
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [f"{path}:missing"]
+        cached = self._includes.get(path)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+                text = f.read()
+            _, nested = resolve_includes(text, os.path.dirname(path), self.comments)
+            cached = (stat.st_mtime_ns, stat.st_size, f"{path}:{_sha1(text)}", nested)
+            self._includes[path] = cached
+        hashes = [cached[2]]
+        for nested_path in cached[3]:
+            hashes.extend(self._include_hashes(nested_path, seen))
+        return hashes
+
+    def complete(self, code: str, cursor_pos: int):
+        """Returns (start, matches): keywords and defined symbols starting with the word before the cursor."""
+        start = cursor_pos
+        while start > 0 and (code[start - 1].isalnum() or code[start - 1] == "_"):
+            start -= 1
+        prefix = code[start:cursor_pos]
+        declared, _ = extract_symbols(code, self.lexicon)
+        names = set(self.symbols) | self.lexicon.keywords | {name for name, _, _, _ in declared}
+        return start, sorted(name for name in names if name.startswith(prefix) and name != prefix)
+
+    def scopes_at(self, code: str, cursor_pos: int) -> list:
+        """Returns the TextMate scopes of the token at the cursor."""
+        state = ()
+        offset = 0
+        for line in split_lines(code):
+            tokens, state = self.grammar.tokenize_line(line, state)
+            if cursor_pos <= offset + len(line):
+                column = cursor_pos - offset
+                for start, end, scopes in tokens:
+                    if start <= column < end or (column == end == len(line) and end > start):
+                        return list(scopes)
+                return []
+            offset += len(line) + 1
+        return []
+
+
+def format_cell_result(result: dict) -> str:
+    """Formats a run_cell() result as text."""
+    if result["kind"] == "reset":
+        return "Definitions cleared."
+    if result["kind"] == "definitions":
+        return f"Defined: {', '.join(f'{name} ({kind})' for name, kind in result['symbols'])}" \
+            if result["symbols"] else "No declarations."
+    lines = [f"{len(result['assertions'])} assertions in {result['wall_seconds']:.2f} s"
+             f"{' (cached)' if result['cached'] else ''}"]
+    for entry in result["assertions"]:
+        lines.append(f"  line {entry['line'] + 1:>4}  {entry['verdict'].upper():<8} {entry['assertion']}")
+    return "\n".join(lines)
+
+
+def _kernel_class():
+    """Builds the Jupyter kernel class; ipykernel is only needed when the kernel is launched."""
+    try:
+        from ipykernel.kernelbase import Kernel
+    except ImportError as e:
+        raise ImportError("The PCSP kernel needs ipykernel (pip install ipykernel)") from e
+
+    from .xshd_parser import load_xshd
+
+    class PcspKernel(Kernel):
+        implementation = "pcsp"
+        implementation_version = "0.1"
+        language = "pcsp"
+        language_info = {"name": "pcsp", "mimetype": "text/x-pcsp", "file_extension": ".pcsp"}
+        banner = "PCSP kernel: cells without #assert define the model, cells with #assert check it."
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            timeout = os.environ.get("PCSP_KERNEL_TIMEOUT")
+            workers = os.environ.get("PCSP_KERNEL_WORKERS")
+            self.pcsp = PcspSession(load_xshd(os.environ["PCSP_KERNEL_XSHD"]),
+                                    checker=os.environ.get("PCSP_KERNEL_CHECKER", DEFAULT_CHECKER),
+                                    workers=int(workers) if workers else None,
+                                    timeout=float(timeout) if timeout else None)
+
+        async def do_execute(self, code, silent, store_history=True, user_expressions=None,
+                             allow_stdin=False, **kwargs):
+            cell_id = kwargs.get("cell_id")
+            if cell_id is None and hasattr(self, "get_parent"):
+                # ipykernel versions that do not pass cell_id still have it in the request metadata
+                cell_id = (self.get_parent().get("metadata") or {}).get("cellId")
+            result = await self.pcsp.run_cell(code, cell_id)
+            if not silent:
+                self.send_response(self.iopub_socket, "stream",
+                                   {"name": "stdout", "text": format_cell_result(result) + "\n"})
+                if result["kind"] == "report":
+                    self.send_response(self.iopub_socket, "display_data",
+                                       {"data": {"application/json": result}, "metadata": {}})
+            return {"status": "ok", "execution_count": self.execution_count, "payload": [],
+                    "user_expressions": {}}
+
+        def do_complete(self, code, cursor_pos):
+            start, matches = self.pcsp.complete(code, cursor_pos)
+            return {"status": "ok", "matches": matches, "cursor_start": start, "cursor_end": cursor_pos,
+                    "metadata": {}}
+
+        def do_inspect(self, code, cursor_pos, detail_level=0, omit_sections=()):
+            scopes = self.pcsp.scopes_at(code, cursor_pos)
+            data = {"text/plain": " ".join(scopes)} if scopes else {}
+            return {"status": "ok", "found": bool(scopes), "data": data, "metadata": {}}
+
+        async def do_shutdown(self, restart):
+            await self.pcsp.close()
+            return {"status": "ok", "restart": restart}
+
+    return PcspKernel
+
+
+def kernel_spec(xshd_path: str, checker: str = DEFAULT_CHECKER, workers: int = None, timeout: float = None) -> dict:
+    """The kernel.json contents that launch this module with the given settings."""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {"PYTHONPATH": os.path.dirname(package_dir), "PCSP_KERNEL_XSHD": os.path.abspath(xshd_path),
+           "PCSP_KERNEL_CHECKER": checker}
+    if workers:
+        env["PCSP_KERNEL_WORKERS"] = str(workers)
+    if timeout:
+        env["PCSP_KERNEL_TIMEOUT"] = str(timeout)
+    return {"argv": [sys.executable, "-m", f"{os.path.basename(package_dir)}.src.pcsp_kernel", "-f", "{connection_file}"],
+            "display_name": "PCSP", "language": "pcsp", "env": env}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "install":
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Install the PCSP Jupyter kernel spec.")
+        parser.add_argument("install")
+        parser.add_argument("--xshd", required=True, help="Path to the .xshd definition")
+        parser.add_argument("--checker", default=DEFAULT_CHECKER, help="Checker command template")
+        parser.add_argument("--workers", type=int, help="Resident checker processes")
+        parser.add_argument("--timeout", type=float, help="Per-assertion timeout in seconds")
+        parser.add_argument("--prefix", help="Install into this prefix instead of the user's directory")
+        args = parser.parse_args()
+
+        from jupyter_client.kernelspec import KernelSpecManager
+
+        with tempfile.TemporaryDirectory() as spec_dir:
+            with open(os.path.join(spec_dir, "kernel.json"), "w", encoding="utf-8") as f:
+                json.dump(kernel_spec(args.xshd, args.checker, args.workers, args.timeout), f, indent=2)
+            destination = KernelSpecManager().install_kernel_spec(spec_dir, "pcsp", user=args.prefix is None,
+                                                                  prefix=args.prefix)
+        print(f"Installed the PCSP kernel in {destination} (checker: {shlex.split(args.checker)[0]})")
+    else:
+        from ipykernel.kernelapp import IPKernelApp
+
+        IPKernelApp.launch_instance(kernel_class=_kernel_class())
@@ -0,0 +1,197 @@
+from array import array
+
+from .textmate_tokenizer import load_grammar, split_lines
+
+# LSP semantic tokens: https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#textDocument_semanticTokens
+# Each token is encoded as five unsigned integers:
+#   deltaLine, deltaStartChar, length, tokenType, tokenModifiers
+# Positions and lengths are in UTF-16 code units (the LSP default position encoding).
+
+# Standard LSP token types, checked in order against the innermost TextMate scope.
+# The first matching scope prefix wins.
+SCOPE_TOKEN_TYPES = [
+    ("comment", "comment"),
+    ("string.regexp", "regexp"),
+    ("string", "string"),
+    ("constant.numeric", "number"),
+    ("constant.character.escape", "string"),
+    ("constant", "enumMember"),
+    ("keyword.operator", "operator"),
+    ("keyword", "keyword"),
+    ("storage.type", "type"),
+    ("storage", "keyword"),
+    ("entity.name.function", "function"),
+    ("support.function", "function"),
+    ("entity.name.type", "type"),
+    ("support.type", "type"),
+    ("support.class", "class"),
+    ("entity.name.namespace", "namespace"),
+    ("variable.parameter", "parameter"),
+    ("variable", "variable"),
+    ("meta.preprocessor", "macro"),
+]
+
+# Standard LSP token modifiers, derived from any scope segment on the innermost scope.
+SCOPE_TOKEN_MODIFIERS = [
+    ("documentation", "documentation"),
+    ("language", "readonly"),
+    ("builtin", "defaultLibrary"),
+    ("deprecated", "deprecated"),
+]
+
+
+class SemanticTokensLegend:
+    """
+    Interns TextMate scopes into LSP token type and modifier indices.
+
+    Scope resolution happens once per distinct scope string; every later token with
+    the same scope is a single dictionary lookup. Scopes without a standard LSP
+    mapping get an interned custom type named after their first two scope segments
+    (e.g. "meta.assertion.pcsp" -> "meta-assertion").
+    """
+
+    def __init__(self):
+        self.token_types = []
+        self.token_modifiers = [modifier for _, modifier in SCOPE_TOKEN_MODIFIERS]
+        self._type_indices = {}
+        self._scope_cache = {}  # scope -> (type index, modifier bitmask)
+
+    def _intern_type(self, token_type: str) -> int:
+        index = self._type_indices.get(token_type)
+        if index is None:
+            index = len(self.token_types)
+            self.token_types.append(token_type)
+            self._type_indices[token_type] = index
+        return index
+
+    def lookup(self, scope: str):
+        """Returns (token type index, modifier bitmask) for a TextMate scope."""
+        cached = self._scope_cache.get(scope)
+        if cached is not None:
+            return cached
+
+        token_type = None
+        for prefix, candidate in SCOPE_TOKEN_TYPES:
+            if scope == prefix or scope.startswith(prefix + "."):
+                token_type = candidate
+                break
+        if token_type is None:
+            token_type = "-".join(scope.split(".")[:2])
+
+        segments = set(scope.split("."))
+        modifiers = 0
+        for bit, (segment, _) in enumerate(SCOPE_TOKEN_MODIFIERS):
+            if segment in segments:
+                modifiers |= 1 << bit
+
+        cached = (self._intern_type(token_type), modifiers)
+        self._scope_cache[scope] = cached
+        return cached
+
+    def to_lsp(self) -> dict:
+        """Returns the legend in the shape of LSP's SemanticTokensLegend."""
+        return {"tokenTypes": list(self.token_types), "tokenModifiers": list(self.token_modifiers)}
+
+
+def _utf16_offsets(line: str):
+    """Returns UTF-16 offsets indexed by code point offset, or None for ASCII lines."""
+    if line.isascii():
+        return None
+    offsets = array('I', [0])
+    total = 0
+    for ch in line:
+        total += 2 if ord(ch) > 0xFFFF else 1
+        offsets.append(total)
+    return offsets
+
+
+def encode_semantic_tokens(text: str, grammar, legend: SemanticTokensLegend = None):
+    """
+    Tokenizes a document and returns its LSP semantic tokens.
+
+    Tokens are appended straight into an array('I') as each line is tokenized, so
+    no per-token objects outlive the line they were produced for. Adjacent tokens
+    on the same line that resolve to the same type and modifiers are merged, and
+    text carrying only the grammar's root scope is not emitted.
+
+    Args:
+        text: The document text.
+        grammar: A Grammar, grammar dictionary, or path to a .tmLanguage.json file.
+        legend: The legend to intern token types into. A new one is created if omitted.
+
+    Returns:
+        A tuple (data, legend) where data is the delta-encoded array('I') of
+        (deltaLine, deltaStartChar, length, tokenType, tokenModifiers) integers.
+    """
+    grammar = load_grammar(grammar)
+    if legend is None:
+        legend = SemanticTokensLegend()
+    lookup = legend.lookup
+
+    data = array('I')
+    append = data.append
+    prev_line = 0
+    prev_start = 0
+    state = ()
+
+    for line_number, line in enumerate(split_lines(text)):
+        tokens, state = grammar.tokenize_line(line, state)
+
+        # Merge adjacent tokens of the same kind; only this line's tokens are held.
+        merged = []
+        for start, end, scopes in tokens:
+            if len(scopes) < 2:
+                continue
+            token_type, modifiers = lookup(scopes[-1])
+            if merged:
+                last = merged[-1]
+                if last[1] == start and last[2] == token_type and last[3] == modifiers:
+                    last[1] = end
+                    continue
+            merged.append([start, end, token_type, modifiers])
+        if not merged:
+            continue
+
+        utf16 = _utf16_offsets(line)
+        for start, end, token_type, modifiers in merged:
+            if utf16 is not None:
+                start, end = utf16[start], utf16[end]
+            append(line_number - prev_line)
+            append(start - prev_start if line_number == prev_line else start)
+            append(end - start)
+            append(token_type)
+            append(modifiers)
+            prev_line, prev_start = line_number, start
+
+    return data, legend
+
+
+def decode_semantic_tokens(data):
+    """Expands delta-encoded semantic token data into absolute (line, start, length, type, modifiers) tuples."""
+    line = 0
+    start = 0
+    for i in range(0, len(data), 5):
+        delta_line, delta_start, length, token_type, modifiers = data[i:i + 5]
+        if delta_line:
+            line += delta_line
+            start = delta_start
+        else:
+            start += delta_start
+        yield line, start, length, token_type, modifiers
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compute LSP semantic tokens for a document with a TextMate grammar.")
+    parser.add_argument("grammar", help="Path to the .tmLanguage.json grammar")
+    parser.add_argument("source", help="Path to the document to encode")
+    args = parser.parse_args()
+
+    with open(args.source, "r", encoding="utf-8-sig") as f:
+        source_text = f.read()
+    token_data, token_legend = encode_semantic_tokens(source_text, args.grammar)
+    token_count = len(token_data) // 5
+    print(json.dumps({"legend": token_legend.to_lsp(), "tokens": token_count,
+                      "bytes": token_data.itemsize * len(token_data)}, indent=2))
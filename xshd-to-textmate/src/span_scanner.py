@@ -0,0 +1,427 @@
+import re
+from collections import namedtuple
+
+from .xshd_parser import span_kind
+
+# Locating comments and strings in source files without tokenizing them.
+#
+# The comment and string spans of a definition are reduced to their Begin/End literals.
+# Begin delimiters are found with an Aho-Corasick automaton (leftmost-longest, so "//"
+# wins over "/" and the first declared span wins among equal delimiters); inside a span
+# only its own end delimiter, escape character and, for stopateol spans, the line end
+# are looked for. Every character is examined once, and the scan can be fed in chunks
+# of any size: only a partial delimiter is carried from one chunk to the next.
+
+# A comment or string span. begin/end are its literals (end None: runs to the end of the
+# line for stopateol spans, otherwise to the end of the input), escape its escape
+# character or None.
+SpanDelimiter = namedtuple("SpanDelimiter", ["kind", "name", "begin", "end", "stopateol", "escape"])
+
+# A span found in the text. start/end are offsets, end exclusive. terminator tells how
+# the span ended: "end" (its end delimiter, included in the span), "eol" (before the line
+# break of a stopateol span) or "eof" (unterminated at the end of the input).
+Span = namedtuple("Span", ["start", "end", "kind", "name", "terminator"])
+
+KINDS = ("comment", "string")
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_NOT_LINE_BREAK = re.compile(r"[^\r\n]+")
+
+
+def span_delimiters(xshd_data: dict) -> list:
+    """
+    Collects the comment and string spans of every RuleSet, in declaration order.
+
+    Spans repeated across RuleSets are listed once.
+    """
+    delimiters = []
+    seen = set()
+    for span in xshd_data.get("spans", []):
+        kind = span_kind(span)
+        if kind is None or not span.get("begin"):
+            continue
+        # Definitions parsed before escapecharacter was recorded: strings used "\\"
+        escape = span["escapecharacter"] if "escapecharacter" in span else ("\\" if kind == "string" else None)
+        delimiter = SpanDelimiter(kind, span.get("name"), span["begin"], span.get("end") or None,
+                                  bool(span.get("stopateol")), escape or None)
+        if delimiter not in seen:
+            seen.add(delimiter)
+            delimiters.append(delimiter)
+    return delimiters
+
+
+class _Automaton:
+    """Aho-Corasick automaton over the begin delimiters, reporting the longest match per state."""
+
+    def __init__(self, delimiters: list):
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.output = [None]  # Longest (length, delimiter index) ending in each state
+        for index, delimiter in enumerate(delimiters):
+            state = 0
+            for char in delimiter.begin:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[state] + 1)
+                    self.output.append(None)
+                state = next_state
+            if self.output[state] is None or self.output[state][0] != len(delimiter.begin):
+                self.output[state] = (len(delimiter.begin), index)
+
+        # Breadth-first failure links; a state without its own match inherits the longest
+        # match of its failure state, which ends at the same position
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+        # Prefilter: outside a partial match, jump straight to the next possible first character
+        first = "".join(sorted(self.goto[0]))
+        self.first_chars = re.compile(f"[{re.escape(first)}]") if first else None
+
+
+class SpanScanner:
+    """
+    Finds comment and string spans in source text, built from parsed XSHD data.
+
+    Args:
+        xshd_data: Parsed XSHD data.
+        kinds: Span kinds to recognize, a subset of ("comment", "string").
+    """
+
+    def __init__(self, xshd_data: dict, kinds=KINDS):
+        self.delimiters = [d for d in span_delimiters(xshd_data) if d.kind in kinds]
+        self.automaton = _Automaton(self.delimiters)
+        # Characters that may end or escape inside each span
+        self._stops = []
+        for delimiter in self.delimiters:
+            chars = {delimiter.end[0]} if delimiter.end else set()
+            if delimiter.escape:
+                chars.add(delimiter.escape)
+            if delimiter.stopateol:
+                chars.add("\n")
+            self._stops.append(re.compile(f"[{re.escape(''.join(sorted(chars)))}]") if chars else None)
+
+    def session(self) -> "ScanSession":
+        """Starts an incremental scan, see ScanSession."""
+        return ScanSession(self)
+
+    def scan(self, text: str) -> list:
+        """Returns the spans of a complete text, in order."""
+        session = self.session()
+        return session.feed(text) + session.close()
+
+    def iter_spans(self, chunks):
+        """Yields the spans of a text given as an iterable of chunks."""
+        session = self.session()
+        for chunk in chunks:
+            yield from session.feed(chunk)
+        yield from session.close()
+
+    def mask(self, chunks, kinds=KINDS, fill: str = " "):
+        """
+        Yields the text with the spans of the given kinds, delimiters included, overwritten
+        by `fill`. Line breaks are kept, so every offset, line and column stays valid.
+        """
+        def blank(segment):
+            return _NOT_LINE_BREAK.sub(lambda run: fill * len(run.group()), segment)
+
+        return self._rewrite(chunks, kinds, blank, lambda span, broken: "")
+
+    def strip(self, chunks, kinds=KINDS):
+        """
+        Yields the text without the spans of the given kinds. A removed span leaves its
+        line breaks, so line numbers stay valid; one that ended on its end delimiter
+        without a line break leaves a space, so "a/**/b" does not become "ab".
+        """
+        return self._rewrite(chunks, kinds, lambda segment: _NOT_LINE_BREAK.sub("", segment),
+                             lambda span, broken: " " if span.terminator == "end" and not broken else "")
+
+    def _rewrite(self, chunks, kinds, replace, finish):
+        """Streams the text, passing the parts of the selected spans through replace()."""
+        session = self.session()
+        pending = ""  # Input from offset `emitted` on
+        emitted = 0
+        current = None  # Start of the span whose beginning was already written
+        broken = False  # That span contained a line break
+
+        def take(end):
+            nonlocal pending, emitted
+            segment = pending[:end - emitted]
+            pending = pending[end - emitted:]
+            emitted = end
+            return segment
+
+        def span_output(start, end, kind):
+            nonlocal current, broken
+            if current != start:
+                current, broken = start, False
+            segment = take(end)
+            if kind not in kinds:
+                return segment
+            broken = broken or "\n" in segment or "\r" in segment
+            return replace(segment)
+
+        def flush(spans):
+            nonlocal current
+            out = []
+            for span in spans:
+                out.append(take(max(span.start, emitted)))
+                out.append(span_output(span.start, span.end, span.kind))
+                if span.kind in kinds:
+                    out.append(finish(span, broken))
+                current = None
+            if session.open_start is not None:
+                out.append(take(max(session.open_start, emitted)))
+                out.append(span_output(session.open_start, session.resolved, session.open_delimiter.kind))
+            else:
+                out.append(take(session.resolved))
+            return "".join(out)
+
+        for chunk in chunks:
+            pending += chunk
+            output = flush(session.feed(chunk))
+            if output:
+                yield output
+        output = flush(session.close())
+        if output:
+            yield output
+
+
+class ScanSession:
+    """
+    Incremental scan state. feed() returns the spans completed by each chunk.
+
+    Between calls, everything before `resolved` is classified: it belongs to a returned
+    span, to code, or to the span still open at `open_start` (`open_delimiter` is not
+    None then). The text from `resolved` on is an unresolved partial delimiter.
+    """
+
+    def __init__(self, scanner: SpanScanner):
+        self.scanner = scanner
+        self.resolved = 0
+        self.open_start = None
+        self._open = None  # Index of the open span's delimiter
+        self._carry = ""
+        self._escaped = False  # The open span's last character was an escape character
+
+    @property
+    def open_delimiter(self):
+        return None if self._open is None else self.scanner.delimiters[self._open]
+
+    def feed(self, chunk: str) -> list:
+        return self._scan(self._carry + chunk, final=False) if chunk else []
+
+    def close(self) -> list:
+        """Flushes the remaining input; an open span ends at the end of the input."""
+        spans = self._scan(self._carry, final=True)
+        if self._open is not None:
+            delimiter = self.open_delimiter
+            spans.append(Span(self.open_start, self.resolved, delimiter.kind, delimiter.name, "eof"))
+            self.open_start = self._open = None
+        return spans
+
+    def _scan(self, text: str, final: bool) -> list:
+        base = self.resolved
+        scanner = self.scanner
+        automaton = scanner.automaton
+        goto, fail, depth, output = automaton.goto, automaton.fail, automaton.depth, automaton.output
+        length = len(text)
+        spans = []
+        i = 0
+        self._carry = ""
+
+        while i < length:
+            if self._open is None:
+                # Code: find the leftmost-longest begin delimiter
+                match = automaton.first_chars.search(text, i) if automaton.first_chars else None
+                if match is None:
+                    i = length
+                    break
+                state = 0
+                candidate = None  # (start, length, delimiter index)
+                position = match.start()
+                while position < length:
+                    char = text[position]
+                    while state and char not in goto[state]:
+                        state = fail[state]
+                    state = goto[state].get(char, 0)
+                    position += 1
+                    found = output[state]
+                    if found is not None:
+                        start = position - found[0]
+                        if candidate is None or start < candidate[0] or (start == candidate[0] and found[0] > candidate[1]):
+                            candidate = (start, found[0], found[1])
+                    if candidate is not None and position - depth[state] > candidate[0]:
+                        break  # No longer delimiter can start at the candidate
+                    if state == 0:
+                        break
+                else:
+                    if not final:
+                        # The partial delimiter may continue in the next chunk
+                        i = candidate[0] if candidate is not None else position - depth[state]
+                        self._carry = text[i:]
+                        break
+                if candidate is None:
+                    i = position
+                    continue
+                self.open_start = base + candidate[0]
+                self._open = candidate[2]
+                self._escaped = False
+                i = candidate[0] + candidate[1]
+                continue
+
+            # Inside a span: look for its end delimiter, escape character or line end
+            delimiter = scanner.delimiters[self._open]
+            if self._escaped:
+                self._escaped = False
+                if not (delimiter.stopateol and text[i] == "\n"):
+                    i += 1
+                    continue
+            stops = scanner._stops[self._open]
+            match = stops.search(text, i) if stops is not None else None
+            if match is None:
+                i = length
+                break
+            i = match.start()
+            char, end, escape = text[i], delimiter.end, delimiter.escape
+
+            if char == "\n" and delimiter.stopateol:
+                spans.append(Span(self.open_start, base + i, delimiter.kind, delimiter.name, "eol"))
+                self.open_start = self._open = None
+                continue
+            if char == escape:
+                if not end or end[0] != escape:
+                    # The escape character hides the next character, except a line break ending the span
+                    if i + 1 == length:
+                        self._escaped = True
+                    elif not (delimiter.stopateol and text[i + 1] == "\n"):
+                        i += 1
+                    i += 1
+                    continue
+                # The escape character starts the end delimiter: a doubled one is escaped ("" in "...")
+                if i + 1 == length and not final:
+                    self._carry = text[i:]
+                    break
+                if text.startswith(escape, i + 1):
+                    i += 2
+                    continue
+            if end and text.startswith(end, i):
+                i += len(end)
+                spans.append(Span(self.open_start, base + i, delimiter.kind, delimiter.name, "end"))
+                self.open_start = self._open = None
+                continue
+            if end and not final and i + len(end) > length and end.startswith(text[i:]):
+                self._carry = text[i:]
+                break
+            i += 1
+
+        self.resolved = base + length - len(self._carry)
+        return spans
+
+
+def iter_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = "utf-8-sig"):
+    """Yields the decoded text of a file in chunks of chunk_size characters."""
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def build_span_regex(delimiters: list):
+    """
+    Compiles the delimiters into one regex alternation with the scanner's semantics.
+
+    The regex-based way to find the same spans, kept as the reference for tests and
+    benchmarks: group "s<i>" matches a span of delimiters[i], "e<i>" its end delimiter and
+    "l<i>" an end before a line break.
+    """
+    alternatives = []
+    order = sorted(range(len(delimiters)), key=lambda index: (-len(delimiters[index].begin), index))
+    for index in order:
+        delimiter = delimiters[index]
+        end, escape = delimiter.end, delimiter.escape
+        eol = f"|(?P<l{index}>)(?=\\n)" if delimiter.stopateol else ""
+        any_char = "[^\\n]" if delimiter.stopateol else "(?s:.)"
+        line_break = "\\n" if delimiter.stopateol else ""
+        before_line_break = "|(?=\\n)" if delimiter.stopateol else ""
+        if not end:
+            body = "[^\\n]*+" if delimiter.stopateol else "(?s:.)*+"
+        elif escape and escape == end[0]:
+            escaped = re.escape(escape * 2)
+            if len(end) == 1:
+                body = f"(?:[^{re.escape(end)}{line_break}]++|{escaped})*+"
+            else:
+                body = f"(?:{escaped}|{any_char})*?"
+        elif escape:
+            escaped = f"{re.escape(escape)}(?:{any_char}|\\Z{before_line_break})"
+            if len(end) == 1:
+                body = f"(?:[^{re.escape(end + escape)}{line_break}]++|{escaped})*+"
+            else:
+                body = f"(?:{escaped}|{any_char})*?"
+        else:
+            body = f"[^{re.escape(end)}{line_break}]*+" if len(end) == 1 else f"{any_char}*?"
+        terminator = f"(?P<e{index}>{re.escape(end)}){eol}|\\Z" if end else f"\\Z{eol}"
+        alternatives.append(f"(?P<s{index}>{re.escape(delimiter.begin)}{body}(?:{terminator}))")
+    return re.compile("|".join(alternatives)) if alternatives else None
+
+
+def regex_scan(text: str, delimiters: list, pattern=None) -> list:
+    """Finds the spans of a complete text with build_span_regex(); the same result as SpanScanner.scan()."""
+    pattern = pattern or build_span_regex(delimiters)
+    if pattern is None:
+        return []
+    spans = []
+    for match in pattern.finditer(text):
+        index = int(match.lastgroup[1:])
+        delimiter = delimiters[index]
+        if delimiter.end and match.group(f"e{index}") is not None:
+            terminator = "end"
+        elif delimiter.stopateol and match.end() < len(text):
+            terminator = "eol"
+        else:
+            terminator = "eof"
+        spans.append(Span(match.start(), match.end(), delimiter.kind, delimiter.name, terminator))
+    return spans
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from .xshd_parser import load_xshd
+
+    parser = argparse.ArgumentParser(description="Strip or mask the comments and strings of a source file.")
+    parser.add_argument("source", help="Path to the source file")
+    parser.add_argument("--xshd", required=True, help="Path to the .xshd definition")
+    parser.add_argument("--mode", choices=["strip", "mask", "spans"], default="strip",
+                        help="strip: remove the spans; mask: blank them out; spans: list them")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=["comment"],
+                        help="Span kinds to strip or mask (default: comment)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    span_scanner = SpanScanner(load_xshd(args.xshd))
+    chunks = iter_chunks(args.source, args.chunk_size)
+    if args.mode == "spans":
+        for found in span_scanner.iter_spans(chunks):
+            if found.kind in args.kinds:
+                print(f"{found.start}\t{found.end}\t{found.kind}\t{found.name}\t{found.terminator}")
+    else:
+        rewrite = span_scanner.strip if args.mode == "strip" else span_scanner.mask
+        for output in rewrite(chunks, args.kinds):
+            sys.stdout.write(output)
@@ -0,0 +1,406 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+from .textmate_generator import escape_regex
+
+# Persistent workspace symbol index for PCSP models.
+#
+# Each file is lexed once, left to right, with a single regex built from the XSHD
+# comment, string and keyword data. Declarations and references are stored in SQLite,
+# together with the file's mtime, size and content hash, so re-indexing a workspace
+# only re-reads files whose mtime or size changed and only re-lexes files whose content
+# actually changed.
+
+SCHEMA_VERSION = 1
+
+# Keywords that introduce a declaration, and the kind of symbol they declare
+DECLARATION_KEYWORDS = {
+    "define": "constant",
+    "var": "variable",
+    "hvar": "variable",
+    "channel": "channel",
+    "enum": "enumMember",
+}
+
+# LSP SymbolKind values for each symbol kind
+SYMBOL_KINDS = {
+    "process": 12,  # Function
+    "constant": 14,  # Constant
+    "variable": 13,  # Variable
+    "channel": 24,  # Event
+    "enumMember": 22,  # EnumMember
+    "assertion": 7,  # Property
+}
+
+Symbol = namedtuple("Symbol", ["name", "kind", "path", "line", "column"])
+Reference = namedtuple("Reference", ["name", "path", "line", "column"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    folded TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    col INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    col INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name);
+CREATE INDEX IF NOT EXISTS symbols_folded ON symbols(folded);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols(file_id);
+CREATE INDEX IF NOT EXISTS refs_name ON refs(name);
+CREATE INDEX IF NOT EXISTS refs_file_line ON refs(file_id, line);
+"""
+
+
+class SourceLexicon:
+    """
+    The lexical view of a language needed for indexing, derived from parsed XSHD data.
+
+    Comment and string spans are skipped, keywords from every RuleSet are never
+    reported as references, and spans that switch to another RuleSet (such as the
+    PCSP Assertion span) are indexed as named regions, e.g. "assert P() deadlockfree".
+    """
+
+    def __init__(self, xshd_data: dict):
+        comments = xshd_data.get("comments", {})
+        skip = []
+        for start in comments.get("line_comment_start", []):
+            skip.append(f"{escape_regex(start)}[^\\n]*")
+        for start, end in zip(comments.get("block_comment_start", []), comments.get("block_comment_end", [])):
+            skip.append(f"{escape_regex(start)}(?:.*?{escape_regex(end)}|.*\\Z)")
+        for string in xshd_data.get("strings", []):
+            begin, end = escape_regex(string["begin"]), escape_regex(string["end"])
+            escape = escape_regex(string.get("escapecharacter") if "escapecharacter" in string else "\\")
+            newline = "\\n" if string.get("stopateol") else ""
+            if len(string["end"]) == 1:
+                body = f"[^{end}{escape}{newline}]++|{escape}." if escape else f"[^{end}{newline}]++"
+                skip.append(f"{begin}(?:{body})*+(?:{end}|$)")
+            else:
+                skip.append(f"{begin}(?:{escape + '.|' if escape else ''}.)*?(?:{end}|$)")
+        # Longest delimiters first, so "//" wins over "/"; RuleSets often repeat the same spans
+        skip = sorted(set(skip), key=lambda pattern: (-len(pattern), pattern))
+
+        self.keywords = frozenset(word for words in xshd_data.get("keywords", {}).values() for word in words)
+        for ruleset in xshd_data.get("rulesets", []):
+            self.keywords |= frozenset(word for words in ruleset.get("keywords", {}).values() for word in words)
+
+        # Spans with a rule attribute: begin word -> (region kind, end delimiter)
+        self.regions = {}
+        for span in xshd_data.get("spans", []):
+            if span.get("rule") and span.get("begin") and span.get("end"):
+                self.regions.setdefault(span["begin"], ("assertion" if "assert" in span["name"].lower()
+                                                         else span["name"].lower(), span["end"]))
+
+        parts = []
+        if skip:
+            parts.append("(?P<skip>" + "|".join(skip) + ")")
+        parts.append(r"(?P<ident>[A-Za-z_][A-Za-z0-9_]*)")
+        parts.append(r"(?P<num>\d+(?:\.\d+)?)")
+        parts.append(r"(?P<op>==|!=|<=|>=|->|[=;#(){}\[\]<>,])")
+        self.pattern = re.compile("|".join(parts), re.S | re.M)
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [self.pattern.pattern, sorted(self.keywords), sorted(self.regions.items()), SCHEMA_VERSION]
+        ).encode("utf-8")).hexdigest()
+
+
+def extract_symbols(text: str, lexicon: SourceLexicon):
+    """
+    Extracts declarations and references from a PCSP source in a single pass.
+
+    Declarations are #define constants, var/hvar variables, channels, enum members,
+    process definitions ("Name(params) = ..." at the start of a statement) and regions
+    such as #assert lines. Every other identifier that is not a keyword is a reference.
+    Lines and columns are 0-based, columns in code points.
+
+    Returns:
+        A tuple (symbols, references) of lists of (name, kind, line, column) and
+        (name, line, column) tuples.
+    """
+    line_starts = [0]
+    line_starts.extend(match.end() for match in re.finditer("\n", text))
+
+    def position(offset):
+        line = bisect.bisect_right(line_starts, offset) - 1
+        return line, offset - line_starts[line]
+
+    symbols = []
+    references = []
+    keywords = lexicon.keywords
+    regions = lexicon.regions
+
+    depth = 0
+    statement_start = True
+    pending = None  # Symbol kind declared by the last declaration keyword
+    in_type = False  # Inside "var <Type> name"
+    enum_depth = None  # Depth of an enum body whose identifiers are members
+    candidate = None  # (name, offset) that may start a process definition
+    region = None  # (kind, end delimiter, start offset) of an open region
+
+    for match in lexicon.pattern.finditer(text):
+        kind = match.lastgroup
+        if kind == "skip" or kind == "num":
+            continue
+        value = match.group()
+        offset = match.start()
+
+        if kind == "ident":
+            if value in regions and region is None:
+                region_kind, region_end = regions[value]
+                region = (region_kind, region_end, offset)
+                statement_start = False
+                continue
+            if value in keywords:
+                if depth == 0 and value in DECLARATION_KEYWORDS:
+                    pending = DECLARATION_KEYWORDS[value]
+                statement_start = False
+                continue
+            if in_type:
+                references.append((value, *position(offset)))
+            elif pending == "enumMember":
+                if enum_depth is not None:
+                    symbols.append((value, "enumMember", *position(offset)))
+                else:
+                    references.append((value, *position(offset)))
+            elif pending is not None:
+                symbols.append((value, pending, *position(offset)))
+                pending = None
+            elif statement_start and depth == 0 and region is None:
+                candidate = (value, offset)
+            elif candidate is not None and depth > 0:
+                pass  # Parameter of a process definition
+            else:
+                if candidate is not None:
+                    references.append((candidate[0], *position(candidate[1])))
+                    candidate = None
+                references.append((value, *position(offset)))
+            statement_start = False
+            continue
+
+        # Operators
+        if value in ("(", "[", "{"):
+            if value == "{" and pending == "enumMember" and enum_depth is None:
+                enum_depth = depth
+            depth += 1
+        elif value in (")", "]", "}"):
+            depth = max(0, depth - 1)
+            if value == "}" and enum_depth == depth:
+                enum_depth = None
+                pending = None
+        elif value == "<" and pending is not None:
+            in_type = True
+        elif value == ">" and in_type:
+            in_type = False
+        elif value == "=" and depth == 0 and candidate is not None:
+            symbols.append((candidate[0], "process", *position(candidate[1])))
+            candidate = None
+
+        if region is not None and value == region[1] and depth == 0:
+            region_text = " ".join(text[region[2]:offset].split())
+            symbols.append((region_text, region[0], *position(region[2])))
+            region = None
+
+        if value == ";" and depth == 0:
+            if candidate is not None:
+                references.append((candidate[0], *position(candidate[1])))
+            candidate = None
+            pending = None
+            in_type = False
+            statement_start = True
+        elif value != "#":
+            statement_start = False
+
+    if candidate is not None:
+        references.append((candidate[0], *position(candidate[1])))
+    return symbols, references
+
+
+class SymbolIndex:
+    """
+    An on-disk index of PCSP declarations and references.
+
+    Use as a context manager or call close() when done.
+
+    Args:
+        db_path: Path of the SQLite database (created if missing), or ":memory:".
+        xshd_data: Parsed XSHD data of the language. The whole index is rebuilt when
+            the lexical data derived from it changes.
+    """
+
+    def __init__(self, db_path: str, xshd_data: dict):
+        self.lexicon = SourceLexicon(xshd_data)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(_SCHEMA)
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'lexicon'").fetchone()
+        if row is None or row[0] != self.lexicon.fingerprint:
+            with self.connection:
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('lexicon', ?)",
+                                        (self.lexicon.fingerprint,))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, root: str, extensions=(".pcsp",)) -> dict:
+        """
+        Brings the index up to date with the files under root (a directory or a file).
+
+        Files whose mtime and size are unchanged are not read; files whose content hash
+        is unchanged are not re-lexed; files that no longer exist are dropped.
+
+        Returns:
+            Counts of "indexed", "unchanged" and "removed" files.
+        """
+        if os.path.isdir(root):
+            paths = []
+            for directory, _, file_names in os.walk(root):
+                paths.extend(os.path.join(directory, name) for name in file_names if name.endswith(extensions))
+        else:
+            paths = [root]
+        paths = {os.path.abspath(path) for path in paths}
+        prefix = os.path.join(os.path.abspath(root), "") if os.path.isdir(root) else os.path.abspath(root)
+
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        known = {path: (file_id, mtime_ns, size, digest) for file_id, path, mtime_ns, size, digest
+                 in self.connection.execute("SELECT id, path, mtime_ns, size, hash FROM files")}
+
+        with self.connection:
+            for path, (file_id, _, _, _) in known.items():
+                if path.startswith(prefix) and path not in paths:
+                    self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                    stats["removed"] += 1
+
+            for path in sorted(paths):
+                entry = known.get(path)
+                try:
+                    stat = os.stat(path)
+                    if entry is not None and entry[1] == stat.st_mtime_ns and entry[2] == stat.st_size:
+                        stats["unchanged"] += 1
+                        continue
+                    with open(path, "rb") as f:
+                        content = f.read()
+                except OSError:
+                    # Deleted since the directory walk (or unreadable): treat it as removed
+                    if entry is not None:
+                        self.connection.execute("DELETE FROM files WHERE id = ?", (entry[0],))
+                        stats["removed"] += 1
+                    continue
+                digest = hashlib.sha1(content).hexdigest()
+                if entry is not None and entry[3] == digest:
+                    self.connection.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?",
+                                            (stat.st_mtime_ns, stat.st_size, entry[0]))
+                    stats["unchanged"] += 1
+                    continue
+                self._index_file(path, content, digest, stat, entry[0] if entry else None)
+                stats["indexed"] += 1
+        return stats
+
+    def _index_file(self, path, content, digest, stat, file_id):
+        if file_id is not None:
+            self.connection.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+            self.connection.execute("DELETE FROM refs WHERE file_id = ?", (file_id,))
+            self.connection.execute("UPDATE files SET mtime_ns = ?, size = ?, hash = ? WHERE id = ?",
+                                    (stat.st_mtime_ns, stat.st_size, digest, file_id))
+        else:
+            file_id = self.connection.execute(
+                "INSERT INTO files (path, mtime_ns, size, hash) VALUES (?, ?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_size, digest)).lastrowid
+
+        text = content.decode("utf-8-sig", errors="replace")
+        symbols, references = extract_symbols(text, self.lexicon)
+        self.connection.executemany(
+            "INSERT INTO symbols (file_id, name, folded, kind, line, col) VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_id, name, name.lower(), kind, line, column) for name, kind, line, column in symbols])
+        self.connection.executemany(
+            "INSERT INTO refs (file_id, name, line, col) VALUES (?, ?, ?, ?)",
+            [(file_id, name, line, column) for name, line, column in references])
+
+    def workspace_symbols(self, query: str, limit: int = 100) -> list:
+        """Returns up to limit symbols whose name starts with query, ignoring case."""
+        folded = query.lower()
+        sql = ("SELECT s.name, s.kind, f.path, s.line, s.col FROM symbols s JOIN files f ON f.id = s.file_id "
+               "WHERE {} ORDER BY s.folded, f.path, s.line LIMIT ?")
+        if not folded:
+            return [Symbol(*row) for row in self.connection.execute(sql.format("1"), (limit,))]
+        # A prefix is an index range scan; substring search would have to scan every symbol
+        upper = folded[:-1] + chr(ord(folded[-1]) + 1)
+        return [Symbol(*row) for row in self.connection.execute(
+            sql.format("s.folded >= ? AND s.folded < ?"), (folded, upper, limit))]
+
+    def definition(self, name: str) -> list:
+        """Returns the declarations of name."""
+        return [Symbol(*row) for row in self.connection.execute(
+            "SELECT s.name, s.kind, f.path, s.line, s.col FROM symbols s JOIN files f ON f.id = s.file_id "
+            "WHERE s.name = ? ORDER BY f.path, s.line", (name,))]
+
+    def references(self, name: str) -> list:
+        """Returns the references to name."""
+        return [Reference(*row) for row in self.connection.execute(
+            "SELECT r.name, f.path, r.line, r.col FROM refs r JOIN files f ON f.id = r.file_id "
+            "WHERE r.name = ? ORDER BY f.path, r.line, r.col", (name,))]
+
+    def definition_at(self, path: str, line: int, column: int) -> list:
+        """Returns the declarations of the identifier at a 0-based position in an indexed file."""
+        row = self.connection.execute(
+            "SELECT name FROM refs WHERE file_id = (SELECT id FROM files WHERE path = ?) AND line = ? "
+            "AND col <= ? AND col + length(name) > ? "
+            "UNION ALL SELECT name FROM symbols WHERE file_id = (SELECT id FROM files WHERE path = ?) "
+            "AND line = ? AND col <= ? AND col + length(name) > ? LIMIT 1",
+            (os.path.abspath(path), line, column, column, os.path.abspath(path), line, column, column)).fetchone()
+        return self.definition(row[0]) if row else []
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from .xshd_parser import load_xshd
+
+    parser = argparse.ArgumentParser(description="Index PCSP models and query workspace symbols.")
+    parser.add_argument("xshd", help="Path to the .xshd definition of the language")
+    parser.add_argument("db", help="Path to the SQLite index")
+    parser.add_argument("root", help="File or directory of models to index")
+    parser.add_argument("--symbols", metavar="QUERY", help="List workspace symbols starting with QUERY")
+    parser.add_argument("--definition", metavar="NAME", help="Show where NAME is declared")
+    args = parser.parse_args()
+
+    with SymbolIndex(args.db, load_xshd(args.xshd)) as index:
+        start = time.perf_counter()
+        update_stats = index.update(args.root)
+        print(f"update: {update_stats} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for label, query, method in (("symbols", args.symbols, index.workspace_symbols),
+                                     ("definition", args.definition, index.definition)):
+            if query is None:
+                continue
+            start = time.perf_counter()
+            found = method(query)
+            print(f"{label}: {len(found)} results in {(time.perf_counter() - start) * 1000:.2f} ms")
+            for symbol in found:
+                print(f"  {symbol.kind:<11} {symbol.name}  {symbol.path}:{symbol.line + 1}:{symbol.column + 1}")
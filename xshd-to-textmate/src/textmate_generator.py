@@ -1,6 +1,9 @@
+import hashlib
 import json
 import re
 
+from .errors import GrammarGenerationError, GrammarWriteError
+
 # Reference for TextMate grammar: https://macromates.com/manual/en/language_grammars
 
 def escape_regex(string: str) -> str:
@@ -10,20 +13,72 @@ def escape_regex(string: str) -> str:
     # This is a basic list, more might be needed depending on XSHD syntax
     return re.sub(r'([.?*+^$[\]\\(){}|-])', r'\\\1', string)
 
-def generate_textmate_grammar(xshd_data: dict, output_path: str):
+class KeywordPattern:
     """
-    Generates a TextMate grammar JSON file from parsed XSHD data.
+    A keyword alternation, "\\b(longest|...|shortest)\\b", produced on demand.
+
+    Holds a reference to the keyword list instead of the escaped, joined regex, and
+    yields the regex in bounded chunks, so very large alternations can be hashed and
+    written out without ever existing as a single string.
+    """
+
+    __slots__ = ("keywords", "ignorecase", "_digest")
+
+    BATCH_SIZE = 1024
+
+    def __init__(self, keywords, ignorecase: bool = False):
+        self.keywords = keywords
+        self.ignorecase = ignorecase
+        self._digest = None
+
+    def chunks(self):
+        """Yields the pattern in pieces of at most BATCH_SIZE keywords."""
+        yield ("(?i)" if self.ignorecase else "") + r"\b("
+        # Longest first, like the materialized pattern; sorting copies references only
+        ordered = sorted(self.keywords, key=len, reverse=True)
+        for start in range(0, len(ordered), self.BATCH_SIZE):
+            # Escaping is per character, so a whole batch is escaped in one call;
+            # NUL cannot occur in XML attribute values and marks the separators.
+            batch = escape_regex("\0".join(ordered[start:start + self.BATCH_SIZE])).replace("\0", "|")
+            yield batch if start == 0 else "|" + batch
+        yield r")\b"
+
+    def digest(self) -> str:
+        if self._digest is None:
+            sha = hashlib.sha1()
+            for chunk in self.chunks():
+                sha.update(chunk.encode("utf-8"))
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    def __str__(self):
+        return "".join(self.chunks())
+
+
+def build_textmate_grammar(xshd_data: dict, scope_name: str = None, lazy_keywords: bool = False) -> dict:
+    """
+    Builds a TextMate grammar from parsed XSHD data.
+
+    This function does not modify its input, performs no I/O and is safe to call
+    from several threads.
 
     Args:
         xshd_data: A dictionary containing syntax information parsed from an .xshd file.
-        output_path: The path to write the generated .tmLanguage.json file.
+        scope_name: Overrides the grammar's scopeName (default "source.<language>").
+        lazy_keywords: Emit keyword "match" patterns as KeywordPattern objects instead
+            of strings, for write_textmate_grammar_stream().
+
+    Returns:
+        The TextMate grammar as a dictionary.
+
+    Raises:
+        GrammarGenerationError: If the XSHD data is missing or has no language name.
     """
     if not xshd_data or not xshd_data.get("name"):
-        print("Error: Invalid or missing XSHD data. Cannot generate grammar.")
-        return
+        raise GrammarGenerationError("Invalid or missing XSHD data. Cannot generate grammar.")
 
     lang_name = xshd_data.get("name", "untitled").lower().replace(" ", "")
-    scope_name = f"source.{lang_name}"
+    scope_name = scope_name or f"source.{lang_name}"
     file_types = xshd_data.get("extensions", [])
     # Remove leading dots from extensions if present, TextMate doesn't use them here
     file_types = [ft.lstrip('.') for ft in file_types]
@@ -92,12 +147,10 @@ def generate_textmate_grammar(xshd_data: dict, output_path: str):
         if not begin_delim or not end_delim:
             continue
 
-        # Basic escape for TextMate: only \ and the delimiter itself
-        # More complex XSHD escape sequences would need specific rules inside the string content
-        # For now, we assume simple backslash escapes for common chars like the delimiter itself or \
-        string_content_patterns = [
-            {"match": r"\\.", "name": f"constant.character.escape.{lang_name}"}
-        ]
+        # XSHD declares the escape character per span (escapecharacter="\\"). Data that
+        # predates the attribute being parsed has no such key and keeps backslash escapes.
+        escape_char = s_def.get("escapecharacter") if "escapecharacter" in s_def else "\\"
+        escaped_escape = escape_regex(escape_char) if escape_char else None
         
         # Heuristic for string type (double, single, other)
         string_type = "double"
@@ -109,16 +162,46 @@ def generate_textmate_grammar(xshd_data: dict, output_path: str):
             string_type = "other"
             
         scope_name_str = f"string.quoted.{string_type}.{str_name}.{lang_name}"
-        if s_def.get("stopateol", False):
-             scope_name_str += ".no-multiline"
+        # Runs of ordinary characters are consumed by one possessive match, so the end
+        # pattern is not retried at every character of the string.
+        escaped_end = escape_regex(end_delim)
+        excluded = escaped_end + (escaped_escape if escape_char and escape_char != end_delim else "")
+        if len(end_delim) == 1:
+            plain = f"[^{excluded}\\n]++" if s_def.get("stopateol", False) else f"[^{excluded}]++"
+        else:
+            plain = f"(?:(?!{escaped_end})[^{escaped_escape or ''}\\n])++"
+        # An escape character that starts the end delimiter only escapes itself, as in
+        # 'it''s' (see span_scanner); any other escape character hides the next character.
+        doubled_end = bool(escape_char) and end_delim.startswith(escape_char)
+        escape = f"{escaped_escape}{escaped_escape}" if doubled_end else f"{escaped_escape}."
+        if doubled_end and len(end_delim) > 1:
+            escape += f"|(?!{escaped_end}){escaped_escape}"
 
+        if s_def.get("stopateol", False):
+            scope_name_str += ".no-multiline"
+            # A single possessive match: runs of ordinary characters and escape pairs are
+            # consumed without backtracking, and the string stops at the end of the line.
+            body = f"{plain}|{escape}" if escaped_escape else plain
+            strings_repo.append({
+                "name": scope_name_str,
+                "match": f"{escape_regex(begin_delim)}(?:{body})*+(?:{escaped_end}|$)"
+            })
+            continue
 
-        strings_repo.append({
+        string_rule = {
             "name": scope_name_str,
             "begin": escape_regex(begin_delim),
-            "end": escape_regex(end_delim),
-            "patterns": string_content_patterns
-        })
+            "end": escaped_end,
+        }
+        if escaped_escape:
+            string_rule["patterns"] = [
+                {"match": plain},
+                {"match": escape, "name": f"constant.character.escape.{lang_name}"}
+            ]
+            if doubled_end:
+                # Try the doubled delimiter before the end pattern that it starts with
+                string_rule["applyEndPatternLast"] = 1
+        strings_repo.append(string_rule)
 
     if strings_repo:
         repository["strings"] = {"patterns": strings_repo}
@@ -161,14 +244,17 @@ def generate_textmate_grammar(xshd_data: dict, output_path: str):
         # elif kw_category == "MySpecialCategory":
         #     final_scope = f"customscope.{kw_category.lower()}.{lang_name}"
 
-        # Sort keywords by length, longest first, to help with matching if some are prefixes of others
-        sorted_kw_list = sorted(kw_list, key=len, reverse=True)
-        
-        # Escape keywords for regex, as some might contain special characters (though unusual for keywords)
-        escaped_kw_list = [escape_regex(kw) for kw in sorted_kw_list]
+        if lazy_keywords:
+            keyword_pattern = KeywordPattern(kw_list, global_ignorecase)
+        else:
+            # Sort keywords by length, longest first, to help with matching if some are prefixes of others
+            sorted_kw_list = sorted(kw_list, key=len, reverse=True)
 
-        keyword_pattern = r"\b(" + "|".join(escaped_kw_list) + r")\b"
-        keyword_pattern = possibly_case_insensitive(keyword_pattern, global_ignorecase)
+            # Escape keywords for regex, as some might contain special characters (though unusual for keywords)
+            escaped_kw_list = [escape_regex(kw) for kw in sorted_kw_list]
+
+            keyword_pattern = r"\b(" + "|".join(escaped_kw_list) + r")\b"
+            keyword_pattern = possibly_case_insensitive(keyword_pattern, global_ignorecase)
 
         keywords_repo.append({
             "name": final_scope,
@@ -222,7 +308,7 @@ def generate_textmate_grammar(xshd_data: dict, output_path: str):
 
         begin_pattern = span_def.get("begin")
         end_pattern = span_def.get("end")
-        span_rule = span_def.get("rule", "").lower() # e.g., "Function", "Preprocessor"
+        span_rule = (span_def.get("rule") or "").lower() # e.g., "Function", "Preprocessor"
         
         # Determine TextMate scope based on XSHD span name or rule
         # This is highly heuristic.
@@ -280,14 +366,208 @@ def generate_textmate_grammar(xshd_data: dict, output_path: str):
         "repository": repository,
     }
 
+    return deduplicate_rules(grammar)
+
+
+def _json_key_default(value):
+    if isinstance(value, KeywordPattern):
+        return f"\0keywords:{value.digest()}"
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _rule_key(rule: dict) -> str:
+    """Structural hash key of a rule: its canonical JSON form."""
+    return json.dumps(rule, sort_keys=True, separators=(",", ":"), default=_json_key_default)
+
+
+def _shared_rule_name(rule: dict, taken: set) -> str:
+    base = re.sub(r"\W+", "_", rule.get("name") or "shared_rule").strip("_") or "shared_rule"
+    name = base
+    suffix = 2
+    while name in taken:
+        name = f"{base}_{suffix}"
+        suffix += 1
+    taken.add(name)
+    return name
+
+
+def deduplicate_rules(grammar: dict) -> dict:
+    """
+    Hash-conses the rules of a grammar so each distinct rule is emitted once.
+
+    Every rule in a repository section (including rules nested inside begin/end
+    patterns) is keyed by its structure. A rule repeated within one patterns list
+    can never match (the first copy always wins), so later copies are dropped. A
+    rule used from several places is moved into the repository once and every use
+    becomes an {"include": "#..."} reference, so editors compile its regexes once.
+    Rules used in a single place stay inline.
+
+    Args:
+        grammar: A grammar as built by build_textmate_grammar().
+
+    Returns:
+        A new grammar dictionary; the input is not modified.
+    """
+    counts = {}
+    keys = {}  # id(rule) -> key, valid while the input grammar is alive
+
+    def key_of(rule):
+        key = keys.get(id(rule))
+        if key is None:
+            key = _rule_key(rule)
+            keys[id(rule)] = key
+        return key
+
+    def count(patterns):
+        seen_here = set()
+        for rule in patterns:
+            if "include" in rule:
+                continue
+            key = key_of(rule)
+            if key in seen_here:
+                continue
+            seen_here.add(key)
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] == 1 and rule.get("patterns"):
+                # Children of a repeated rule are only counted for its first copy,
+                # which is the one that survives rewriting.
+                count(rule["patterns"])
+
+    repository = grammar.get("repository", {})
+    for section in repository.values():
+        count(section.get("patterns", []))
+
+    taken = set(repository)
+    shared = {}  # key -> repository name
+    shared_entries = {}
+
+    def rewrite_rule(rule):
+        if not rule.get("patterns"):
+            return dict(rule)
+        rewritten = dict(rule)
+        rewritten["patterns"] = rewrite(rule["patterns"])
+        return rewritten
+
+    def rewrite(patterns):
+        result = []
+        seen_here = set()
+        for rule in patterns:
+            if "include" in rule:
+                result.append(dict(rule))
+                continue
+            key = key_of(rule)
+            if key in seen_here:
+                continue
+            seen_here.add(key)
+            if counts.get(key, 0) > 1:
+                name = shared.get(key)
+                if name is None:
+                    name = _shared_rule_name(rule, taken)
+                    shared[key] = name
+                    shared_entries[name] = rewrite_rule(rule)
+                result.append({"include": f"#{name}"})
+            else:
+                result.append(rewrite_rule(rule))
+        return result
+
+    new_repository = {}
+    for section_name, section in repository.items():
+        new_section = dict(section)
+        if "patterns" in section:
+            new_section["patterns"] = rewrite(section["patterns"])
+        new_repository[section_name] = new_section
+    new_repository.update(shared_entries)
+
+    result = dict(grammar)
+    result["repository"] = new_repository
+    return result
+
+
+def write_textmate_grammar(grammar: dict, output_path: str):
+    """
+    Writes a grammar built by build_textmate_grammar() as JSON.
+
+    Raises:
+        GrammarWriteError: If the output path cannot be written.
+    """
     try:
         with open(output_path, 'w') as f:
             json.dump(grammar, f, indent=2)
-        print(f"TextMate grammar successfully generated at {output_path}")
-    except IOError:
-        print(f"Error: Could not write to output path {output_path}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+    except OSError as e:
+        raise GrammarWriteError(f"Could not write to output path {output_path}: {e}", output_path) from e
+
+
+def _stream_json(value, write, indent: str = ""):
+    """Writes value like json.dump(value, indent=2), streaming KeywordPattern chunks."""
+    if isinstance(value, KeywordPattern):
+        write('"')
+        for chunk in value.chunks():
+            write(json.dumps(chunk)[1:-1])
+        write('"')
+    elif isinstance(value, dict):
+        if not value:
+            write("{}")
+            return
+        inner = indent + "  "
+        separator = "{\n"
+        for key, item in value.items():
+            write(f"{separator}{inner}{json.dumps(key)}: ")
+            _stream_json(item, write, inner)
+            separator = ",\n"
+        write(f"\n{indent}}}")
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            write("[]")
+            return
+        inner = indent + "  "
+        separator = "[\n"
+        for item in value:
+            write(separator + inner)
+            _stream_json(item, write, inner)
+            separator = ",\n"
+        write(f"\n{indent}]")
+    else:
+        write(json.dumps(value))
+
+
+def write_textmate_grammar_stream(xshd_data: dict, output_path: str, **build_options):
+    """
+    Builds and writes a grammar without materializing its keyword patterns.
+
+    Keyword alternations are hashed (for rule deduplication) and written straight to
+    the output in chunks, so peak memory stays close to the size of the parsed
+    definition instead of several copies of every keyword. The file is identical to
+    write_textmate_grammar(build_textmate_grammar(xshd_data), output_path).
+
+    Raises:
+        GrammarGenerationError: If the XSHD data is missing or has no language name.
+        GrammarWriteError: If the output path cannot be written.
+    """
+    grammar = build_textmate_grammar(xshd_data, lazy_keywords=True, **build_options)
+    try:
+        with open(output_path, 'w') as f:
+            _stream_json(grammar, f.write)
+    except OSError as e:
+        raise GrammarWriteError(f"Could not write to output path {output_path}: {e}", output_path) from e
+
+
+def generate_textmate_grammar(xshd_data: dict, output_path: str):
+    """
+    Generates a TextMate grammar JSON file from parsed XSHD data.
+
+    Errors are printed rather than raised; use build_textmate_grammar() and
+    write_textmate_grammar() to handle them programmatically.
+
+    Args:
+        xshd_data: A dictionary containing syntax information parsed from an .xshd file.
+        output_path: The path to write the generated .tmLanguage.json file.
+    """
+    try:
+        write_textmate_grammar(build_textmate_grammar(xshd_data), output_path)
+    except (GrammarGenerationError, GrammarWriteError) as e:
+        print(f"Error: {e}")
+        return
+    print(f"TextMate grammar successfully generated at {output_path}")
 
 if __name__ == '__main__':
     # Example usage with dummy xshd_data (similar to what xshd_parser would produce)
@@ -0,0 +1,587 @@
+import hashlib
+import json
+import re
+import threading
+
+# A small line-based TextMate tokenizer, sufficient to run the grammars produced by
+# textmate_generator.py (match rules, begin/end rules, captures, repository includes).
+# Regexes are evaluated with Python's `re` module rather than Oniguruma, so
+# Oniguruma-only syntax (\G, \h, (?x) ...) is not supported; rules that fail to
+# compile are disabled instead of aborting the whole grammar.
+
+ROOT_RULE_ID = 0
+
+_LEADING_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\\k<|\(\?P=")
+# Constructs that behave differently once a line is searched inside a block of lines
+_LINE_BOUND = re.compile(r"\\[AZ]|\(\?<?[=!]")
+
+
+def _translate_regex(pattern: str) -> str:
+    """Converts a TextMate (Oniguruma) regex into an equivalent Python regex where possible."""
+    # Python 3.11+ rejects global flags that are not at the very start of the
+    # expression, which happens once rules are combined. Scope them instead.
+    flags_match = _LEADING_FLAGS.match(pattern)
+    if flags_match:
+        pattern = f"(?{flags_match.group(1)}:{pattern[flags_match.end():]})"
+    return pattern
+
+
+def _compile(pattern):
+    if pattern is None:
+        return None
+    try:
+        return re.compile(_translate_regex(pattern))
+    except re.error:
+        return None
+
+
+def grammar_hash(grammar: dict) -> str:
+    """Returns a stable content hash of a grammar dictionary."""
+    canonical = json.dumps(grammar, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class _Rule:
+    __slots__ = ("id", "kind", "owner", "name", "content_name", "match", "begin", "end",
+                 "captures", "begin_captures", "end_captures", "patterns",
+                 "apply_end_last", "raw_patterns")
+
+    def __init__(self, rule_id, kind, raw, owner):
+        self.id = rule_id
+        self.kind = kind  # "match", "begin", or "list"
+        self.owner = owner  # scopeName of the grammar the rule belongs to
+        self.name = raw.get("name")
+        self.content_name = raw.get("contentName")
+        self.match = _compile(raw.get("match"))
+        self.begin = _compile(raw.get("begin"))
+        self.end = _compile(raw.get("end"))
+        self.captures = raw.get("captures") or {}
+        self.begin_captures = raw.get("beginCaptures") or self.captures
+        self.end_captures = raw.get("endCaptures") or self.captures
+        self.apply_end_last = bool(raw.get("applyEndPatternLast"))
+        self.raw_patterns = raw.get("patterns") or []
+        self.patterns = None  # Resolved lazily into a list of rule ids
+
+
+class _Scanner:
+    """Finds the earliest match among the candidate rules of one tokenizer context."""
+
+    def __init__(self, alternatives):
+        # alternatives: list of (kind, rule_id, compiled_regex) in priority order
+        self.alternatives = alternatives
+        self.combined = None
+        self.group_map = {}
+        sources = []
+        for index, (_, _, regex) in enumerate(alternatives):
+            if _BACKREFERENCE.search(regex.pattern):
+                sources = None
+                break
+            sources.append(f"(?P<_a{index}>{regex.pattern})")
+        if sources:
+            try:
+                self.combined = re.compile("|".join(sources))
+            except re.error:
+                self.combined = None
+        if self.combined is not None:
+            for index in range(len(alternatives)):
+                self.group_map[self.combined.groupindex[f"_a{index}"]] = index
+
+    def search(self, text, pos):
+        """Returns (kind, rule_id, match, group_offset) for the earliest match, or None."""
+        if self.combined is not None:
+            m = self.combined.search(text, pos)
+            if m is None:
+                return None
+            group = m.lastindex
+            # lastindex points at the outermost (wrapper) group that closed last
+            index = self.group_map[group]
+            kind, rule_id, _ = self.alternatives[index]
+            return kind, rule_id, m, group
+
+        best = None
+        for kind, rule_id, regex in self.alternatives:
+            m = regex.search(text, pos)
+            if m is not None and (best is None or m.start() < best[2].start()):
+                best = (kind, rule_id, m, 0)
+                if m.start() == pos:
+                    break
+        return best
+
+
+class _Transitions:
+    """
+    Finds where the state of one tokenizer context may change in a block of lines.
+
+    The state only changes where a begin rule of the context, or the end of the
+    context's own begin rule, matches. If none matches anywhere in a line, the line
+    cannot change the state whatever the match rules do. A hit is only a candidate:
+    the line is then tokenized to find the real end state.
+    """
+
+    def __init__(self, regexes):
+        patterns = [regex.pattern for regex in regexes]
+        # Anchors and lookarounds could see past the line in a block; search line by line
+        self.per_line = any(_LINE_BOUND.search(pattern) for pattern in patterns)
+        self.regexes = []
+        if patterns and not any(_BACKREFERENCE.search(pattern) for pattern in patterns):
+            try:
+                self.regexes = [re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.M)]
+            except re.error:
+                pass
+        if patterns and not self.regexes:
+            self.regexes = [re.compile(pattern, re.M) for pattern in patterns]
+
+    def search(self, text: str, pos: int) -> int:
+        """Returns the offset of the first line from pos that may change the state, or -1."""
+        if self.per_line:
+            while pos < len(text):
+                end = text.index("\n", pos) + 1
+                line = text[pos:end]
+                if any(regex.search(line) for regex in self.regexes):
+                    return pos
+                pos = end
+            return -1
+        starts = [m.start() for m in (regex.search(text, pos) for regex in self.regexes) if m is not None]
+        return text.rfind("\n", 0, min(starts)) + 1 if starts else -1
+
+
+class Grammar:
+    """
+    A compiled TextMate grammar that can tokenize text line by line.
+
+    Tokenizer state between lines is an immutable tuple of begin/end rule ids,
+    so it can be compared, cached and serialized cheaply. Rules and scanners are
+    compiled lazily under a lock, so one Grammar can be shared between threads.
+    """
+
+    def __init__(self, grammar: dict, registry: dict = None):
+        self.raw = grammar
+        self.scope_name = grammar.get("scopeName", "source.unknown")
+        self._hash = None
+        self.repository = grammar.get("repository", {})
+        # Other grammars that "source.*" includes can resolve to, by scopeName
+        self.registry = dict(registry or {})
+        self.rules = []
+        self._rule_ids = {}  # id(raw rule dict) -> rule id
+        self._roots = {self.scope_name: ROOT_RULE_ID}  # scopeName -> root rule id
+        root = _Rule(ROOT_RULE_ID, "list", {"patterns": grammar.get("patterns", [])}, self.scope_name)
+        self.rules.append(root)
+        self._scanners = {}
+        self._scope_cache = {}
+        self._interned_scopes = {}
+        self._raw_ids = {}  # rule id -> id(raw rule dict), the inverse of _rule_ids
+        self._pointers = {}  # scopeName -> {id(raw rule dict): JSON pointer}
+        self._transitions = {}  # context rule id -> _Transitions
+        self._lock = threading.Lock()
+
+    # -- rule compilation -------------------------------------------------
+
+    def _rule_for(self, raw: dict, owner: str):
+        key = id(raw)
+        rule_id = self._rule_ids.get(key)
+        if rule_id is not None:
+            return self.rules[rule_id]
+        if "match" in raw:
+            kind = "match"
+        elif "begin" in raw and "end" in raw:
+            kind = "begin"
+        else:
+            kind = "list"
+        rule = _Rule(len(self.rules), kind, raw, owner)
+        self.rules.append(rule)
+        self._rule_ids[key] = rule.id
+        self._raw_ids[rule.id] = key
+        return rule
+
+    @property
+    def hash(self) -> str:
+        """
+        Content hash of the grammar and of the grammars in its registry, as states and
+        tokens depend on the grammars that includes resolve to.
+        """
+        if self._hash is None:
+            digest = grammar_hash(self.raw)
+            if self.registry:
+                digest = grammar_hash([digest] + [[scope, grammar_hash(self._registry_grammar(scope))]
+                                                  for scope in sorted(self.registry)])
+            self._hash = digest
+        return self._hash
+
+    def _registry_grammar(self, scope: str):
+        external = self.registry.get(scope)
+        if external is not None and not isinstance(external, dict):
+            with open(external, "r", encoding="utf-8") as f:
+                external = json.load(f)
+            self.registry[scope] = external
+        return external
+
+    def skipped_rules(self) -> list:
+        """
+        Returns the regexes that `re` cannot compile, whose rules the tokenizer disables.
+
+        Covers every rule of the grammar and of the grammars in its registry, whether or
+        not tokenizing has reached it yet, as "<scopeName>#<JSON pointer to the regex>".
+        """
+        skipped = []
+        for scope in [self.scope_name] + sorted(self.registry):
+            raw = self.raw if scope == self.scope_name else self._registry_grammar(scope)
+            pointers = []
+            _index_uncompiled(raw, "", pointers)
+            skipped.extend(f"{scope}#{pointer}" for pointer in pointers)
+        return skipped
+
+    def _external_root(self, scope: str):
+        rule_id = self._roots.get(scope)
+        if rule_id is None:
+            external = self._registry_grammar(scope)
+            if external is None:
+                return None
+            rule = _Rule(len(self.rules), "list", {"patterns": external.get("patterns", [])}, scope)
+            self.rules.append(rule)
+            rule_id = self._roots[scope] = rule.id
+        return self.rules[rule_id]
+
+    def _repository_of(self, owner: str) -> dict:
+        if owner == self.scope_name:
+            return self.repository
+        return self.registry[owner].get("repository", {})
+
+    def _resolve_include(self, include: str, owner: str):
+        if include == "$base":
+            return self.rules[ROOT_RULE_ID]
+        if include in ("$self", "#self"):
+            return self.rules[self._roots[owner]]
+        if include.startswith("#"):
+            raw = self._repository_of(owner).get(include[1:])
+            if raw is None:
+                return None
+            return self._rule_for(raw, owner)
+        if include == self.scope_name:
+            return self.rules[ROOT_RULE_ID]
+        scope, _, fragment = include.partition("#")
+        root = self._external_root(scope)
+        if root is None or not fragment:
+            return root  # Unknown external grammars are ignored
+        raw = self._repository_of(scope).get(fragment)
+        return self._rule_for(raw, scope) if raw is not None else None
+
+    def _patterns_of(self, rule):
+        if rule.patterns is None:
+            resolved = []
+            for raw in rule.raw_patterns:
+                if "include" in raw:
+                    target = self._resolve_include(raw["include"], rule.owner)
+                else:
+                    target = self._rule_for(raw, rule.owner)
+                if target is not None:
+                    resolved.append(target.id)
+            rule.patterns = resolved
+        return rule.patterns
+
+    def _candidates(self, rule, seen=None):
+        """Flattens included pattern lists into leaf match/begin rules."""
+        if seen is None:
+            seen = set()
+        result = []
+        for rule_id in self._patterns_of(rule):
+            if rule_id in seen:
+                continue
+            child = self.rules[rule_id]
+            if child.kind == "list":
+                seen.add(rule_id)
+                result.extend(self._candidates(child, seen))
+            elif child.kind == "match" and child.match is not None:
+                result.append(("match", child.id, child.match))
+            elif child.kind == "begin" and child.begin is not None and child.end is not None:
+                result.append(("begin", child.id, child.begin))
+        return result
+
+    def _scanner(self, context_id):
+        scanner = self._scanners.get(context_id)
+        if scanner is None:
+            with self._lock:
+                scanner = self._scanners.get(context_id)
+                if scanner is None:
+                    rule = self.rules[context_id]
+                    alternatives = self._candidates(rule)
+                    if rule.kind == "begin":
+                        end = ("end", rule.id, rule.end)
+                        if rule.apply_end_last:
+                            alternatives.append(end)
+                        else:
+                            alternatives.insert(0, end)
+                    scanner = _Scanner(alternatives)
+                    self._scanners[context_id] = scanner
+        return scanner
+
+    # -- state serialization ----------------------------------------------
+
+    def rule_key(self, rule_id: int) -> str:
+        """
+        Returns a key for a rule that stays valid across processes.
+
+        Rule ids depend on the order in which rules were first used, so states that
+        outlive the Grammar are stored as keys: the scopeName for a grammar's root
+        rule, otherwise "<scopeName>#<JSON pointer to the rule in that grammar>".
+        """
+        for scope, root_id in self._roots.items():
+            if root_id == rule_id:
+                return scope
+        rule = self.rules[rule_id]
+        raw_id = self._raw_ids[rule_id]
+        owner_raw = self.raw if rule.owner == self.scope_name else self.registry[rule.owner]
+        pointers = self._pointers.get(rule.owner)
+        if pointers is None:
+            pointers = self._pointers[rule.owner] = {}
+            _index_pointers(owner_raw, "", pointers)
+        return f"{rule.owner}#{pointers[raw_id]}"
+
+    def rule_for_key(self, key: str):
+        """Returns the rule id for a rule_key(), or None if the grammar has no such rule."""
+        scope, _, pointer = key.partition("#")
+        if not pointer:
+            if scope == self.scope_name:
+                return ROOT_RULE_ID
+            root = self._external_root(scope)
+            return root.id if root is not None else None
+        if scope != self.scope_name and self._external_root(scope) is None:
+            return None
+        node = self.raw if scope == self.scope_name else self.registry[scope]
+        for part in pointer.split("/")[1:]:
+            part = part.replace("~1", "/").replace("~0", "~")
+            try:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            except (KeyError, IndexError, ValueError, TypeError):
+                return None
+        return self._rule_for(node, scope).id if isinstance(node, dict) else None
+
+    def state_keys(self, state: tuple) -> tuple:
+        """Converts a tokenizer state into rule keys, see rule_key()."""
+        return tuple(self.rule_key(rule_id) for rule_id in state)
+
+    def state_from_keys(self, keys) -> tuple:
+        """Converts state_keys() back into a state of this Grammar; None if a rule no longer exists."""
+        state = tuple(self.rule_for_key(key) for key in keys)
+        return None if None in state else state
+
+    # -- scopes -----------------------------------------------------------
+
+    def scopes_for_state(self, state: tuple, content: bool = True) -> tuple:
+        """Returns the scope stack for text inside the given state."""
+        key = (state, content)
+        scopes = self._scope_cache.get(key)
+        if scopes is None:
+            names = [self.scope_name]
+            for depth, rule_id in enumerate(state):
+                rule = self.rules[rule_id]
+                if rule.name:
+                    names.append(rule.name)
+                if rule.content_name and (content or depth < len(state) - 1):
+                    names.append(rule.content_name)
+            scopes = tuple(names)
+            self._scope_cache[key] = scopes
+        return scopes
+
+    def _intern(self, scopes: tuple) -> tuple:
+        return self._interned_scopes.setdefault(scopes, scopes)
+
+    # -- tokenization -----------------------------------------------------
+
+    def _emit_match(self, tokens, m, offset, base_scopes, captures, limit):
+        start, end = m.start(offset), m.end(offset)
+        if not captures:
+            if min(end, limit) > start:
+                tokens.append((start, min(end, limit), base_scopes))
+            return
+        # Split the matched region at every capture boundary and nest capture scopes.
+        groups = []
+        for key, capture in captures.items():
+            name = capture.get("name") if isinstance(capture, dict) else None
+            if not name or not key.isdigit():
+                continue
+            group = offset + int(key)
+            if group > m.re.groups:
+                continue
+            g_start, g_end = m.span(group)
+            if g_start < 0 or g_end <= g_start:
+                continue
+            groups.append((g_start, -g_end, name))
+        groups.sort()
+        boundaries = sorted({start, end, *(g[0] for g in groups), *(-g[1] for g in groups)})
+        for seg_start, seg_end in zip(boundaries, boundaries[1:]):
+            if seg_start >= limit:
+                break
+            scopes = base_scopes
+            for g_start, neg_end, name in groups:
+                if g_start <= seg_start and -neg_end >= seg_end:
+                    scopes = scopes + (name,)
+            tokens.append((seg_start, min(seg_end, limit), self._intern(scopes)))
+
+    def tokenize_line(self, line: str, state: tuple = ()):
+        """
+        Tokenizes a single line.
+
+        Args:
+            line: The line text, without its trailing newline.
+            state: The tokenizer state at the start of the line (() for the first line).
+
+        Returns:
+            A tuple (tokens, end_state) where tokens is a list of
+            (start, end, scopes) tuples covering the whole line.
+        """
+        text = line + "\n"
+        limit = len(line)
+        stack = list(state)
+        tokens = []
+        pos = 0
+        last_empty = -1
+        while pos <= limit:
+            context = stack[-1] if stack else ROOT_RULE_ID
+            found = self._scanner(context).search(text, pos)
+            if found is None:
+                break
+            kind, rule_id, m, offset = found
+            start, end = m.start(offset), m.end(offset)
+            if start > limit:
+                break
+            if start > pos:
+                tokens.append((pos, start, self.scopes_for_state(tuple(stack))))
+            rule = self.rules[rule_id]
+            if kind == "end":
+                scopes = self.scopes_for_state(tuple(stack), content=False)
+                self._emit_match(tokens, m, offset, scopes, rule.end_captures, limit)
+                stack.pop()
+            elif kind == "match":
+                scopes = self.scopes_for_state(tuple(stack))
+                if rule.name:
+                    scopes = self._intern(scopes + (rule.name,))
+                self._emit_match(tokens, m, offset, scopes, rule.captures, limit)
+            else:
+                stack.append(rule_id)
+                scopes = self.scopes_for_state(tuple(stack), content=False)
+                self._emit_match(tokens, m, offset, scopes, rule.begin_captures, limit)
+            if end == start:
+                # Guard against rules that match the empty string forever.
+                if start == last_empty:
+                    if start < limit:
+                        tokens.append((start, start + 1, self.scopes_for_state(tuple(stack))))
+                    end = start + 1
+                last_empty = start
+            pos = end
+        if pos < limit:
+            tokens.append((pos, limit, self.scopes_for_state(tuple(stack))))
+        return tokens, tuple(stack)
+
+    def tokenize_lines(self, lines, state: tuple = ()):
+        """Yields (tokens, end_state) for each line of an iterable of lines."""
+        for line in lines:
+            tokens, state = self.tokenize_line(line, state)
+            yield tokens, state
+
+
+    # -- state skipping ---------------------------------------------------
+
+    def _transitions_for(self, context_id):
+        transitions = self._transitions.get(context_id)
+        if transitions is None:
+            alternatives = self._scanner(context_id).alternatives
+            with self._lock:
+                transitions = self._transitions.get(context_id)
+                if transitions is None:
+                    transitions = _Transitions([regex for kind, _, regex in alternatives if kind != "match"])
+                    self._transitions[context_id] = transitions
+        return transitions
+
+    def advance(self, text: str, state: tuple = ()):
+        """
+        Returns the state at the end of a block of lines, as tokenize_lines() would.
+
+        text holds whole lines, each ending with "\n". Only the lines where a begin or
+        end rule of the current context matches are tokenized; the others keep the
+        state, so skipping over code without comments or strings costs one regex
+        search per block rather than a tokenizer pass per line.
+
+        Returns:
+            A tuple (end_state, tokenized_lines).
+        """
+        pos = tokenized = 0
+        while pos < len(text):
+            pos = self._transitions_for(state[-1] if state else ROOT_RULE_ID).search(text, pos)
+            if pos < 0:
+                break
+            end = text.index("\n", pos)
+            _, state = self.tokenize_line(text[pos:end], state)
+            tokenized += 1
+            pos = end + 1
+        return state, tokenized
+
+
+def _index_pointers(node, pointer: str, pointers: dict):
+    """Records the JSON pointer of every dict under node, by id()."""
+    if isinstance(node, dict):
+        pointers.setdefault(id(node), pointer)
+        for key, value in node.items():
+            _index_pointers(value, f"{pointer}/{key.replace('~', '~0').replace('/', '~1')}", pointers)
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            _index_pointers(value, f"{pointer}/{index}", pointers)
+
+
+def _index_uncompiled(node, pointer: str, pointers: list):
+    """Records the JSON pointer of every rule regex under node that does not compile."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            child = f"{pointer}/{key.replace('~', '~0').replace('/', '~1')}"
+            if key in ("match", "begin", "end") and isinstance(value, str):
+                if _compile(value) is None:
+                    pointers.append(child)
+            else:
+                _index_uncompiled(value, child, pointers)
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            _index_uncompiled(value, f"{pointer}/{index}", pointers)
+
+
+def split_lines(text: str):
+    """Splits text into lines on \\n, \\r\\n and \\r, like LSP and VS Code do."""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.split("\n")
+
+
+def load_grammar(source, registry: dict = None) -> Grammar:
+    """
+    Loads a TextMate grammar for tokenization.
+
+    Args:
+        source: A Grammar, a grammar dictionary, or a path to a .tmLanguage.json file.
+        registry: Optional mapping of scopeName to grammar dictionary (or path) used to
+            resolve includes of other grammars, e.g. an embedded language.
+
+    Returns:
+        A compiled Grammar.
+    """
+    if isinstance(source, Grammar):
+        return source
+    if isinstance(source, dict):
+        return Grammar(source, registry)
+    with open(source, "r", encoding="utf-8") as f:
+        return Grammar(json.load(f), registry)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tokenize a file with a TextMate grammar and print the tokens.")
+    parser.add_argument("grammar", help="Path to the .tmLanguage.json grammar")
+    parser.add_argument("source", help="Path to the file to tokenize")
+    args = parser.parse_args()
+
+    grammar = load_grammar(args.grammar)
+    with open(args.source, "r", encoding="utf-8") as f:
+        source_lines = split_lines(f.read())
+    for line_number, (line_tokens, _) in enumerate(grammar.tokenize_lines(source_lines)):
+        line_text = source_lines[line_number]
+        for tok_start, tok_end, tok_scopes in line_tokens:
+            print(f"{line_number + 1}:{tok_start}-{tok_end} {line_text[tok_start:tok_end]!r} {' '.join(tok_scopes)}")
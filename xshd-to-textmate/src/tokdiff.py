@@ -0,0 +1,224 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .textmate_tokenizer import load_grammar, split_lines
+
+# Differential tokenization: tokenizes a corpus with two versions of a grammar and
+# reports, per file, the first token on which they disagree.
+#
+# Files are spread over a process pool; each worker compiles both grammars once, in
+# its initializer, and then tokenizes whole files with each grammar in turn, timing
+# them separately so the report also compares the grammars' throughput. Tokens are
+# compared as (start, end, scopes) triples, so two grammars are only equivalent if
+# they split every line into the same tokens with the same scopes. With
+# merge_adjacent, neighbouring tokens with equal scopes are merged first, which
+# compares what an editor would highlight rather than how the tokens are cut.
+#
+# The tokenizer disables rules whose regexes Python's `re` cannot compile (Oniguruma
+# syntax such as \h or \G), so two grammars that differ only in such rules would
+# tokenize identically. The report lists these rules for each grammar, and the
+# comparison does not count as passing while either grammar has any.
+
+DEFAULT_EXTENSIONS = (".pcsp", ".csp")
+
+_worker_grammars = None
+
+
+def _init_worker(grammar_a, grammar_b, registry=None):
+    global _worker_grammars
+    _worker_grammars = (load_grammar(grammar_a, registry), load_grammar(grammar_b, registry))
+
+
+def iter_corpus(paths, extensions=DEFAULT_EXTENSIONS):
+    """Yields the files given, and the files with one of the extensions under the directories given, sorted."""
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, _, file_names in os.walk(path):
+                found.extend(os.path.join(directory, name) for name in file_names if name.endswith(tuple(extensions)))
+            yield from sorted(found)
+        else:
+            yield path
+
+
+def _merge(tokens):
+    merged = []
+    for token in tokens:
+        if merged and merged[-1][2] == token[2] and merged[-1][1] == token[0]:
+            merged[-1] = (merged[-1][0], token[1], token[2])
+        else:
+            merged.append(token)
+    return merged
+
+
+def _tokenize(grammar, lines, merge_adjacent: bool):
+    start = time.perf_counter()
+    tokenized = [tokens for tokens, _ in grammar.tokenize_lines(lines)]
+    elapsed = time.perf_counter() - start
+    if merge_adjacent:
+        tokenized = [_merge(tokens) for tokens in tokenized]
+    return tokenized, elapsed
+
+
+def _describe(token):
+    return None if token is None else {"start": token[0], "end": token[1], "scopes": list(token[2])}
+
+
+def first_divergence(lines, tokens_a, tokens_b):
+    """
+    Returns the first token on which two tokenizations of the same lines differ, or None.
+
+    The result is a dict with the 0-based line and column, the line's text and the
+    differing tokens of each side ("a", "b"; None where one side has no more tokens).
+    """
+    for line_number, (line_a, line_b) in enumerate(zip(tokens_a, tokens_b)):
+        if line_a == line_b:
+            continue
+        for index in range(max(len(line_a), len(line_b))):
+            token_a = line_a[index] if index < len(line_a) else None
+            token_b = line_b[index] if index < len(line_b) else None
+            if token_a != token_b:
+                column = min(token[0] for token in (token_a, token_b) if token is not None)
+                return {"line": line_number, "column": column, "text": lines[line_number],
+                        "a": _describe(token_a), "b": _describe(token_b)}
+    return None
+
+
+def compare_file(path: str, merge_adjacent: bool = False) -> dict:
+    """
+    Tokenizes one file with both grammars of the worker; see compare_grammars().
+
+    Runs in a pool worker (or after _init_worker() in the calling process).
+    """
+    grammar_a, grammar_b = _worker_grammars
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return {"path": path, "error": str(e)}
+    lines = split_lines(text)
+    tokens_a, seconds_a = _tokenize(grammar_a, lines, merge_adjacent)
+    tokens_b, seconds_b = _tokenize(grammar_b, lines, merge_adjacent)
+    return {"path": path, "lines": len(lines), "bytes": len(text.encode("utf-8")),
+            "seconds_a": seconds_a, "seconds_b": seconds_b,
+            "tokens": sum(map(len, tokens_a)),
+            "divergence": first_divergence(lines, tokens_a, tokens_b)}
+
+
+def compare_grammars(grammar_a, grammar_b, paths, workers: int = None, registry: dict = None,
+                     merge_adjacent: bool = False, extensions=DEFAULT_EXTENSIONS) -> dict:
+    """
+    Tokenizes every file of a corpus with two grammars and compares the tokens.
+
+    Args:
+        grammar_a, grammar_b: Grammar dictionaries or paths to .tmLanguage.json files.
+        paths: Files and directories; directories are searched for `extensions`.
+        workers: Process pool size (default: the number of CPUs).
+        registry: Optional scopeName-to-grammar mapping for includes of other grammars,
+            shared by both sides.
+        merge_adjacent: Merge neighbouring tokens with equal scopes before comparing.
+
+    Returns:
+        A report dict with "files" (one entry per file, largest first, with lines,
+        bytes, tokens, seconds_a, seconds_b and "divergence": None or the first
+        differing token, see first_divergence(); or "error"), "skipped_rules"
+        ({"a": [...], "b": [...]}, the rules each grammar could not compile, see
+        Grammar.skipped_rules()), "summary" (counts of "files", "identical",
+        "divergent", "errors" and "skipped_rules"), "throughput" ({"a": ..., "b": ...}
+        with seconds, mb_per_second and lines_per_second summed over the workers) and
+        "wall_seconds".
+    """
+    files = sorted(iter_corpus(paths, extensions), key=lambda path: -os.path.getsize(path)
+                   if os.path.isfile(path) else 0)
+    start = time.perf_counter()
+    skipped = {side: load_grammar(grammar, registry).skipped_rules()
+               for side, grammar in (("a", grammar_a), ("b", grammar_b))}
+    results = []
+    if files:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(grammar_a, grammar_b, registry)) as pool:
+            futures = [pool.submit(compare_file, path, merge_adjacent) for path in files]
+            results = [future.result() for future in futures]
+
+    compared = [result for result in results if "error" not in result]
+    summary = {
+        "files": len(results),
+        "identical": sum(1 for result in compared if result["divergence"] is None),
+        "divergent": sum(1 for result in compared if result["divergence"] is not None),
+        "errors": len(results) - len(compared),
+        "skipped_rules": len(skipped["a"]) + len(skipped["b"]),
+    }
+    total_bytes = sum(result["bytes"] for result in compared)
+    total_lines = sum(result["lines"] for result in compared)
+    throughput = {}
+    for side in ("a", "b"):
+        seconds = sum(result[f"seconds_{side}"] for result in compared)
+        throughput[side] = {
+            "seconds": seconds,
+            "mb_per_second": total_bytes / 1_000_000 / seconds if seconds else 0.0,
+            "lines_per_second": total_lines / seconds if seconds else 0.0,
+        }
+    return {"files": results, "skipped_rules": skipped, "summary": summary, "throughput": throughput,
+            "wall_seconds": time.perf_counter() - start}
+
+
+def format_report(report: dict, names=("a", "b")) -> str:
+    """Formats a compare_grammars() report for the terminal."""
+    out = []
+    for name, side in zip(names, ("a", "b")):
+        for pointer in report["skipped_rules"][side]:
+            out.append(f"SKIPPED   {name}: {pointer} (regex not supported by the tokenizer)")
+    for result in report["files"]:
+        if "error" in result:
+            out.append(f"ERROR     {result['path']}: {result['error']}")
+            continue
+        divergence = result["divergence"]
+        if divergence is None:
+            continue
+        out.append(f"DIVERGENT {result['path']}:{divergence['line'] + 1}:{divergence['column'] + 1}")
+        out.append(f"    {divergence['text']}")
+        for name, side in zip(names, ("a", "b")):
+            token = divergence[side]
+            if token is None:
+                out.append(f"    {name}: (no token)")
+            else:
+                out.append(f"    {name}: {token['start']}-{token['end']} "
+                           f"{divergence['text'][token['start']:token['end']]!r} {' '.join(token['scopes'])}")
+    summary = report["summary"]
+    out.append(f"{summary['files']} files: {summary['identical']} identical, {summary['divergent']} divergent, "
+               f"{summary['errors']} errors, {summary['skipped_rules']} skipped rules in {report['wall_seconds']:.2f}s")
+    for name, side in zip(names, ("a", "b")):
+        speed = report["throughput"][side]
+        out.append(f"  {name}: {speed['mb_per_second']:.2f} MB/s, {speed['lines_per_second']:.0f} lines/s "
+                   f"({speed['seconds']:.2f}s tokenizing)")
+    return "\n".join(out)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Tokenize a corpus with two grammars and report the first divergent token of each file.")
+    parser.add_argument("grammar_a", help="Path to the reference .tmLanguage.json grammar")
+    parser.add_argument("grammar_b", help="Path to the grammar to compare with it")
+    parser.add_argument("corpus", nargs="+", help="Source files or directories")
+    parser.add_argument("--workers", type=int, help="Number of tokenizer processes")
+    parser.add_argument("--ext", action="append", help="File extension to collect from directories "
+                                                       f"(repeatable; default {' '.join(DEFAULT_EXTENSIONS)})")
+    parser.add_argument("--merge-adjacent", action="store_true",
+                        help="Merge neighbouring tokens with equal scopes before comparing")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    corpus_report = compare_grammars(args.grammar_a, args.grammar_b, args.corpus, workers=args.workers,
+                                     merge_adjacent=args.merge_adjacent,
+                                     extensions=tuple(args.ext) if args.ext else DEFAULT_EXTENSIONS)
+    print(format_report(corpus_report, (os.path.basename(args.grammar_a), os.path.basename(args.grammar_b))))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(corpus_report, f, indent=2)
+    corpus_summary = corpus_report["summary"]
+    sys.exit(1 if corpus_summary["divergent"] or corpus_summary["errors"] or corpus_summary["skipped_rules"] else 0)
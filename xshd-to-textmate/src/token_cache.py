@@ -0,0 +1,381 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from operator import add
+
+from .textmate_tokenizer import load_grammar, split_lines
+
+# Persistent token snapshots.
+#
+# A file's tokenization is stored in one binary file per (file content, grammar),
+# named "<sha1 of the file>-<Grammar.hash>.tok"; the grammar hash covers the
+# grammars of its registry too:
+#
+#   header        magic, version, line/token counts, table sizes, both hashes
+#   line_starts   uint32[lines + 1]  index of the first token of each line
+#   line_hashes   uint32[lines]      CRC-32 of each line's text
+#   end_states    uint32[lines]      state id at the end of each line
+#   columns       uint32[tokens]     token start, relative to its line
+#   lengths       uint32[tokens]     token length
+#   scope_ids     uint32[tokens]     scope stack id
+#   scopes        JSON list of scope stacks, by id
+#   states        JSON list of states (tuples of Grammar.rule_key()s), by id
+#
+# Snapshots are opened with mmap and the arrays are used in place through
+# memoryviews, so loading one costs the same for any file size; the two small JSON
+# tables are decoded on first use. A cache directory also remembers, per path, the
+# mtime, size and hash of the file last tokenized, so an unchanged file is not even
+# read, and a snapshot is deleted once no path refers to its content any more.
+# When a file has changed, the snapshot of its previous version is reused:
+# lines before the first changed one keep their tokens, tokenizing resumes from the
+# stored end state of the line before it, and stops as soon as a line after the
+# change is entered in the same state as in the previous version.
+
+_MAGIC = b"TKC" + (b"L" if sys.byteorder == "little" else b"B")
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIIII40s40s")
+_U32 = "I" if array("I").itemsize == 4 else "L"
+
+
+def _u32(values=()):
+    return array(_U32, values)
+
+
+def _raw(values):
+    """The bytes of a uint32 array or memoryview slice, without copying."""
+    return values.cast("B") if isinstance(values, memoryview) else values
+
+
+def file_hash(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+class TokenSnapshot:
+    """
+    The tokens of one file version, see the module comment for the format.
+
+    Snapshots loaded from the cache are backed by an mmap; call close() (or use as a
+    context manager) to release it. Freshly built snapshots hold arrays.
+
+    Attributes:
+        file_hash, grammar_hash: The content and grammar the tokens belong to.
+        line_starts, line_hashes, end_states, columns, lengths, scope_ids: The
+            uint32 arrays (array or memoryview).
+    """
+
+    def __init__(self, file_hash: str, grammar_hash: str, arrays, scopes, states, mapping=None):
+        self.file_hash = file_hash
+        self.grammar_hash = grammar_hash
+        (self.line_starts, self.line_hashes, self.end_states,
+         self.columns, self.lengths, self.scope_ids) = arrays
+        self._scopes = scopes  # List of tuples, or the raw JSON bytes until first use
+        self._states = states
+        self._mapping = mapping
+
+    @classmethod
+    def open(cls, path: str):
+        """Maps a snapshot file; returns None if it is missing or not a valid snapshot."""
+        try:
+            with open(path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, version, lines, tokens, scopes_size, states_size, content_hash, grammar = \
+                _HEADER.unpack_from(mapping)
+        except struct.error:
+            mapping.close()
+            return None
+        expected = _HEADER.size + 4 * (3 * lines + 1 + 3 * tokens) + scopes_size + states_size
+        if magic != _MAGIC or version != _VERSION or len(mapping) != expected:
+            mapping.close()
+            return None
+        view = memoryview(mapping)
+        arrays = []
+        offset = _HEADER.size
+        for count in (lines + 1, lines, lines, tokens, tokens, tokens):
+            arrays.append(view[offset:offset + 4 * count].cast(_U32))
+            offset += 4 * count
+        scopes = view[offset:offset + scopes_size]
+        states = view[offset + scopes_size:offset + scopes_size + states_size]
+        return cls(content_hash.decode(), grammar.decode(), arrays, scopes, states, mapping)
+
+    def write(self, path: str):
+        """Writes the snapshot to path atomically."""
+        scopes = json.dumps(self.scopes, separators=(",", ":")).encode("utf-8")
+        states = json.dumps(self.states, separators=(",", ":")).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.line_count, len(self.columns), len(scopes), len(states),
+                                 self.file_hash.encode(), self.grammar_hash.encode()))
+            for values in (self.line_starts, self.line_hashes, self.end_states,
+                           self.columns, self.lengths, self.scope_ids):
+                f.write(values if isinstance(values, memoryview) else values.tobytes())
+            f.write(scopes)
+            f.write(states)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if self._mapping is not None:
+            for values in (self.line_starts, self.line_hashes, self.end_states,
+                           self.columns, self.lengths, self.scope_ids):
+                values.release()
+            if isinstance(self._scopes, memoryview):
+                self._scopes.release()
+            if isinstance(self._states, memoryview):
+                self._states.release()
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_hashes)
+
+    @property
+    def scopes(self) -> list:
+        """Scope stacks by id."""
+        if not isinstance(self._scopes, list):
+            self._scopes = [tuple(scopes) for scopes in json.loads(bytes(self._scopes))]
+        return self._scopes
+
+    @property
+    def states(self) -> list:
+        """End states by id, as tuples of Grammar.rule_key()s."""
+        if not isinstance(self._states, list):
+            self._states = [tuple(state) for state in json.loads(bytes(self._states))]
+        return self._states
+
+    def line_tokens(self, line: int) -> list:
+        """The (start, end, scopes) tokens of a 0-based line, as Grammar.tokenize_line() returns them."""
+        scopes = self.scopes
+        first, last = self.line_starts[line], self.line_starts[line + 1]
+        return [(column, column + length, scopes[scope_id]) for column, length, scope_id in
+                zip(self.columns[first:last], self.lengths[first:last], self.scope_ids[first:last])]
+
+    def end_state_keys(self, line: int) -> tuple:
+        """The state at the end of a line, as rule keys; () before the first line."""
+        return self.states[self.end_states[line]] if line >= 0 else ()
+
+
+class _Builder:
+    """Collects the tokens of a new snapshot, continuing the tables of a previous one."""
+
+    def __init__(self, grammar, previous: TokenSnapshot = None):
+        self.grammar = grammar
+        self.scopes = list(previous.scopes) if previous else []
+        self.states = list(previous.states) if previous else []
+        self.scope_ids = {scopes: index for index, scopes in enumerate(self.scopes)}
+        self.state_ids = {state: index for index, state in enumerate(self.states)}
+        self._runtime_state_ids = {}  # Grammar state -> state id, saving the key conversion
+        self.arrays = [_u32([0]), _u32(), _u32(), _u32(), _u32(), _u32()]
+
+    def _intern(self, table, ids, value) -> int:
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    def add_line(self, line: str, tokens: list, end_state: tuple):
+        line_starts, line_hashes, end_states, columns, lengths, scope_ids = self.arrays
+        for start, end, scopes in tokens:
+            columns.append(start)
+            lengths.append(end - start)
+            scope_ids.append(self._intern(self.scopes, self.scope_ids, scopes))
+        line_starts.append(len(columns))
+        line_hashes.append(zlib.crc32(line.encode("utf-8")))
+        state_id = self._runtime_state_ids.get(end_state)
+        if state_id is None:
+            keys = self.grammar.state_keys(end_state)
+            state_id = self._runtime_state_ids[end_state] = self._intern(self.states, self.state_ids, keys)
+        end_states.append(state_id)
+
+    def copy_lines(self, snapshot: TokenSnapshot, first: int, last: int):
+        """Appends lines [first, last) of a snapshot whose tables this builder continues."""
+        line_starts, line_hashes, end_states, columns, lengths, scope_ids = self.arrays
+        token_first, token_last = snapshot.line_starts[first], snapshot.line_starts[last]
+        line_starts.extend(map(add, snapshot.line_starts[first + 1:last + 1],
+                               [len(columns) - token_first] * (last - first)))
+        line_hashes.frombytes(_raw(snapshot.line_hashes[first:last]))
+        end_states.frombytes(_raw(snapshot.end_states[first:last]))
+        columns.frombytes(_raw(snapshot.columns[token_first:token_last]))
+        lengths.frombytes(_raw(snapshot.lengths[token_first:token_last]))
+        scope_ids.frombytes(_raw(snapshot.scope_ids[token_first:token_last]))
+
+    def snapshot(self, content_hash: str) -> TokenSnapshot:
+        return TokenSnapshot(content_hash, self.grammar.hash, self.arrays, self.scopes, self.states)
+
+
+def tokenize_snapshot(grammar, text: str, content_hash: str = None, previous: TokenSnapshot = None):
+    """
+    Tokenizes text into a snapshot, reusing an earlier snapshot of another version of it.
+
+    Lines are compared with the previous snapshot by CRC-32. The lines before the
+    first changed one are copied; tokenizing resumes from the stored state before it
+    and stops at the first unchanged line after the change that is entered in the
+    state it was entered in before, from where the previous snapshot is copied again.
+
+    Returns:
+        (snapshot, tokenized): the new TokenSnapshot and the number of lines tokenized.
+    """
+    grammar = load_grammar(grammar)
+    lines = split_lines(text)
+    content_hash = content_hash or file_hash(text.encode("utf-8"))
+    if previous is not None and previous.grammar_hash != grammar.hash:
+        previous = None
+    builder = _Builder(grammar, previous)
+
+    prefix = suffix = 0
+    old_count = previous.line_count if previous else 0
+    if previous is not None:
+        hashes = [zlib.crc32(line.encode("utf-8")) for line in lines]
+        limit = min(old_count, len(lines))
+        while prefix < limit and hashes[prefix] == previous.line_hashes[prefix]:
+            prefix += 1
+        while suffix < limit - prefix and hashes[-1 - suffix] == previous.line_hashes[old_count - 1 - suffix]:
+            suffix += 1
+        builder.copy_lines(previous, 0, prefix)
+
+    state = ()
+    if prefix:
+        state = grammar.state_from_keys(previous.end_state_keys(prefix - 1))
+    resumed = 0
+    shift = old_count - len(lines)
+    index = prefix
+    while index < len(lines):
+        if state is None:  # A stored state names a rule the grammar no longer has
+            return tokenize_snapshot(grammar, text, content_hash)
+        if index >= len(lines) - suffix and previous.end_state_keys(index + shift - 1) == grammar.state_keys(state):
+            builder.copy_lines(previous, index + shift, old_count)
+            break
+        tokens, end_state = grammar.tokenize_line(lines[index], state)
+        builder.add_line(lines[index], tokens, end_state)
+        state = end_state
+        resumed += 1
+        index += 1
+    return builder.snapshot(content_hash), resumed
+
+
+class TokenCache:
+    """
+    A directory of token snapshots for one grammar.
+
+    Args:
+        cache_dir: Directory holding the snapshots (created if missing).
+        grammar: A Grammar, a grammar dictionary or a path to a .tmLanguage.json file.
+    """
+
+    def __init__(self, cache_dir: str, grammar):
+        self.cache_dir = cache_dir
+        self.grammar = load_grammar(grammar)
+        self.grammar_hash = self.grammar.hash  # Covers the registry grammars as well
+        self.stats = {"hits": 0, "misses": 0, "tokenized_lines": 0, "reused_lines": 0}
+        os.makedirs(os.path.join(cache_dir, "paths"), exist_ok=True)
+
+    def _snapshot_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}-{self.grammar_hash}.tok")
+
+    def _entry_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, "paths", hashlib.sha1(path.encode("utf-8")).hexdigest())
+
+    def _read_entry(self, entry_path: str):
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                mtime_ns, size, content_hash = f.read().split()
+            return int(mtime_ns), int(size), content_hash
+        except (OSError, ValueError):
+            return None
+
+    def _is_referenced(self, content_hash: str) -> bool:
+        """Whether any path entry still points at the snapshot of content_hash."""
+        entries_dir = os.path.join(self.cache_dir, "paths")
+        for name in os.listdir(entries_dir):
+            entry = self._read_entry(os.path.join(entries_dir, name))
+            if entry is not None and entry[2] == content_hash:
+                return True
+        return False
+
+    def tokens(self, path: str) -> TokenSnapshot:
+        """
+        Returns the snapshot of a file's current content, tokenizing it on a miss.
+
+        A file whose mtime and size match the last call is not read; otherwise its
+        hash selects the snapshot. Misses reuse the snapshot of the version seen last
+        time, see tokenize_snapshot(). The caller should close() the snapshot.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self._read_entry(self._entry_path(path))
+        content = None
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            content_hash = entry[2]
+        else:
+            with open(path, "rb") as f:
+                content = f.read()
+            content_hash = file_hash(content)
+
+        snapshot = TokenSnapshot.open(self._snapshot_path(content_hash))
+        if snapshot is not None:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            if content is None:
+                with open(path, "rb") as f:
+                    content = f.read()
+                content_hash = file_hash(content)
+            previous = TokenSnapshot.open(self._snapshot_path(entry[2])) if entry is not None else None
+            try:
+                snapshot, tokenized = tokenize_snapshot(self.grammar, content.decode("utf-8-sig", errors="replace"),
+                                                        content_hash, previous)
+                snapshot.write(self._snapshot_path(content_hash))
+            finally:
+                if previous is not None:
+                    previous.close()
+            self.stats["tokenized_lines"] += tokenized
+            self.stats["reused_lines"] += snapshot.line_count - tokenized
+
+        if entry is None or entry != (stat.st_mtime_ns, stat.st_size, content_hash):
+            tmp_path = f"{self._entry_path(path)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"{stat.st_mtime_ns} {stat.st_size} {content_hash}")
+            os.replace(tmp_path, self._entry_path(path))
+            # The previous version's snapshot goes once no other path has that content
+            if entry is not None and entry[2] != content_hash and not self._is_referenced(entry[2]):
+                try:
+                    os.remove(self._snapshot_path(entry[2]))
+                except OSError:
+                    pass
+        return snapshot
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Tokenize files through a persistent token cache.")
+    parser.add_argument("grammar", help="Path to the .tmLanguage.json grammar")
+    parser.add_argument("sources", nargs="+", help="Files to tokenize")
+    parser.add_argument("--cache-dir", default=".token-cache", help="Snapshot directory (default: .token-cache)")
+    args = parser.parse_args()
+
+    cache = TokenCache(args.cache_dir, args.grammar)
+    for source in args.sources:
+        before = dict(cache.stats)
+        started = time.perf_counter()
+        with cache.tokens(source) as source_snapshot:
+            elapsed = time.perf_counter() - started
+            outcome = "hit" if cache.stats["hits"] > before["hits"] else (
+                f"miss, {cache.stats['tokenized_lines'] - before['tokenized_lines']} lines tokenized")
+            print(f"{source}: {source_snapshot.line_count} lines, {len(source_snapshot.columns)} tokens "
+                  f"({outcome}) in {elapsed * 1000:.2f} ms")
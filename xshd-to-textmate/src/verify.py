@@ -0,0 +1,279 @@
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .span_scanner import SpanScanner
+from .symbol_index import SourceLexicon
+
+# Per-assertion verification of PCSP models.
+#
+# A model checker run verifies every #assert of a model one after another. Here each
+# assertion found through the XSHD Assertion span gets its own derived model, in which
+# every other assertion is blanked out, and the derived models are checked concurrently
+# on a process pool. Blanking keeps every line and column in place, so positions in
+# checker output still refer to the original model. Derived models are written to
+# another directory, so their relative #include paths are made absolute first.
+
+# The command used by the VS Code extension's pcsp.checkSyntax, as a template
+DEFAULT_CHECKER = 'PAT3.Console.exe -pcsp {model} {output}'
+
+Assertion = namedtuple("Assertion", ["index", "start", "end", "line", "text"])
+
+# "The Assertion (P() deadlockfree) is VALID." / "... is NOT valid."
+_VERDICT = re.compile(r"\bis\s+(NOT\s+)?VALID\b", re.I)
+# "... with Probability [0.25, 0.5]" or "with Probability 0.25"
+_PROBABILITY = re.compile(r"with\s+Probability\s*\[?\s*([0-9.eE+-]+)(?:\s*,\s*([0-9.eE+-]+))?", re.I)
+# '#include "model.csp";' with the path in group 2
+_INCLUDE = re.compile(r'^([ \t]*#include[ \t]*")([^"\n]+)(")', re.M)
+
+
+def find_assertions(text: str, xshd_data: dict, lexicon: SourceLexicon = None) -> list:
+    """
+    Finds the assertions of a model using the XSHD span that switches to the assertion RuleSet.
+
+    Assertions inside comments and strings are ignored. Each assertion runs from its
+    leading "#" to the span's end delimiter, inclusive. Pass `lexicon` to reuse a
+    SourceLexicon already built from xshd_data.
+
+    Returns:
+        A list of Assertion(index, start, end, line, text) with 0-based lines.
+    """
+    lexicon = lexicon or SourceLexicon(xshd_data)
+    begins = {begin: end for begin, (kind, end) in lexicon.regions.items() if kind == "assertion"}
+    assertions = []
+    open_assertion = None  # (start offset, end delimiter)
+    depth = 0
+    for match in lexicon.pattern.finditer(text):
+        kind = match.lastgroup
+        value = match.group()
+        if open_assertion is None:
+            if kind == "ident" and value in begins:
+                start = match.start()
+                hash_index = text.rfind("#", 0, start)
+                if hash_index >= 0 and not text[hash_index + 1:start].strip():
+                    start = hash_index
+                open_assertion = (start, begins[value])
+                depth = 0
+            continue
+        if kind != "op":
+            continue
+        if value in ("(", "[", "{"):
+            depth += 1
+        elif value in (")", "]", "}"):
+            depth = max(0, depth - 1)
+        elif value == open_assertion[1] and depth == 0:
+            start, end = open_assertion[0], match.end()
+            assertions.append(Assertion(len(assertions), start, end, text.count("\n", 0, start),
+                                        " ".join(text[start:end].split())))
+            open_assertion = None
+    return assertions
+
+
+def resolve_includes(text: str, base_dir: str, comments: SpanScanner) -> tuple:
+    """
+    Rewrites the relative #include paths of a model to absolute ones.
+
+    Args:
+        text: The model.
+        base_dir: Directory the relative paths are resolved against, usually the model's own.
+        comments: SpanScanner over the comment spans; includes inside comments are kept as they are.
+
+    Returns:
+        A tuple (text, absolute paths of the included files, in order).
+    """
+    masked = "".join(comments.mask([text]))
+    parts = []
+    paths = []
+    position = 0
+    for match in _INCLUDE.finditer(masked):
+        path = os.path.normpath(os.path.join(base_dir, match.group(2)))
+        parts.append(text[position:match.start(2)])
+        parts.append(path)
+        position = match.end(2)
+        paths.append(path)
+    parts.append(text[position:])
+    return "".join(parts), paths
+
+
+def _blank(segment: str) -> str:
+    return re.sub(r"[^\n]", " ", segment)
+
+
+def derive_model(text: str, assertions: list, keep: int) -> str:
+    """Returns the model with every assertion except assertions[keep] replaced by whitespace."""
+    parts = []
+    position = 0
+    for assertion in assertions:
+        parts.append(text[position:assertion.start])
+        segment = text[assertion.start:assertion.end]
+        parts.append(segment if assertion.index == keep else _blank(segment))
+        position = assertion.end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def parse_verdict(output: str):
+    """
+    Extracts the verdict from checker output.
+
+    Returns:
+        A tuple (verdict, probability) where verdict is "valid", "invalid" or None, and
+        probability is None, a float, or a (lower, upper) tuple of floats.
+    """
+    verdict_match = _VERDICT.search(output)
+    verdict = None
+    if verdict_match:
+        verdict = "invalid" if verdict_match.group(1) else "valid"
+    probability = None
+    probability_match = _PROBABILITY.search(output)
+    if probability_match:
+        try:
+            lower = float(probability_match.group(1))
+            upper = probability_match.group(2)
+            probability = (lower, float(upper)) if upper is not None else lower
+        except ValueError:
+            probability = None
+    return verdict, probability
+
+
+def run_checker(args: list, output_path: str, timeout: float):
+    """Runs one checker process. Executed in a worker process."""
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+        returncode, stdout, stderr = completed.returncode, completed.stdout, completed.stderr
+    except (OSError, subprocess.SubprocessError) as e:
+        returncode, stdout, stderr = None, "", str(e)
+    output = ""
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8", errors="replace") as f:
+            output = f.read()
+    return {"returncode": returncode, "stdout": stdout, "stderr": stderr, "output": output,
+            "seconds": time.perf_counter() - start}
+
+
+def checker_arguments(checker: str, model_path: str, output_path: str) -> list:
+    """Splits a checker command template and substitutes {model} and {output} in each argument."""
+    return [arg.replace("{model}", model_path).replace("{output}", output_path) for arg in shlex.split(checker)]
+
+
+def verify_model(model_path: str, xshd_data: dict, checker: str = DEFAULT_CHECKER, workers: int = None,
+                 timeout: float = None, work_dir: str = None) -> dict:
+    """
+    Verifies each assertion of a model in its own checker process.
+
+    Args:
+        model_path: The .pcsp model.
+        xshd_data: Parsed XSHD data providing the Assertion span.
+        checker: Command template; {model} and {output} are replaced by the derived
+            model and the checker's output file.
+        workers: Process pool size (default: the number of CPUs).
+        timeout: Optional per-assertion timeout in seconds.
+        work_dir: Directory for derived models and outputs (default: a temporary
+            directory removed afterwards).
+
+    Returns:
+        A report dict with "model", "wall_seconds", "summary" (counts per verdict) and
+        "assertions", one entry per assertion in model order with index, line,
+        assertion, verdict ("valid", "invalid" or "error"), probability, seconds,
+        returncode and the checker output.
+    """
+    with open(model_path, "r", encoding="utf-8-sig") as f:
+        text = f.read()
+    text, _ = resolve_includes(text, os.path.dirname(os.path.abspath(model_path)),
+                               SpanScanner(xshd_data, kinds=("comment",)))
+    assertions = find_assertions(text, xshd_data)
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = work_dir or tmp_dir
+        os.makedirs(target_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        jobs = []
+        for assertion in assertions:
+            derived_path = os.path.join(target_dir, f"{stem}.assert{assertion.index}.pcsp")
+            output_path = derived_path + ".patout"
+            with open(derived_path, "w", encoding="utf-8") as f:
+                f.write(derive_model(text, assertions, assertion.index))
+            jobs.append((checker_arguments(checker, derived_path, output_path), output_path))
+
+        results = []
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_checker, args, output_path, timeout) for args, output_path in jobs]
+                results = [future.result() for future in futures]
+
+    entries, summary = merge_results(assertions, results)
+    return {"model": model_path, "wall_seconds": time.perf_counter() - start, "summary": summary,
+            "assertions": entries}
+
+
+def merge_results(assertions: list, results: list):
+    """
+    Turns the checker results of assertions into report entries.
+
+    Returns:
+        A tuple (entries, summary), see verify_model().
+    """
+    entries = []
+    summary = {"valid": 0, "invalid": 0, "error": 0}
+    for assertion, result in zip(assertions, results):
+        combined = result["output"] or result["stdout"]
+        verdict, probability = parse_verdict(combined)
+        if verdict is None or result["returncode"] is None:
+            verdict = "error"  # No verdict, or the checker could not be started or timed out
+        summary[verdict] += 1
+        entries.append({
+            "index": assertion.index,
+            "line": assertion.line,
+            "assertion": assertion.text,
+            "verdict": verdict,
+            "probability": probability,
+            "seconds": result["seconds"],
+            "returncode": result["returncode"],
+            "output": combined if verdict != "error" else (combined + result["stderr"]).strip(),
+        })
+    return entries, summary
+
+
+def format_report(report: dict) -> str:
+    """Formats a verify_model() report as text, one line per assertion."""
+    lines = [f"{report['model']}: {len(report['assertions'])} assertions in {report['wall_seconds']:.2f} s "
+             f"({', '.join(f'{count} {verdict}' for verdict, count in report['summary'].items())})"]
+    for entry in report["assertions"]:
+        probability = entry["probability"]
+        if isinstance(probability, (tuple, list)):
+            probability = f" [{probability[0]:g}, {probability[1]:g}]"
+        elif probability is not None:
+            probability = f" {probability:g}"
+        lines.append(f"  line {entry['line'] + 1:>5}  {entry['verdict'].upper():<8} {entry['seconds']:7.2f} s  "
+                     f"{entry['assertion']}{probability or ''}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from .xshd_parser import load_xshd
+
+    parser = argparse.ArgumentParser(description="Verify each #assert of a PCSP model in parallel.")
+    parser.add_argument("model", help="Path to the .pcsp model")
+    parser.add_argument("--xshd", required=True, help="Path to the .xshd definition with the Assertion span")
+    parser.add_argument("--checker", default=DEFAULT_CHECKER,
+                        help=f"Checker command template with {{model}} and {{output}} (default: '{DEFAULT_CHECKER}')")
+    parser.add_argument("--workers", type=int, help="Number of concurrent checker processes")
+    parser.add_argument("--timeout", type=float, help="Per-assertion timeout in seconds")
+    parser.add_argument("--json", metavar="PATH", help="Also write the merged report as JSON")
+    args = parser.parse_args()
+
+    merged = verify_model(args.model, load_xshd(args.xshd), args.checker, args.workers, args.timeout)
+    print(format_report(merged))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2)
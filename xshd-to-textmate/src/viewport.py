@@ -0,0 +1,201 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from itertools import accumulate
+from operator import add
+
+from .textmate_tokenizer import load_grammar, split_lines
+
+# Tokenizing only the lines on screen of very large files.
+#
+# LineIndex memory-maps a file and records the byte offset of every line start. The
+# scan runs over large chunks with bytes.split() and itertools.accumulate(), so the
+# per-line work happens in C (files with \r line endings take a regex pass instead).
+# Only the lines asked for are decoded.
+#
+# ViewportTokenizer needs the tokenizer state at the first line of a viewport. States
+# are kept at checkpoints every `interval` lines, computed only as far down as a
+# request needs, plus the state after the last viewport, so scrolling continues from
+# there. Between a checkpoint and the viewport, Grammar.advance() tokenizes only the
+# lines on which a begin or end rule can match, and the tokens of the viewport itself
+# are identical to those of tokenizing the whole file.
+
+DEFAULT_INTERVAL = 4096
+SCAN_CHUNK_SIZE = 16 * 1024 * 1024
+_BOM = b"\xef\xbb\xbf"
+_NEWLINE = re.compile(rb"\r\n?|\n")
+
+
+class LineIndex:
+    """
+    The line start offsets of a memory-mapped file.
+
+    Lines end at \\n, \\r\\n or \\r, as in split_lines(); a UTF-8 byte order mark is
+    skipped. Use as a context manager, or call close(), to release the mapping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.size = size
+        self.starts = self._scan()
+
+    def _scan(self) -> array:
+        data, size = self.data, self.size
+        starts = array("q", [len(_BOM) if data[:len(_BOM)] == _BOM else 0])
+        carriage_returns = data.find(b"\r") >= 0
+        chunk_start = 0
+        while chunk_start < size:
+            chunk_end = min(size, chunk_start + SCAN_CHUNK_SIZE)
+            if data[chunk_end - 1:chunk_end] == b"\r":
+                chunk_end += chunk_end < size  # Keep a \r\n in one chunk
+            chunk = data[chunk_start:chunk_end]
+            if carriage_returns:
+                starts.extend(chunk_start + m.end() for m in _NEWLINE.finditer(chunk))
+            else:
+                # The k-th line of the chunk starts after k newlines and the pieces before them
+                pieces = chunk.split(b"\n")[:-1]
+                starts.extend(map(add, accumulate(map(len, pieces)),
+                                  range(chunk_start + 1, chunk_start + len(pieces) + 1)))
+            chunk_start = chunk_end
+        return starts
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def text(self, start: int, stop: int) -> str:
+        """The lines start..stop - 1 as one string, each line ending with "\\n"."""
+        stop = min(stop, len(self.starts))
+        if start >= stop:
+            return ""
+        end = self.starts[stop] if stop < len(self.starts) else self.size
+        text = self.data[self.starts[start]:end].decode("utf-8", errors="replace")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text if stop < len(self.starts) else text + "\n"
+
+    def lines(self, start: int, stop: int) -> list:
+        """The lines start..stop - 1, without their line endings."""
+        return split_lines(self.text(start, stop))[:-1]
+
+
+class ViewportTokenizer:
+    """
+    Tokenizes ranges of lines of a large file on demand.
+
+    Args:
+        grammar: A Grammar, grammar dictionary or path to a .tmLanguage.json file.
+        path: The source file; it is memory-mapped, not read.
+        registry: Optional scopeName-to-grammar mapping for includes of other grammars.
+        interval: Lines between state checkpoints.
+
+    Attributes:
+        stats: Counts of "tokenized_lines" (to find states, and in viewports) and
+            "skipped_lines" (whose state was carried over without tokenizing them).
+    """
+
+    def __init__(self, grammar, path: str, registry: dict = None, interval: int = DEFAULT_INTERVAL):
+        self.grammar = load_grammar(grammar, registry)
+        self.index = LineIndex(path)
+        self.interval = interval
+        self._checkpoints = [()]  # State at the start of line k * interval
+        self._cursor = (0, ())  # (line, state) after the last viewport
+        self._lock = threading.Lock()
+        self.stats = {"tokenized_lines": 0, "skipped_lines": 0}
+
+    def __len__(self) -> int:
+        """The number of lines."""
+        return len(self.index)
+
+    def close(self):
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _advance(self, start: int, stop: int, state: tuple) -> tuple:
+        state, tokenized = self.grammar.advance(self.index.text(start, stop), state)
+        self.stats["tokenized_lines"] += tokenized
+        self.stats["skipped_lines"] += stop - start - tokenized
+        return state
+
+    def state_at(self, line: int) -> tuple:
+        """The tokenizer state at the start of a line, from the nearest known state above it."""
+        line = max(0, min(line, len(self.index)))
+        with self._lock:
+            return self._state_at(line)
+
+    def _state_at(self, line: int) -> tuple:
+        checkpoints, interval = self._checkpoints, self.interval
+        while len(checkpoints) <= line // interval:
+            start = (len(checkpoints) - 1) * interval
+            checkpoints.append(self._advance(start, start + interval, checkpoints[-1]))
+        start, state = (line // interval) * interval, checkpoints[line // interval]
+        if start <= self._cursor[0] <= line:
+            start, state = self._cursor
+        return self._advance(start, line, state)
+
+    def tokenize(self, start: int, stop: int) -> list:
+        """
+        Tokenizes the lines start..stop - 1 (clamped to the file).
+
+        Returns:
+            One list of (start, end, scopes) tokens per line, as Grammar.tokenize_line()
+            returns them when the whole file is tokenized from the top.
+        """
+        stop = max(0, min(stop, len(self.index)))
+        start = max(0, min(start, stop))
+        with self._lock:
+            state = self._state_at(start)
+            result = []
+            for line in self.index.lines(start, stop):
+                tokens, state = self.grammar.tokenize_line(line, state)
+                result.append(tokens)
+            self.stats["tokenized_lines"] += stop - start
+            self._cursor = (stop, state)
+        return result
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Tokenize a range of lines of a large file.")
+    parser.add_argument("grammar", help="Path to the .tmLanguage.json grammar")
+    parser.add_argument("source", help="Path to the file to tokenize")
+    parser.add_argument("--lines", default="1:50", metavar="FIRST:LAST",
+                        help="1-based, inclusive range of lines to tokenize (default 1:50)")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="Lines between state checkpoints")
+    args = parser.parse_args()
+
+    first, _, last = args.lines.partition(":")
+    began = time.perf_counter()
+    with ViewportTokenizer(args.grammar, args.source, interval=args.interval) as viewport:
+        indexed = time.perf_counter()
+        first_line = int(first) - 1
+        tokenized_lines = viewport.tokenize(first_line, int(last or first))
+        painted = time.perf_counter()
+        for line_number, line_tokens in enumerate(tokenized_lines, first_line):
+            line_text = viewport.index.lines(line_number, line_number + 1)[0]
+            for tok_start, tok_end, tok_scopes in line_tokens:
+                print(f"{line_number + 1}:{tok_start}-{tok_end} {line_text[tok_start:tok_end]!r} {' '.join(tok_scopes)}")
+        print(f"{len(viewport)} lines indexed in {(indexed - began) * 1000:.1f} ms; lines {args.lines} "
+              f"tokenized in {(painted - indexed) * 1000:.1f} ms ({viewport.stats['tokenized_lines']} lines "
+              f"tokenized, {viewport.stats['skipped_lines']} skipped)")
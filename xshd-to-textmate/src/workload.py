@@ -0,0 +1,272 @@
+import os
+import random
+import xml.etree.ElementTree as ET
+
+# Synthetic XSHD definitions and PCSP sources for scaling tests.
+# Everything is driven by a seeded random.Random, so the same parameters and seed
+# always produce byte-identical output.
+
+# Shape of Examples/Syntax.xshd, as measured by xshd_shape() (totals over all
+# RuleSets), and the size of Examples/china.pcsp: the 1x reference when building
+# scaled workloads.
+BASE_RULESETS = 2
+BASE_CATEGORIES = 6
+BASE_KEYS = 94
+BASE_SPANS = 8
+BASE_NESTED_SPANS = 1
+BASE_PCSP_BYTES = 41 * 1024
+
+# generate_xshd() starts every RuleSet with comment, string and character Spans; the
+# Span switching to the next RuleSet of the nesting chain comes after them.
+_BUILTIN_SPANS = 4
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "pu", "ra", "si", "to", "vu", "ze",
+              "bar", "cor", "dex", "fin", "gal", "hop", "jun", "kin", "lum", "mor"]
+
+_COLORS = ["Blue", "Red", "Green", "DarkBlue", "Sienna", "MidnightBlue", "Purple", "Gray"]
+
+
+def xshd_shape(xshd_data: dict) -> dict:
+    """
+    Counts the RuleSets, KeyWords categories, keys, Spans and nesting Spans (those with
+    a `rule` attribute) of parsed XSHD data, summed over all RuleSets.
+    """
+    rulesets = xshd_data.get("rulesets") or []
+    return {
+        "rulesets": len(rulesets),
+        "categories": sum(len(rs.get("keywords", {})) for rs in rulesets),
+        "keys": sum(len(words) for rs in rulesets for words in rs.get("keywords", {}).values()),
+        "spans": sum(len(rs.get("spans", [])) for rs in rulesets),
+        "nested_spans": sum(1 for rs in rulesets for span in rs.get("spans", []) if span.get("rule")),
+    }
+
+
+def scaled_parameters(scale: int) -> dict:
+    """
+    Returns generator parameters for a workload `scale` times the size of today's inputs.
+
+    The total number of keywords grows linearly with the scale (more categories and more
+    keys per category), RuleSets and Spans grow more slowly, as they do in real
+    definitions. Per-RuleSet counts are rounded up, so at scale 1 the workload has the
+    shape of Examples/Syntax.xshd with a few more keys and Spans, including one Span
+    that switches to a nested RuleSet.
+    """
+    scale = max(1, int(scale))
+    category_factor = max(1, int(round(scale ** 0.5)))
+    extra = scale.bit_length() - 1  # log2(scale)
+    rulesets = BASE_RULESETS + extra
+    categories = -(-BASE_CATEGORIES * category_factor // BASE_RULESETS)
+    nesting_depth = min(rulesets - 1, BASE_NESTED_SPANS + extra)
+    spans = -(-BASE_SPANS // BASE_RULESETS) + extra
+    return {
+        "rulesets": rulesets,
+        "categories": categories,
+        "keys_per_category": -(-BASE_KEYS * scale // (rulesets * categories)),
+        "spans": max(spans, _BUILTIN_SPANS + 1) if nesting_depth else spans,
+        "nesting_depth": nesting_depth,
+        "pcsp_bytes": BASE_PCSP_BYTES * scale,
+    }
+
+
+def _make_word(rng: random.Random, index: int) -> str:
+    # The index suffix keeps every generated keyword unique.
+    parts = [rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3))]
+    return "".join(parts) + str(index)
+
+
+def _add_span(ruleset_element, name, begin, end=None, rule=None, stopateol=False, escapecharacter=None, color="Black"):
+    span = ET.SubElement(ruleset_element, "Span", {
+        "name": name, "bold": "false", "italic": "false", "color": color,
+        "stopateol": "true" if stopateol else "false",
+    })
+    if rule:
+        span.set("rule", rule)
+    if escapecharacter:
+        span.set("escapecharacter", escapecharacter)
+    ET.SubElement(span, "Begin").text = begin
+    if end is not None:
+        ET.SubElement(span, "End").text = end
+    return span
+
+
+def generate_xshd(seed: int = 0, rulesets: int = 1, categories: int = 3, keys_per_category: int = 16,
+                  spans: int = 4, nesting_depth: int = 0, name: str = "Synthetic Model",
+                  extensions: str = ".pcsp") -> str:
+    """
+    Generates a valid XSHD definition.
+
+    Args:
+        seed: Seed for the random generator.
+        rulesets: Number of RuleSets. The first one is the main (unnamed) RuleSet.
+        categories: Number of KeyWords categories per RuleSet.
+        keys_per_category: Number of Key entries in each KeyWords category.
+        spans: Number of Span elements per RuleSet. The first four are the usual
+            line comment, block comment, string and character spans.
+        nesting_depth: Length of the chain of Spans whose `rule` attribute points at
+            the next RuleSet (main -> Nested1 -> Nested2 ...). Capped at rulesets - 1;
+            the chain needs spans > 4, as its Span comes after the first four.
+        name: The SyntaxDefinition name.
+        extensions: The SyntaxDefinition extensions attribute.
+
+    Returns:
+        The XSHD document as a string.
+    """
+    rng = random.Random(seed)
+    rulesets = max(1, rulesets)
+    nesting_depth = max(0, min(nesting_depth, rulesets - 1))
+
+    root = ET.Element("SyntaxDefinition", {"name": name, "extensions": extensions})
+    properties = ET.SubElement(root, "Properties")
+    ET.SubElement(properties, "Property", {"name": "LineComment", "value": "//"})
+    ET.SubElement(root, "Digits", {"name": "Digits", "bold": "false", "italic": "false", "color": "DarkBlue"})
+    rulesets_element = ET.SubElement(root, "RuleSets")
+
+    ruleset_names = [None] + [
+        f"Nested{i}RuleSet" if i <= nesting_depth else f"Extra{i}RuleSet" for i in range(1, rulesets)
+    ]
+    word_index = 0
+    for rs_index, rs_name in enumerate(ruleset_names):
+        attributes = {"ignorecase": "false"}
+        if rs_name:
+            attributes = {"name": rs_name, "ignorecase": "false"}
+        ruleset = ET.SubElement(rulesets_element, "RuleSet", attributes)
+        ET.SubElement(ruleset, "Delimiters").text = "&<>~!%^*()-+=|\\#/{}[]:;\"' ,\t.?"
+
+        builtin_spans = [
+            lambda: _add_span(ruleset, "LineComment", "//", stopateol=True, color="Green"),
+            lambda: _add_span(ruleset, "BlockComment", "/*", "*/", color="Green"),
+            lambda: _add_span(ruleset, "String", "\"", "\"", escapecharacter="\\", color="Green"),
+            lambda: _add_span(ruleset, "Character", "'", "'", stopateol=True, escapecharacter="\\", color="Sienna"),
+        ]
+        for span_index in range(spans):
+            if span_index < _BUILTIN_SPANS:
+                builtin_spans[span_index]()
+                continue
+            custom_index = span_index - len(builtin_spans)
+            rule = None
+            if custom_index == 0 and rs_index < nesting_depth:
+                rule = ruleset_names[rs_index + 1]
+            begin = f"begin{rs_index}x{custom_index}"
+            _add_span(ruleset, f"Region{rs_index}x{custom_index}", begin, ";", rule=rule,
+                      color=rng.choice(_COLORS))
+
+        for category_index in range(categories):
+            keywords = ET.SubElement(ruleset, "KeyWords", {
+                "name": f"Category{rs_index}x{category_index}", "bold": "false", "italic": "false",
+                "color": rng.choice(_COLORS),
+            })
+            for _ in range(keys_per_category):
+                ET.SubElement(keywords, "Key", {"word": _make_word(rng, word_index), "description": ""})
+                word_index += 1
+
+    ET.indent(root, space="  ")
+    return "<?xml version=\"1.0\"?>\n" + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def generate_pcsp(size_bytes: int, keywords=(), seed: int = 0) -> str:
+    """
+    Generates a syntactically plausible PCSP source of at least `size_bytes` characters.
+
+    The source mixes #define constants, variables, channels, process definitions with
+    events, pcase/case choices, comments, strings and #assert lines, in roughly the
+    proportions found in Examples/china.pcsp.
+
+    Args:
+        size_bytes: Minimum size of the generated source.
+        keywords: Keywords from an XSHD definition to sprinkle into expressions.
+        seed: Seed for the random generator.
+
+    Returns:
+        The PCSP source as a string.
+    """
+    rng = random.Random(seed)
+    keywords = list(keywords)
+    chunks = ["// Synthetic PCSP model\n\n"]
+    size = len(chunks[0])
+    constants = []
+    processes = []
+    index = 0
+
+    def word():
+        if keywords and rng.random() < 0.3:
+            return rng.choice(keywords)
+        if constants and rng.random() < 0.5:
+            return rng.choice(constants)
+        return f"x{rng.randint(0, 99)}"
+
+    while size < size_bytes:
+        kind = rng.random()
+        if kind < 0.25:
+            name = f"c{index}"
+            constants.append(name)
+            chunk = f"#define {name} {rng.randint(0, 1000)}; // constant {index}\n"
+        elif kind < 0.35:
+            chunk = f"var v{index}[{rng.randint(1, 16)}] = [{', '.join(str(rng.randint(0, 9)) for _ in range(rng.randint(1, 8)))}];\n"
+        elif kind < 0.40:
+            chunk = f"channel ch{index} {rng.randint(0, 4)};\n"
+        elif kind < 0.50:
+            chunk = f"/* block comment {index}\n   spanning \"two\" lines */\n"
+        elif kind < 0.85:
+            name = f"P{index}"
+            processes.append(name)
+            branches = "\n".join(
+                f"    {rng.randint(1, 99)} : e{rng.randint(0, 50)}{{{word()} = {word()} + 1}} -> "
+                f"{rng.choice(processes)}()"
+                for _ in range(rng.randint(1, 4))
+            )
+            chunk = f"{name}() = pcase {{\n{branches}\n}};\n\n"
+        elif kind < 0.92:
+            chunk = f"var s{index} = \"label {index} with \\\"escape\\\"\"; var ch{index} = '\\n';\n"
+        else:
+            target = rng.choice(processes) if processes else "P0"
+            chunk = rng.choice([
+                f"#assert {target}() deadlockfree;\n",
+                f"#assert {target}() reaches goal{index} with prob;\n",
+                f"#assert {target}() |= [] <> e{index};\n",
+            ])
+        chunks.append(chunk)
+        size += len(chunk)
+        index += 1
+
+    return "".join(chunks)
+
+
+def write_workload(output_dir: str, scale: int = 1, seed: int = 0):
+    """
+    Writes a scaled synthetic.xshd and synthetic.pcsp into `output_dir`.
+
+    Returns:
+        A tuple (xshd_path, pcsp_path).
+    """
+    from .xshd_parser import load_xshd
+
+    params = scaled_parameters(scale)
+    os.makedirs(output_dir, exist_ok=True)
+    xshd_path = os.path.join(output_dir, f"synthetic-{scale}x.xshd")
+    pcsp_path = os.path.join(output_dir, f"synthetic-{scale}x.pcsp")
+
+    with open(xshd_path, "w", encoding="utf-8") as f:
+        f.write(generate_xshd(seed=seed, rulesets=params["rulesets"], categories=params["categories"],
+                              keys_per_category=params["keys_per_category"], spans=params["spans"],
+                              nesting_depth=params["nesting_depth"]))
+
+    xshd_data = load_xshd(xshd_path)
+    keywords = [kw for kw_list in xshd_data["keywords"].values() for kw in kw_list]
+    with open(pcsp_path, "w", encoding="utf-8") as f:
+        f.write(generate_pcsp(params["pcsp_bytes"], keywords, seed=seed))
+    return xshd_path, pcsp_path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic XSHD and PCSP workloads for scaling tests.")
+    parser.add_argument("output_dir", help="Directory to write the generated files into")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="Workload sizes relative to Examples/Syntax.xshd and Examples/china.pcsp")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    for workload_scale in args.scale:
+        written = write_workload(args.output_dir, workload_scale, args.seed)
+        print(f"{workload_scale}x: {written[0]}, {written[1]}")
@@ -0,0 +1,249 @@
+import copy
+import hashlib
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+from .errors import XshdImportError, XshdParseError
+from .xshd_parser import _categorize_span, _deduplicate, _parse_root
+
+# Loading XSHD definitions that use RuleSets of other definitions.
+#
+# A reference names another definition file and one of its RuleSets:
+#
+#   <Span rule="Common/Comments">           a Span switching to RuleSet Comments of Common.xshd
+#   <RuleSet name="Js" reference="JavaScript"/>     a RuleSet standing for JavaScript's main RuleSet
+#   <RuleSet name="Doc"><Import ruleSet="Common/DocTags"/></RuleSet>   merging DocTags into Doc
+#
+# "Definition/" or a bare definition in reference= means its main (first) RuleSet. Files are
+# looked up as <Definition>.xshd next to the referencing file, then in the search paths.
+#
+# The loaded definition is the referencing one with every reachable foreign RuleSet
+# appended to "rulesets" under the name "<definition>/<RuleSet>" (rules of Spans in those
+# RuleSets are rewritten to match), and with their keywords, spans, comments and strings
+# merged into the top-level lists, as if they had been declared in the file itself.
+# Spans may reference each other's RuleSets in any pattern; only reference= and <Import>
+# chains that lead back to themselves are cycles.
+
+XSHD_EXTENSION = ".xshd"
+
+
+def split_reference(reference: str):
+    """Splits "Definition/RuleSet" into (definition, RuleSet or None); None for local references."""
+    if not reference or "/" not in reference:
+        return None
+    definition, _, ruleset = reference.rpartition("/")
+    return definition, ruleset or None
+
+
+class DefinitionLoader:
+    """
+    Loads XSHD definitions, resolving RuleSet references across files.
+
+    Each file is parsed once per content: parses are memoized by absolute path and the
+    SHA-1 of the file's bytes, and a file whose mtime and size are unchanged is not
+    even re-read. One loader shared by a batch conversion parses a common base file once.
+    The loader is safe to share between threads.
+
+    Args:
+        search_paths: Directories searched for referenced definitions after the
+            directory of the referencing file.
+    """
+
+    def __init__(self, search_paths=()):
+        self.search_paths = [os.path.abspath(path) for path in search_paths]
+        self.stats = {"parsed": 0, "reused": 0}
+        self._files = {}  # Absolute path -> (mtime_ns, size, sha1)
+        self._parsed = {}  # (absolute path, sha1) -> parsed definition, never modified
+        self._lock = threading.Lock()
+
+    def parse(self, path: str) -> dict:
+        """
+        Returns the memoized parse of a single file, without resolving references.
+
+        The result is shared between callers and must not be modified.
+
+        Raises:
+            XshdParseError: If the file does not exist, cannot be read or is not valid XML.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                raise XshdParseError(f"File not found at {path}", path) from None
+            except OSError as e:
+                raise XshdParseError(f"Could not read {path}: {e}", path) from e
+            known = self._files.get(path)
+            if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.stats["reused"] += 1
+                return self._parsed[(path, known[2])]
+
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except OSError as e:
+                raise XshdParseError(f"Could not read {path}: {e}", path) from e
+            digest = hashlib.sha1(content).hexdigest()
+            key = (path, digest)
+            if key in self._parsed:
+                self.stats["reused"] += 1
+            else:
+                try:
+                    root = ET.fromstring(content)
+                except ET.ParseError as e:
+                    raise XshdParseError(f"Invalid XML in file {path}: {e}", path) from e
+                self._parsed[key] = _parse_root(root)
+                self.stats["parsed"] += 1
+            self._files[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            return self._parsed[key]
+
+    def find(self, definition: str, referenced_from: str, reference: str = None) -> str:
+        """
+        Returns the absolute path of a referenced definition.
+
+        Raises:
+            XshdImportError: If no <definition>.xshd exists in the referencing file's
+                directory or the search paths.
+        """
+        name = definition if definition.lower().endswith(XSHD_EXTENSION) else definition + XSHD_EXTENSION
+        directories = [os.path.dirname(os.path.abspath(referenced_from))] + self.search_paths
+        for directory in directories:
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+        raise XshdImportError(f"Cannot find {name} referenced as {reference or definition!r} in {referenced_from} "
+                              f"(searched {', '.join(directories)})", referenced_from, reference)
+
+    def load(self, path: str) -> dict:
+        """
+        Loads a definition with every RuleSet it references, see the module comment.
+
+        Returns:
+            Parsed XSHD data like load_xshd() returns; a new dictionary on each call.
+
+        Raises:
+            XshdParseError: If a file cannot be read or parsed.
+            XshdImportError: If a reference cannot be resolved or references form a cycle.
+        """
+        path = os.path.abspath(path)
+        return _Resolution(self, path).run()
+
+
+class _Resolution:
+    """The state of one DefinitionLoader.load() call."""
+
+    def __init__(self, loader: DefinitionLoader, root: str):
+        self.loader = loader
+        self.root = root
+        self.added = set()  # Names of foreign RuleSets already appended
+        self.pending = []  # (path, RuleSet index) of referenced foreign RuleSets
+
+    def run(self) -> dict:
+        data = copy.deepcopy(self.loader.parse(self.root))
+        for index, ruleset in enumerate(data["rulesets"]):
+            self._expand(self.root, ruleset, [(self.root, index)])
+
+        while self.pending:
+            path, index = self.pending.pop(0)
+            name = self._result_name(path, index)
+            if name in self.added:
+                continue
+            self.added.add(name)
+            ruleset = copy.deepcopy(self.loader.parse(path)["rulesets"][index])
+            self._expand(path, ruleset, [(path, index)])
+            ruleset["name"] = name
+            data["rulesets"].append(ruleset)
+
+        # Rebuild the merged lists from every RuleSet, as the parser does for one file
+        data["keywords"] = {}
+        data["spans"] = []
+        data["strings"] = []
+        data["comments"] = {"line_comment_start": [], "block_comment_start": [], "block_comment_end": []}
+        for name, key in (("LineComment", "line_comment_start"), ("BlockCommentBegin", "block_comment_start"),
+                          ("BlockCommentEnd", "block_comment_end")):
+            if data["properties"].get(name):
+                data["comments"][key].append(data["properties"][name])
+        for ruleset in data["rulesets"]:
+            for category, words in ruleset["keywords"].items():
+                data["keywords"].setdefault(category, []).extend(words)
+            for span in ruleset["spans"]:
+                data["spans"].append(span)
+                _categorize_span(span, data)
+        _deduplicate(data)
+        return data
+
+    def _ruleset(self, path: str, name, reference: str, referenced_from: str):
+        """Returns the index of a RuleSet by name (None: the main RuleSet)."""
+        rulesets = self.loader.parse(path)["rulesets"]
+        if name is None and rulesets:
+            return 0
+        for index, ruleset in enumerate(rulesets):
+            if ruleset["name"] == name:
+                return index
+        raise XshdImportError(f"RuleSet {name or '(main)'!r} referenced as {reference!r} in {referenced_from} "
+                              f"does not exist in {path}", referenced_from, reference)
+
+    def _target(self, owner: str, reference: str, bare_is_definition: bool):
+        """Resolves a reference made in `owner` to (path, RuleSet index)."""
+        parts = split_reference(reference)
+        if parts is None:
+            if bare_is_definition:  # reference="Definition"
+                parts = (reference, None)
+            else:  # A RuleSet of the same file
+                return owner, self._ruleset(owner, reference, reference, owner)
+        path = self.loader.find(parts[0], owner, reference)
+        return path, self._ruleset(path, parts[1], reference, owner)
+
+    def _result_name(self, path: str, index: int):
+        """The name a RuleSet has in the loaded definition."""
+        ruleset = self.loader.parse(path)["rulesets"][index]
+        if path == self.root:
+            return ruleset["name"]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return f"{stem}/{ruleset['name'] or ''}"
+
+    def _adopt(self, owner: str, spans: list) -> list:
+        """Rewrites the rules of spans declared in `owner` to result names and schedules their RuleSets."""
+        adopted = []
+        for span in spans:
+            rule = span.get("rule")
+            if rule and (owner != self.root or split_reference(rule)):
+                try:
+                    path, index = self._target(owner, rule, bare_is_definition=False)
+                except XshdImportError:
+                    if split_reference(rule):
+                        raise
+                    path = None  # A rule naming no RuleSet, such as rule="Comment": kept as is
+                if path is not None:
+                    span = dict(span, rule=self._result_name(path, index))
+                    if path != self.root:
+                        self.pending.append((path, index))
+            adopted.append(span)
+        return adopted
+
+    def _expand(self, owner: str, ruleset: dict, stack: list):
+        """Adopts a RuleSet's spans and merges in what its reference= and <Import>s stand for."""
+        ruleset["spans"] = self._adopt(owner, ruleset["spans"])
+        sources = [(ruleset["reference"], True)] if ruleset.get("reference") else []
+        sources.extend((reference, False) for reference in ruleset.get("imports", []))
+        for reference, bare_is_definition in sources:
+            path, index = self._target(owner, reference, bare_is_definition)
+            if (path, index) in stack:
+                chain = stack[stack.index((path, index)):] + [(path, index)]
+                described = [f"{chain_path}#{self.loader.parse(chain_path)['rulesets'][i]['name'] or '(main)'}"
+                             for chain_path, i in chain]
+                raise XshdImportError(f"RuleSet references form a cycle: {' -> '.join(described)}",
+                                      owner, reference, described)
+            imported = copy.deepcopy(self.loader.parse(path)["rulesets"][index])
+            self._expand(path, imported, stack + [(path, index)])
+            for category, words in imported["keywords"].items():
+                ruleset["keywords"].setdefault(category, []).extend(words)
+            for span in imported["spans"]:
+                ruleset["spans"].append(span)
+                _categorize_span(span, ruleset)
+
+
+def load_definition(path: str, search_paths=()) -> dict:
+    """Loads one definition with a new DefinitionLoader, see DefinitionLoader.load()."""
+    return DefinitionLoader(search_paths).load(path)
@@ -1,155 +1,243 @@
 import xml.etree.ElementTree as ET
 
-def parse_xshd(file_path: str):
+from .errors import XshdParseError
+
+
+def load_xshd(file_path: str) -> dict:
     """
     Parses an .xshd file and extracts language syntax information.
 
+    This function has no side effects and is safe to call from several threads.
+
     Args:
         file_path: The path to the .xshd file.
 
     Returns:
         A dictionary containing the extracted syntax information.
-        Returns None if parsing fails.
+
+    Raises:
+        XshdParseError: If the file does not exist, cannot be read or is not valid XML.
     """
     try:
         tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        # Initialize structured data
-        syntax_info = {
-            "name": None,
-            "extensions": [],
-            "keywords": {}, # Store keywords in a dict, categorized by type
-            "comments": {
-                "line_comment_start": [],
-                "block_comment_start": [],
-                "block_comment_end": [],
-            },
-            "strings": [], # List of string delimiter pairs
-            "digits": None,
-            "rulesets": [], # Information about rulesets
-            "spans": [], # Detailed span information
+    except FileNotFoundError:
+        raise XshdParseError(f"File not found at {file_path}", file_path) from None
+    except OSError as e:
+        raise XshdParseError(f"Could not read {file_path}: {e}", file_path) from e
+    except ET.ParseError as e:
+        raise XshdParseError(f"Invalid XML in file {file_path}: {e}", file_path) from e
+    return _parse_root(tree.getroot())
+
+
+def parse_xshd_string(xshd_text: str) -> dict:
+    """
+    Parses .xshd content held in memory. See load_xshd().
+
+    Raises:
+        XshdParseError: If the text is not valid XML.
+    """
+    try:
+        root = ET.fromstring(xshd_text)
+    except ET.ParseError as e:
+        raise XshdParseError(f"Invalid XML: {e}") from e
+    return _parse_root(root)
+
+
+def parse_xshd(file_path: str):
+    """
+    Parses an .xshd file and extracts language syntax information.
+
+    Args:
+        file_path: The path to the .xshd file.
+
+    Returns:
+        A dictionary containing the extracted syntax information.
+        Returns None if parsing fails, after printing the error.
+    """
+    try:
+        return load_xshd(file_path)
+    except XshdParseError as e:
+        print(f"Error: {e}")
+        return None
+
+
+def span_kind(span_info: dict):
+    """Returns "comment" or "string" for comment and string spans (judged by name and rule), else None."""
+    name_lower = (span_info.get("name") or "").lower()
+    rule_lower = (span_info.get("rule") or "").lower()
+    if "comment" in name_lower or "comment" in rule_lower:
+        return "comment"
+    if "string" in name_lower or "char" in name_lower or "string" in rule_lower or "char" in rule_lower:
+        return "string"
+    return None
+
+
+def _categorize_span(span_info: dict, target: dict):
+    """Adds a span to target["comments"] / target["strings"] if it is a comment or string span."""
+    kind = span_kind(span_info)
+
+    if kind == "comment":
+        if span_info["stopateol"] and span_info["begin"]: # Line comment
+            target["comments"]["line_comment_start"].append(span_info["begin"])
+        # Improved condition for block comments
+        elif span_info["begin"] and span_info["end"] and \
+             (span_info.get("multiline") or not span_info.get("stopateol", True)):
+            target["comments"]["block_comment_start"].append(span_info["begin"])
+            target["comments"]["block_comment_end"].append(span_info["end"])
+
+    elif kind == "string":
+        if span_info["begin"] and span_info["end"]:
+            target["strings"].append({
+                "begin": span_info["begin"],
+                "end": span_info["end"],
+                "name": span_info["name"],
+                "stopateol": span_info["stopateol"],
+                "escapecharacter": span_info["escapecharacter"],
+            })
+
+
+def _parse_root(root) -> dict:
+    """Extracts syntax information from the SyntaxDefinition root element."""
+    # Initialize structured data
+    syntax_info = {
+        "name": None,
+        "extensions": [],
+        "keywords": {}, # Store keywords in a dict, categorized by type
+        "comments": {
+            "line_comment_start": [],
+            "block_comment_start": [],
+            "block_comment_end": [],
+        },
+        "strings": [], # List of string delimiter pairs
+        "digits": None,
+        "rulesets": [], # Information about rulesets
+        "spans": [], # Detailed span information
+        "properties": {}, # Raw <Properties> name/value pairs
+    }
+
+    # Extract language name and extensions
+    syntax_info["name"] = root.get("name")
+    extensions_str = root.get("extensions")
+    if extensions_str:
+        syntax_info["extensions"] = [ext.strip() for ext in extensions_str.split(';') if ext.strip()]
+
+    # Parse Properties for comment definitions
+    properties_element = root.find("Properties")
+    if properties_element is not None:
+        for prop_element in properties_element.findall("Property"):
+            prop_name = prop_element.get("name")
+            prop_value = prop_element.get("value")
+            if prop_value: # Ensure value is not None or empty
+                syntax_info["properties"][prop_name] = prop_value
+                if prop_name == "LineComment":
+                    syntax_info["comments"]["line_comment_start"].append(prop_value)
+                elif prop_name == "BlockCommentBegin":
+                    syntax_info["comments"]["block_comment_start"].append(prop_value)
+                elif prop_name == "BlockCommentEnd":
+                    syntax_info["comments"]["block_comment_end"].append(prop_value)
+
+    # Find Digits element
+    digits_element = root.find("Digits")
+    if digits_element is not None:
+        syntax_info["digits"] = {
+            "name": digits_element.get("name"),
+            "color": digits_element.get("color"),
+            "bold": digits_element.get("bold"),
+            "italic": digits_element.get("italic"),
+        }
+    
+    # Process RuleSet elements, wrapped in <RuleSets> or directly below the root.
+    # The first one is the main RuleSet.
+    for ruleset_element in _ruleset_elements(root):
+        rs_info = {
+            "name": ruleset_element.get("name"), # None for the main ruleset
+            "ignorecase": ruleset_element.get("ignorecase", "false").lower() == "true",
+            "delimiters": None,
+            "keywords": {}, # Keywords specific to this ruleset
+            "spans": [], # Spans specific to this ruleset
+            "comments": {"line_comment_start": [], "block_comment_start": [], "block_comment_end": []},
+            "strings": [], # String delimiter pairs specific to this ruleset
+            # Cross-file references: the RuleSet stands for "Definition[/RuleSet]", or
+            # merges in the RuleSets of <Import ruleSet="Definition/RuleSet"/> elements
+            "reference": ruleset_element.get("reference"),
+            "imports": [element.get("ruleSet") for element in ruleset_element.findall("Import")
+                        if element.get("ruleSet")],
         }
+        
+        delimiters_element = ruleset_element.find("Delimiters")
+        if delimiters_element is not None and delimiters_element.text:
+            rs_info["delimiters"] = delimiters_element.text
 
-        # Extract language name and extensions
-        syntax_info["name"] = root.get("name")
-        extensions_str = root.get("extensions")
-        if extensions_str:
-            syntax_info["extensions"] = [ext.strip() for ext in extensions_str.split(';') if ext.strip()]
-
-        # Parse Properties for comment definitions
-        properties_element = root.find("Properties")
-        if properties_element is not None:
-            for prop_element in properties_element.findall("Property"):
-                prop_name = prop_element.get("name")
-                prop_value = prop_element.get("value")
-                if prop_value: # Ensure value is not None or empty
-                    if prop_name == "LineComment":
-                        syntax_info["comments"]["line_comment_start"].append(prop_value)
-                    elif prop_name == "BlockCommentBegin":
-                        syntax_info["comments"]["block_comment_start"].append(prop_value)
-                    elif prop_name == "BlockCommentEnd":
-                        syntax_info["comments"]["block_comment_end"].append(prop_value)
-
-        # Find Digits element
-        digits_element = root.find("Digits")
-        if digits_element is not None:
-            syntax_info["digits"] = {
-                "name": digits_element.get("name"),
-                "color": digits_element.get("color"),
-                "bold": digits_element.get("bold"),
-                "italic": digits_element.get("italic"),
-            }
+        # Extract Keywords
+        for keywords_element in ruleset_element.findall("KeyWords"):
+            kw_category = keywords_element.get("name", "default")
+            kw_list = []
+            for key_element in keywords_element.findall("Key"):
+                word = key_element.get("word")
+                if word:
+                    kw_list.append(word)
+            if kw_list:
+                # Add to both ruleset-specific and global keywords
+                rs_info["keywords"].setdefault(kw_category, []).extend(kw_list)
+                syntax_info["keywords"].setdefault(kw_category, []).extend(kw_list)
         
-        # Process RuleSet elements (assuming one main RuleSet for now, can be extended)
-        # XSHD can have nested RuleSets, but we'll start with the top-level ones.
-        for ruleset_element in root.findall("RuleSets/RuleSet"): # Corrected path
-            rs_info = {
-                "ignorecase": ruleset_element.get("ignorecase", "false").lower() == "true",
-                "delimiters": None,
-                "keywords": {}, # Keywords specific to this ruleset
-                "spans": [], # Spans specific to this ruleset
+        # Extract Spans (includes comments, strings, etc.)
+        for span_element in ruleset_element.findall("Span"):
+            span_info = {
+                "name": span_element.get("name"),
+                "rule": span_element.get("rule"),
+                "color": span_element.get("color"),
+                "bold": span_element.get("bold"),
+                "italic": span_element.get("italic"),
+                "stopateol": span_element.get("stopateol", "false").lower() == "true",
+                "multiline": span_element.get("multiline", "false").lower() == "true",
+                "escapecharacter": span_element.get("escapecharacter"),
+                "begin": None,
+                "end": None,
             }
+            begin_element = span_element.find("Begin")
+            if begin_element is not None and begin_element.text:
+                span_info["begin"] = begin_element.text.strip()
             
-            delimiters_element = ruleset_element.find("Delimiters")
-            if delimiters_element is not None and delimiters_element.text:
-                rs_info["delimiters"] = delimiters_element.text
-
-            # Extract Keywords
-            for keywords_element in ruleset_element.findall("KeyWords"):
-                kw_category = keywords_element.get("name", "default")
-                kw_list = []
-                for key_element in keywords_element.findall("Key"):
-                    word = key_element.get("word")
-                    if word:
-                        kw_list.append(word)
-                if kw_list:
-                    # Add to both ruleset-specific and global keywords
-                    rs_info["keywords"].setdefault(kw_category, []).extend(kw_list)
-                    syntax_info["keywords"].setdefault(kw_category, []).extend(kw_list)
-            
-            # Extract Spans (includes comments, strings, etc.)
-            for span_element in ruleset_element.findall("Span"):
-                span_info = {
-                    "name": span_element.get("name"),
-                    "rule": span_element.get("rule"),
-                    "color": span_element.get("color"),
-                    "bold": span_element.get("bold"),
-                    "italic": span_element.get("italic"),
-                    "stopateol": span_element.get("stopateol", "false").lower() == "true",
-                    "multiline": span_element.get("multiline", "false").lower() == "true",
-                    "begin": None,
-                    "end": None,
-                }
-                begin_element = span_element.find("Begin")
-                if begin_element is not None and begin_element.text:
-                    span_info["begin"] = begin_element.text.strip()
-                
-                end_element = span_element.find("End")
-                if end_element is not None and end_element.text:
-                    span_info["end"] = end_element.text.strip()
-
-                rs_info["spans"].append(span_info)
-                syntax_info["spans"].append(span_info) # Also add to global spans list
-
-                # Categorize comments and strings based on span properties
-                name_lower = (span_info["name"] or "").lower()
-                rule_lower = (span_info["rule"] or "").lower()
-
-                if "comment" in name_lower or "comment" in rule_lower:
-                    if span_info["stopateol"] and span_info["begin"]: # Line comment
-                        syntax_info["comments"]["line_comment_start"].append(span_info["begin"])
-                    # Improved condition for block comments
-                    elif span_info["begin"] and span_info["end"] and \
-                         (span_info.get("multiline") or not span_info.get("stopateol", True)):
-                        syntax_info["comments"]["block_comment_start"].append(span_info["begin"])
-                        syntax_info["comments"]["block_comment_end"].append(span_info["end"])
-                
-                if "string" in name_lower or "char" in name_lower or "string" in rule_lower or "char" in rule_lower:
-                     if span_info["begin"] and span_info["end"]:
-                        syntax_info["strings"].append({
-                            "begin": span_info["begin"],
-                            "end": span_info["end"],
-                            "name": span_info["name"],
-                            "stopateol": span_info["stopateol"],
-                        })
-            
-            syntax_info["rulesets"].append(rs_info)
+            end_element = span_element.find("End")
+            if end_element is not None and end_element.text:
+                span_info["end"] = end_element.text.strip()
 
-        # Remove duplicates from keyword lists if any category was processed multiple times
-        for category in syntax_info["keywords"]:
-            syntax_info["keywords"][category] = sorted(list(set(syntax_info["keywords"][category])))
-        
-        for key in ["line_comment_start", "block_comment_start", "block_comment_end"]:
-            syntax_info["comments"][key] = sorted(list(set(syntax_info["comments"][key])))
+            rs_info["spans"].append(span_info)
+            syntax_info["spans"].append(span_info) # Also add to global spans list
 
-        return syntax_info
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return None
-    except ET.ParseError:
-        print(f"Error: Invalid XML in file {file_path}")
-        return None
+            # Categorize comments and strings based on span properties,
+            # both for the whole definition and for this ruleset alone
+            _categorize_span(span_info, syntax_info)
+            _categorize_span(span_info, rs_info)
+    
+        syntax_info["rulesets"].append(rs_info)
+
+    _deduplicate(syntax_info)
+    return syntax_info
+
+
+def _ruleset_elements(root) -> list:
+    """Returns the RuleSet elements of a definition in document order."""
+    elements = []
+    for child in root:
+        if child.tag == "RuleSets":
+            elements.extend(child.findall("RuleSet"))
+        elif child.tag == "RuleSet":
+            elements.append(child)
+    return elements
+
+
+def _deduplicate(syntax_info: dict):
+    """Sorts and deduplicates the merged keyword and comment lists."""
+    # Remove duplicates from keyword lists if any category was processed multiple times
+    for category in syntax_info["keywords"]:
+        syntax_info["keywords"][category] = sorted(list(set(syntax_info["keywords"][category])))
+    
+    for key in ["line_comment_start", "block_comment_start", "block_comment_end"]:
+        syntax_info["comments"][key] = sorted(list(set(syntax_info["comments"][key])))
+        for rs_info in syntax_info["rulesets"]:
+            rs_info["comments"][key] = sorted(list(set(rs_info["comments"][key])))
 
 if __name__ == '__main__':
     import argparse
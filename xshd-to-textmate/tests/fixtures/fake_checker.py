@@ -0,0 +1,39 @@
+"""
+Stand-in for PAT3.Console.exe used by the verification tests.
+
+Usage: fake_checker.py -pcsp <model> <output>
+
+Writes a PAT-style verdict for the single #assert left in the model. Assertions that
+mention "bad" are reported as not valid, "with prob" assertions get a probability
+interval, and FAKE_CHECKER_SLEEP seconds are spent per run to stand in for the search.
+Like PAT, it fails when an #include cannot be opened relative to the model.
+"""
+import os
+import re
+import sys
+import time
+
+if __name__ == '__main__':
+    _, _, model_path, output_path = sys.argv
+    with open(model_path) as f:
+        model = f.read()
+    for included in re.findall(r'^#include\s*"([^"]+)"', model, re.M):
+        if not os.path.exists(os.path.join(os.path.dirname(model_path), included)):
+            sys.stderr.write(f"cannot open included file {included}\n")
+            sys.exit(1)
+    assertions = re.findall(r"^#assert\s+([^;]*);", model, re.M)
+    if len(assertions) != 1:
+        sys.stderr.write(f"expected one assertion, found {len(assertions)}\n")
+        sys.exit(2)
+    time.sleep(float(os.environ.get("FAKE_CHECKER_SLEEP", "0")))
+
+    assertion = " ".join(assertions[0].split())
+    verdict = "NOT valid" if "bad" in assertion else "VALID"
+    with open(output_path, "w") as f:
+        f.write("*******************************************************\n")
+        f.write(f"Assertion: {assertion}\n")
+        f.write("********Verification Result********\n")
+        if "with prob" in assertion:
+            f.write(f"The Assertion ({assertion}) is {verdict} with Probability [0.25, 0.5];\n")
+        else:
+            f.write(f"The Assertion ({assertion}) is {verdict}.\n")
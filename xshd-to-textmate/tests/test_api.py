@@ -0,0 +1,65 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ..src import api
+from ..src.errors import ConverterError, XshdParseError, GrammarGenerationError, GrammarWriteError
+from ..src.workload import generate_xshd
+
+
+class TestLibraryApi(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.syntax_path = os.path.join(base_dir, 'Examples', 'Syntax.xshd')
+
+    def test_typed_errors(self):
+        with self.assertRaises(XshdParseError) as ctx:
+            api.load_xshd("does_not_exist.xshd")
+        self.assertEqual(ctx.exception.path, "does_not_exist.xshd")
+        with self.assertRaises(XshdParseError):
+            api.convert_string("<SyntaxDefinition name='Broken'>")
+        with self.assertRaises(GrammarGenerationError):
+            api.build_textmate_grammar({})
+        with self.assertRaises(GrammarWriteError):
+            api.write_textmate_grammar({"name": "X"}, os.path.join("missing_dir", "nested", "out.json"))
+        self.assertTrue(issubclass(XshdParseError, ConverterError))
+
+    def test_no_output_is_printed(self):
+        captured = io.StringIO()
+        with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                grammar = api.convert_file(self.syntax_path, os.path.join(tmp_dir, 'out.tmLanguage.json'))
+            with self.assertRaises(XshdParseError):
+                api.load_xshd("does_not_exist.xshd")
+        self.assertEqual(captured.getvalue(), "")
+        self.assertEqual(grammar["name"], "Probability CSP Model")
+
+    def test_convert_file_matches_convert_string(self):
+        with open(self.syntax_path, 'r') as f:
+            from_string = api.convert_string(f.read())
+        self.assertEqual(api.convert_file(self.syntax_path), from_string)
+
+    def test_input_is_not_modified(self):
+        xshd_data = api.load_xshd(self.syntax_path)
+        snapshot = json.dumps(xshd_data, sort_keys=True)
+        api.build_textmate_grammar(xshd_data)
+        self.assertEqual(json.dumps(xshd_data, sort_keys=True), snapshot)
+
+    def test_concurrent_conversions(self):
+        definitions = [generate_xshd(seed=i, categories=3, keys_per_category=50, spans=6, name=f"Lang {i}")
+                       for i in range(12)]
+        serial = [api.convert_string(text) for text in definitions]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            concurrent = list(pool.map(api.convert_string, definitions))
+        self.assertEqual(concurrent, serial)
+        self.assertEqual(len({grammar["scopeName"] for grammar in concurrent}), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import random
+
+from ..src.xshd_parser import load_xshd
+from ..src.folding import BracketIndex, FoldingRange, OffsetArray
+
+
+SOURCE = """/* header
+   (not a bracket */
+P() = a -> {
+    "}"; // ) ignored
+    Q[x]
+};
+R() = (b
+"""
+
+
+def snapshot(index):
+    return (list(index.positions), index.kinds.tolist(), index.links.tolist(), index.depths.tolist(),
+            list(index.span_starts), list(index.span_ends), index.span_kinds.tolist(), list(index.line_starts))
+
+
+class TestFolding(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.xshd_data = load_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd'))
+        with open(os.path.join(base_dir, 'Examples', 'china.pcsp'), encoding='utf-8-sig') as f:
+            cls.china = f.read()
+
+    def test_pairs_skip_comments_and_strings(self):
+        index = BracketIndex(self.xshd_data, SOURCE)
+        self.assertEqual("".join(SOURCE[offset] for offset in index.positions), "(){[]}()(")
+        brace = SOURCE.index("{")
+        self.assertEqual(index.matching_bracket(brace), SOURCE.rindex("}"))
+        self.assertEqual(index.matching_bracket(SOURCE.rindex("}")), brace)
+        self.assertIsNone(index.matching_bracket(SOURCE.rindex("(")))  # Never closed
+        self.assertIsNone(index.matching_bracket(SOURCE.index('"}"') + 1))  # In a string
+        self.assertEqual(index.enclosing_pair(SOURCE.index("x")), (SOURCE.index("["), SOURCE.index("]")))
+        self.assertEqual(index.depths.tolist(), [0, 0, 0, 1, 1, 0, 0, 0, 0])
+
+    def test_folding_ranges(self):
+        index = BracketIndex(self.xshd_data, SOURCE)
+        self.assertEqual(index.folding_ranges(), [FoldingRange(0, 1, "comment"), FoldingRange(2, 4, "region")])
+        folded = BracketIndex(self.xshd_data, self.china).folding_ranges()
+        self.assertTrue(folded)
+        lines = self.china.split("\n")
+        for start_line, end_line, kind in folded:
+            self.assertLess(start_line, end_line)
+            if kind == "region":
+                self.assertIn("{", lines[start_line])
+                self.assertIn("}", lines[end_line + 1])
+
+    def test_offset_array(self):
+        offsets = OffsetArray([1, 5, 9, 20])
+        offsets.splice(1, 2, [6, 7], 3)  # 5 -> 6, 7; later offsets move by 3
+        self.assertEqual(list(offsets), [1, 6, 7, 12, 23])
+        offsets.splice(0, 0, [], -1)
+        self.assertEqual(list(offsets), [0, 5, 6, 11, 22])
+        self.assertEqual((offsets.bisect_left(11), offsets.bisect_right(11), offsets[-1]), (3, 4, 22))
+
+    def test_edits_match_a_rebuild(self):
+        rng = random.Random(5)
+        alphabet = "ab(){}[]/*\"'\\\n "
+        for _ in range(200):
+            index = BracketIndex(self.xshd_data, "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))))
+            for _ in range(15):
+                start = rng.randint(0, len(index.text))
+                end = rng.randint(start, min(len(index.text), start + 5))
+                index.apply_edit(start, end, "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 4))))
+                self.assertEqual(snapshot(index), snapshot(BracketIndex(self.xshd_data, index.text)), index.text)
+
+    def test_typing_into_a_large_model(self):
+        index = BracketIndex(self.xshd_data, self.china * 200)
+        middle = self.china.index("{") + len(self.china) * 100
+        index.apply_edit(middle + 1, middle + 1, "\n")
+        paired = []
+        for offset, char in enumerate("a -> (b [] c) -> {Skip}", middle + 2):
+            before = index.stats["paired_brackets"]
+            index.apply_edit(offset, offset, char)
+            paired.append(index.stats["paired_brackets"] - before)
+        self.assertEqual(snapshot(index), snapshot(BracketIndex(self.xshd_data, index.text)))
+        # Only the six bracket keystrokes pair more than a handful of brackets, and they
+        # walk the top level of the rest of the model rather than all of its brackets
+        self.assertEqual(sum(count > 10 for count in paired), 6)
+        self.assertLess(max(paired), len(index) // 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from ..src.errors import ConverterError, GrammarBudgetError
+from ..src.grammar_metrics import check_budget, enforce_budget, keyword_alternatives, measure_grammar, parse_budget
+from ..src.textmate_generator import build_textmate_grammar
+from ..src.workload import generate_xshd
+from ..src.xshd_parser import parse_xshd_string
+
+
+GRAMMAR = {
+    "scopeName": "source.test",
+    "patterns": [{"include": "#outer"}, {"include": "source.other"}],
+    "repository": {
+        "outer": {"patterns": [{"begin": r"\{", "end": r"\}", "patterns": [{"include": "#middle"}]}]},
+        "middle": {"patterns": [{"include": "#inner"}, {"include": "#missing"}]},
+        "inner": {"patterns": [{"match": r"\b(a\|b|[|]c|(d|e))\b", "name": "keyword.test"},
+                               {"begin": "/\\*", "end": "\\*/", "patterns": [{"include": "#self"}]}]},
+    },
+}
+
+
+class TestGrammarMetrics(unittest.TestCase):
+
+    def test_measure_grammar(self):
+        metrics = measure_grammar(GRAMMAR)
+        self.assertEqual((metrics["rules"], metrics["includes"], metrics["repository"]), (6, 6, 3))
+        self.assertEqual((metrics["regexes"], metrics["largest_regex"]), (5, "/repository/inner/patterns/0/match"))
+        # \| and [|] are literals, (d|e) is one alternative
+        self.assertEqual(metrics["keyword_rules"], [{"pointer": "/repository/inner/patterns/0",
+                                                     "name": "keyword.test", "alternatives": 3}])
+        self.assertEqual(metrics["include_depth"], 3)
+        self.assertEqual(metrics["cycles"], [["$self", "#outer", "#middle", "#inner", "$self"]])
+        self.assertEqual(metrics["external_includes"], [{"pointer": "/patterns/1", "include": "source.other"}])
+        self.assertEqual(metrics["unresolved_includes"],
+                         [{"pointer": "/repository/middle/patterns/1", "include": "#missing"}])
+        self.assertGreater(metrics["compile_ms"], 0)
+        self.assertIsNone(measure_grammar(GRAMMAR, compile_regexes=False)["compile_ms"])
+        self.assertIsNone(keyword_alternatives(r"\b\d+\b"))
+
+    def test_lazy_keywords_measure_the_same(self):
+        xshd_data = parse_xshd_string(generate_xshd(seed=3, keys_per_category=50))
+        materialized = measure_grammar(build_textmate_grammar(xshd_data), compile_regexes=False)
+        lazy = measure_grammar(build_textmate_grammar(xshd_data, lazy_keywords=True), compile_regexes=False)
+        self.assertEqual(lazy, materialized)
+        self.assertEqual(materialized["max_keyword_alternatives"], 50)
+
+    def test_budgets(self):
+        metrics = measure_grammar(GRAMMAR, compile_regexes=False)
+        self.assertEqual(check_budget(metrics, {"rules": 6, "compile_ms": 0.0}), [])
+        self.assertEqual(check_budget(metrics, {"include_depth": 2}),
+                         [{"metric": "include_depth", "value": 3, "limit": 2}])
+        with self.assertRaises(GrammarBudgetError) as ctx:
+            enforce_budget(metrics, {"rules": 5, "include_cycles": 0})
+        self.assertIsInstance(ctx.exception, ConverterError)
+        self.assertEqual([v["metric"] for v in ctx.exception.violations], ["rules", "include_cycles"])
+        self.assertEqual(parse_budget("max-keyword-alternatives=500"), ("max_keyword_alternatives", 500))
+        with self.assertRaises(ValueError):
+            parse_budget("keywords=5")
+
+    def test_cli_budget_stops_the_conversion(self):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'pcsp.tmLanguage.json')
+            report = os.path.join(tmp_dir, 'report.json')
+            command = [sys.executable, '-m', 'xshd-to-textmate.src.main', os.path.join('Examples', 'Syntax.xshd'),
+                       output, '--report', '--report-json', report, '--budget', 'max_keyword_alternatives=20']
+            process = subprocess.run(command, capture_output=True, text=True, cwd=base_dir)
+            self.assertEqual(process.returncode, 1, process.stderr)
+            self.assertIn("max_keyword_alternatives 27 > 20", process.stdout)
+            self.assertIn("include depth: 1", process.stdout)
+            self.assertFalse(os.path.exists(output))
+            with open(report) as f:
+                self.assertEqual(json.load(f)[0]["output"], output)
+
+
+if __name__ == '__main__':
+    unittest.main()
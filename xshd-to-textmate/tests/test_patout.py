@@ -0,0 +1,145 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from ..src.patout import PatoutParser, parse_patout, follow_patout, afollow_patout
+
+
+class TestPatout(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        fixture_path = os.path.join(os.path.dirname(__file__), 'fixtures', 'sample.patout')
+        with open(fixture_path) as f:
+            cls.sample = f.read()
+        cls.fixture_path = fixture_path
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'model.pcsp.patout')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_fixture(self):
+        results = parse_patout(self.fixture_path)
+        self.assertEqual([r["verdict"] for r in results], ["valid", "invalid", "valid"])
+        self.assertEqual(results[0]["assertion"], "AD() deadlockfree")
+        self.assertEqual(results[0]["visited_states"], 5231)
+        self.assertEqual(results[0]["total_transitions"], 11874)
+        self.assertAlmostEqual(results[0]["time_seconds"], 0.1875224)
+        self.assertAlmostEqual(results[0]["memory_kb"], 24756.224)
+        self.assertEqual(results[1]["trace_lines"], 2)
+        self.assertEqual(results[1]["settings"]["Fairness"], "no fairness")
+        self.assertEqual(results[2]["probability"], (0.29437, 0.29437))
+
+    def test_chunking_does_not_change_events(self):
+        whole = PatoutParser()
+        expected = whole.feed(self.sample) + whole.close()
+        for size in (1, 7, 64):
+            parser = PatoutParser()
+            events = []
+            for i in range(0, len(self.sample), size):
+                events.extend(parser.feed(self.sample[i:i + size]))
+            events.extend(parser.close())
+            self.assertEqual(events, expected, size)
+        # The verdict is reported before the block's statistics
+        kinds = [(e["type"], e["index"]) for e in expected]
+        self.assertEqual(kinds[:3], [("assertion", 0), ("verdict", 0), ("result", 0)])
+
+    def test_long_lines_are_bounded(self):
+        parser = PatoutParser(max_line_length=100)
+        parser.feed("Assertion: P() deadlockfree\n********Verification Result********\n")
+        parser.feed("The Assertion (P() deadlockfree) is NOT valid.\n<init")
+        for _ in range(1000):
+            parser.feed(" -> a" * 100)
+            self.assertLessEqual(parser._partial_length, 100)
+        events = parser.feed(">\n") + parser.close()
+        self.assertEqual(events[-1]["trace_lines"], 1)
+
+    def test_follow_growing_file(self):
+        blocks = self.sample.split("\n\n*****")
+        seen = []
+
+        def writer():
+            with open(self.path, 'w') as f:
+                for index, block in enumerate(blocks):
+                    f.write(("\n\n*****" if index else "") + block)
+                    f.flush()
+                    time.sleep(0.15)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        for event in follow_patout(self.path, poll_interval=0.02, stop=lambda: not thread.is_alive()):
+            seen.append((event["type"], time.monotonic()))
+        thread.join()
+
+        results = [t for kind, t in seen if kind == "result"]
+        self.assertEqual(len(results), 3)
+        # The first result arrived while the file was still being written
+        self.assertLess(results[0], results[-1] - 0.2)
+
+    def test_follow_handles_truncation(self):
+        with open(self.path, 'w') as f:
+            f.write(self.sample)
+        tail_events = []
+        rewritten = []
+
+        def stop():
+            if not rewritten and any(e["type"] == "result" for e in tail_events):
+                with open(self.path, 'w') as f:
+                    f.write("Assertion: Q() deadlockfree\n")
+                rewritten.append(True)
+                return False
+            return bool(rewritten)
+
+        for event in follow_patout(self.path, poll_interval=0.01, stop=stop):
+            tail_events.append(event)
+        types = [e["type"] for e in tail_events]
+        self.assertIn("reset", types)
+        self.assertEqual(tail_events[-1]["assertion"], "Q() deadlockfree")
+        self.assertEqual(tail_events[-1]["index"], 0)
+
+    def test_follow_handles_rewrite_at_least_as_long(self):
+        with open(self.path, 'w') as f:
+            f.write(self.sample)
+        # A new run, already longer than the old output, whose timings differ
+        rerun = self.sample.replace("AD() deadlockfree", "BC() deadlockfree").replace("2.5112s", "2.4986s")
+        rerun += self.sample
+        tail_events = []
+        rewritten = []
+
+        def stop():
+            if not rewritten and any(e["type"] == "result" for e in tail_events):
+                with open(self.path, 'w') as f:
+                    f.write(rerun)
+                rewritten.append(True)
+                return False
+            return bool(rewritten)
+
+        for event in follow_patout(self.path, poll_interval=0.01, stop=stop):
+            tail_events.append(event)
+        types = [e["type"] for e in tail_events]
+        self.assertEqual(types.count("reset"), 1)
+        parser = PatoutParser()
+        expected = [e["assertion"] for e in parser.feed(rerun) + parser.close() if e["type"] == "result"]
+        self.assertEqual((len(expected), expected[0]), (6, "BC() deadlockfree"))
+        after_reset = tail_events[types.index("reset") + 1:]
+        self.assertEqual([e["assertion"] for e in after_reset if e["type"] == "result"], expected)
+
+    def test_async_follow(self):
+        with open(self.path, 'w') as f:
+            f.write(self.sample)
+
+        async def collect():
+            return [event async for event in afollow_patout(self.path, poll_interval=0.01, idle_timeout=0.05)]
+
+        events = asyncio.run(collect())
+        self.assertEqual([e["verdict"] for e in events if e["type"] == "verdict"], ["valid", "invalid", "valid"])
+
+
+if __name__ == '__main__':
+    unittest.main()
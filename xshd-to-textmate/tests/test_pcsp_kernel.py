@@ -0,0 +1,139 @@
+import unittest
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+
+from ..src.xshd_parser import load_xshd
+from ..src.pcsp_kernel import PcspSession, format_cell_result, kernel_spec
+
+
+DEFINITIONS = """#define N 2;
+P() = a -> P();
+"""
+
+CHECKS = """// checks
+#assert P() deadlockfree;
+#assert P() |= [] <> bad;
+"""
+
+
+class TestPcspKernel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.xshd_path = os.path.join(base_dir, 'Examples', 'Syntax.xshd')
+        cls.xshd_data = load_xshd(cls.xshd_path)
+        checker_path = os.path.join(os.path.dirname(__file__), 'fixtures', 'fake_checker.py')
+        cls.checker = f'"{sys.executable}" "{checker_path}" -pcsp {{model}} {{output}}'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_session(self, scenario):
+        async def main():
+            async with PcspSession(self.xshd_data, checker=self.checker, workers=2,
+                                   base_dir=self.tmp_dir.name) as session:
+                return await scenario(session)
+        return asyncio.run(main())
+
+    def test_definitions_then_checks(self):
+        async def scenario(session):
+            return await session.run_cell(DEFINITIONS), await session.run_cell(CHECKS)
+
+        definitions, report = self.run_session(scenario)
+        self.assertEqual(definitions, {"kind": "definitions", "symbols": [("N", "constant"), ("P", "process")]})
+        self.assertEqual(report["kind"], "report")
+        self.assertFalse(report["cached"])
+        # Lines are relative to the cell, not to the prelude + cell model
+        self.assertEqual([(e["line"], e["verdict"]) for e in report["assertions"]], [(1, "valid"), (2, "invalid")])
+        self.assertIn("INVALID  #assert P() |= [] <> bad;", format_cell_result(report))
+
+    def test_rerun_definition_cells_replace_their_earlier_version(self):
+        async def scenario(session):
+            await session.run_cell(DEFINITIONS, cell_id="defs")
+            await session.run_cell("Q() = b -> Q();\n", cell_id="other")
+            await session.run_cell(DEFINITIONS + "Worker() = c -> Worker();\n", cell_id="defs")
+            by_id = list(session.definitions.values()), dict(session.symbols)
+            # Without a cell id, a cell declaring the same symbols replaces the earlier one
+            await session.run_cell("Q() = d -> Skip;\n")
+            report = await session.run_cell(CHECKS)
+            return by_id, list(session.definitions.values()), report
+
+        (by_id, symbols), definitions, report = self.run_session(scenario)
+        self.assertEqual(by_id, [DEFINITIONS + "Worker() = c -> Worker();\n", "Q() = b -> Q();\n"])
+        self.assertEqual(symbols, {"N": "constant", "P": "process", "Worker": "process", "Q": "process"})
+        self.assertEqual(definitions, [DEFINITIONS + "Worker() = c -> Worker();\n", "Q() = d -> Skip;\n"])
+        self.assertEqual(report["summary"], {"valid": 1, "invalid": 1, "error": 0})
+
+    def test_identical_cells_hit_the_cache(self):
+        async def scenario(session):
+            await session.run_cell(DEFINITIONS)
+            first = await session.run_cell(CHECKS)
+            # Submitted together: the duplicate waits for the running check
+            concurrent = await asyncio.gather(session.run_cell(CHECKS + "\n"), session.run_cell(CHECKS + "\n"))
+            again = await session.run_cell(CHECKS)
+            # Re-running the definition cell does not change the model
+            await session.run_cell(DEFINITIONS)
+            after_rerun = await session.run_cell(CHECKS)
+            return first, concurrent, again, after_rerun, dict(session.stats)
+
+        first, concurrent, again, after_rerun, stats = self.run_session(scenario)
+        self.assertTrue(again["cached"])
+        self.assertTrue(after_rerun["cached"])
+        self.assertEqual(again["assertions"], first["assertions"])
+        self.assertEqual(concurrent[0]["assertions"], concurrent[1]["assertions"])
+        self.assertEqual(stats["checker_runs"], 4)
+        self.assertEqual(stats["cache_hits"], 3)
+
+    def test_included_models_are_part_of_the_key(self):
+        included = os.path.join(self.tmp_dir.name, 'lib.csp')
+        with open(included, 'w') as f:
+            f.write("Q() = b -> Q();\n")
+        cell = '#include "lib.csp";\n// #include "ignored.csp";\n#assert P() deadlockfree;\n'
+
+        async def scenario(session):
+            await session.run_cell(cell)
+            await session.run_cell(cell)
+            with open(included, 'w') as f:
+                f.write("Q() = c -> Skip;\n")
+            await session.run_cell(cell)
+            return session._resolve_includes(cell)[0], dict(session.stats)
+
+        model, stats = self.run_session(scenario)
+        self.assertEqual(stats["checker_runs"], 2)
+        self.assertEqual(stats["cache_hits"], 1)
+        self.assertTrue(model.startswith(f'#include "{included}";'))
+        self.assertIn('// #include "ignored.csp";', model)
+
+    def test_reset_and_editor_helpers(self):
+        async def scenario(session):
+            await session.run_cell("Producer() = put -> Producer();\n")
+            completions = session.complete("Q() = Pro", 9)
+            await session.run_cell("%reset")
+            return completions, session.complete("Q() = Pro", 9), session.scopes_at("#define N 2; // note", 17)
+
+        before, after, scopes = self.run_session(scenario)
+        self.assertEqual(before, (6, ["Producer"]))
+        self.assertEqual(after, (6, []))
+        self.assertTrue(scopes[-1].startswith("comment.line"))
+
+    def test_kernel_spec(self):
+        spec = kernel_spec(self.xshd_path, checker=self.checker, workers=3)
+        self.assertEqual(spec["argv"][1:4], ["-m", "xshd-to-textmate.src.pcsp_kernel", "-f"])
+        self.assertEqual(spec["env"]["PCSP_KERNEL_XSHD"], self.xshd_path)
+        self.assertEqual(spec["env"]["PCSP_KERNEL_WORKERS"], "3")
+
+    @unittest.skipUnless(importlib.util.find_spec("ipykernel"), "ipykernel is not installed")
+    def test_kernel_class(self):
+        from ..src.pcsp_kernel import _kernel_class
+        self.assertEqual(_kernel_class().language, "pcsp")
+
+
+if __name__ == '__main__':
+    unittest.main()
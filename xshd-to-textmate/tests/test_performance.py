@@ -0,0 +1,154 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from ..src.xshd_parser import parse_xshd
+from ..src.textmate_generator import generate_textmate_grammar
+from ..src.workload import generate_xshd, generate_pcsp
+
+# Performance regression gate.
+#
+# Each scenario is run with warmup rounds followed by timed samples; the median is
+# compared against perf_baseline.json. Each baseline timing is stored together with the
+# timing of a fixed calibration workload measured right next to it, and is rescaled by
+# the calibration ratio measured on the current machine, so the committed baseline stays
+# meaningful on faster, slower or temporarily loaded hosts.
+#
+# Environment variables:
+#   XSHD_PERF_SKIP=1        skip the gate (e.g. on heavily loaded CI runners)
+#   XSHD_PERF_UPDATE=1      re-measure and rewrite perf_baseline.json
+#   XSHD_PERF_TOLERANCE=x   allowed relative slowdown (default from the baseline file)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+WARMUP_ROUNDS = 1
+SAMPLES = 5
+DEFAULT_TOLERANCE = 0.3
+
+
+def _calibration_workload():
+    # Fixed pure-Python work mixing dict, string and regex operations.
+    table = {}
+    for i in range(60000):
+        key = f"k{i % 997}"
+        table[key] = table.get(key, 0) + i
+    text = " ".join(table) * 20
+    return len(re.findall(r"k\d+", text))
+
+
+def measure(func, warmup=WARMUP_ROUNDS, samples=SAMPLES):
+    """Runs func `warmup` times untimed, then returns the median of `samples` timed runs."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {"tolerance": DEFAULT_TOLERANCE, "scenarios": {}}
+    with open(BASELINE_PATH, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(baseline):
+    with open(BASELINE_PATH, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+@unittest.skipIf(os.environ.get("XSHD_PERF_SKIP") == "1", "performance gate disabled by XSHD_PERF_SKIP")
+class TestPerformanceRegression(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.update = os.environ.get("XSHD_PERF_UPDATE") == "1"
+        cls.baseline = load_baseline()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+
+        # Large definition: 8 RuleSets x 12 categories x 400 keys (~38k keys)
+        cls.large_xshd_path = os.path.join(cls.tmp_dir.name, 'large.xshd')
+        with open(cls.large_xshd_path, 'w') as f:
+            f.write(generate_xshd(seed=1, rulesets=8, categories=12, keys_per_category=400,
+                                  spans=8, nesting_depth=4))
+
+        # 50k keyword set for the generator
+        keywords = [f"kw{i}x{i % 7}" for i in range(50000)]
+        cls.keyword_xshd_data = {
+            "name": "PerfLang", "extensions": [".perf"],
+            "rulesets": [{"ignorecase": False}],
+            "keywords": {f"Category{c}": keywords[c::5] for c in range(5)},
+            "comments": {"line_comment_start": ["//"], "block_comment_start": ["/*"], "block_comment_end": ["*/"]},
+            "strings": [{"begin": "\"", "end": "\"", "name": "String", "stopateol": False}],
+            "digits": {"name": "Digits"}, "spans": [],
+        }
+        cls.grammar_path = os.path.join(cls.tmp_dir.name, 'perf.tmLanguage.json')
+
+        # Keyword regex from the generated grammar, matched against a ~1 MB source
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_textmate_grammar(cls.keyword_xshd_data, cls.grammar_path)
+        with open(cls.grammar_path, 'r') as f:
+            grammar = json.load(f)
+        rule = grammar["repository"]["keywords"]["patterns"][0]
+        cls.keyword_regex = re.compile(rule["match"])
+        cls.source = generate_pcsp(1024 * 1024, keywords[::50], seed=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+        if cls.update:
+            save_baseline(cls.baseline)
+
+    def check_scenario(self, name, func):
+        # Calibrate on both sides of the scenario to follow load changes on the host.
+        calibration_before = measure(_calibration_workload)
+        median = measure(func)
+        calibration = (calibration_before + measure(_calibration_workload)) / 2
+
+        scenarios = self.baseline.setdefault("scenarios", {})
+        if self.update or name not in scenarios:
+            scenarios[name] = {"median": median, "calibration": calibration}
+            if not self.update:
+                self.skipTest(f"no baseline recorded for '{name}' (run with XSHD_PERF_UPDATE=1)")
+            return
+
+        recorded = scenarios[name]
+        tolerance = float(os.environ.get("XSHD_PERF_TOLERANCE", self.baseline.get("tolerance", DEFAULT_TOLERANCE)))
+        machine_factor = calibration / recorded["calibration"]
+        expected = recorded["median"] * machine_factor
+        limit = expected * (1 + tolerance)
+        if median > limit:
+            self.fail(
+                f"Performance regression in '{name}':\n"
+                f"  baseline median   {recorded['median'] * 1000:10.2f} ms (recorded)\n"
+                f"  machine factor    {machine_factor:10.2f} x (calibration {calibration * 1000:.2f} ms "
+                f"vs {recorded['calibration'] * 1000:.2f} ms)\n"
+                f"  expected median   {expected * 1000:10.2f} ms (limit {limit * 1000:.2f} ms, tolerance {tolerance:.0%})\n"
+                f"  measured median   {median * 1000:10.2f} ms ({median / expected:.2f}x of expected)"
+            )
+
+    def test_parse_large_xshd(self):
+        self.check_scenario("parse_xshd_large", lambda: parse_xshd(self.large_xshd_path))
+
+    def test_generate_50k_keywords(self):
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate_textmate_grammar(self.keyword_xshd_data, self.grammar_path)
+        self.check_scenario("generate_textmate_grammar_50k_keywords", run)
+
+    def test_keyword_regex_matching(self):
+        self.check_scenario("keyword_regex_match_1mb",
+                            lambda: sum(1 for _ in self.keyword_regex.finditer(self.source)))
+
+
+if __name__ == '__main__':
+    unittest.main()
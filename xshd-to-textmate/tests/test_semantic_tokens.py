@@ -0,0 +1,65 @@
+import unittest
+import os
+
+from ..src.semantic_tokens import SemanticTokensLegend, encode_semantic_tokens, decode_semantic_tokens
+
+
+class TestSemanticTokens(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.grammar_path = os.path.join(base_dir, 'Examples', 'pcsp.JSON-tmLanguage')
+        cls.model_path = os.path.join(base_dir, 'Examples', 'china.pcsp')
+
+    def test_delta_encoding(self):
+        text = "#define N 12;\n\nvar x = 3; // c"
+        data, legend = encode_semantic_tokens(text, self.grammar_path)
+        self.assertEqual(data.typecode, 'I')
+        self.assertEqual(len(data) % 5, 0)
+
+        types = legend.token_types
+        decoded = [(line, start, length, types[t]) for line, start, length, t, _ in decode_semantic_tokens(data)]
+        self.assertEqual(decoded, [
+            (0, 1, 6, "keyword"),
+            (0, 10, 2, "number"),
+            (2, 0, 3, "keyword"),
+            (2, 8, 1, "number"),
+            (2, 11, 4, "comment"),
+        ])
+        # First token of a new line carries an absolute start character.
+        self.assertEqual(list(data[10:12]), [2, 0])
+
+    def test_legend_interns_scopes(self):
+        legend = SemanticTokensLegend()
+        first = legend.lookup("keyword.control.pcsp")
+        self.assertEqual(first, legend.lookup("keyword.other.pcsp"))
+        self.assertEqual(legend.token_types, ["keyword"])
+
+        type_index, modifiers = legend.lookup("constant.language.pcsp")
+        self.assertEqual(legend.token_types[type_index], "enumMember")
+        self.assertTrue(modifiers & (1 << legend.token_modifiers.index("readonly")))
+
+        custom_index, _ = legend.lookup("meta.assertion.pcsp")
+        self.assertEqual(legend.token_types[custom_index], "meta-assertion")
+        self.assertEqual(legend.to_lsp()["tokenTypes"], legend.token_types)
+
+    def test_utf16_positions(self):
+        # U+1D11E needs two UTF-16 code units, so the keyword after it shifts by one.
+        data, legend = encode_semantic_tokens("// \U0001D11E\nx \U0001D11E var", self.grammar_path)
+        decoded = list(decode_semantic_tokens(data))
+        self.assertEqual(decoded[0][:3], (0, 0, 5))
+        self.assertEqual(decoded[1][:3], (1, 5, 3))
+
+    def test_example_model(self):
+        with open(self.model_path, 'r', encoding='utf-8-sig') as f:
+            text = f.read()
+        data, legend = encode_semantic_tokens(text, self.grammar_path)
+        self.assertGreater(len(data), 0)
+        lines = [line for line, *_ in decode_semantic_tokens(data)]
+        self.assertEqual(lines, sorted(lines))
+        self.assertLess(lines[-1], text.count("\n") + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import random
+
+from ..src.xshd_parser import load_xshd
+from ..src.span_scanner import SpanScanner, Span, build_span_regex, regex_scan
+
+
+SOURCE = """/* header
+   spans lines */ #define N 2; // trailing "not a string"
+var s = "a // b \\" c"; var c = '\\'';
+var t = "unterminated
+P() = a/**/b -> Skip; // last"""
+
+
+def span(name, begin, end, stopateol, escape=None):
+    return {"name": name, "rule": None, "begin": begin, "end": end, "stopateol": stopateol,
+            "escapecharacter": escape}
+
+
+class TestSpanScanner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.china_path = os.path.join(base_dir, 'Examples', 'china.pcsp')
+        cls.scanner = SpanScanner(load_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd')))
+
+    def test_scan(self):
+        found = [(SOURCE[s.start:s.end], s.kind, s.terminator) for s in self.scanner.scan(SOURCE)]
+        self.assertEqual(found, [
+            ("/* header\n   spans lines */", "comment", "end"),
+            ('// trailing "not a string"', "comment", "eol"),
+            ('"a // b \\" c"', "string", "end"),
+            ("'\\''", "string", "end"),
+            ('"unterminated\nP() = a/**/b -> Skip; // last', "string", "eof"),
+        ])
+
+    def test_chunked_scan_matches_regex(self):
+        with open(self.china_path, encoding='utf-8-sig') as f:
+            text = f.read() + SOURCE
+        expected = regex_scan(text, self.scanner.delimiters)
+        self.assertGreater(len(expected), 10)
+        for size in (1, 2, 5, 4096):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(self.scanner.iter_spans(chunks)), expected, size)
+
+    def test_overlapping_delimiters_and_escapes(self):
+        scanner = SpanScanner({"spans": [
+            span("LineComment", "//", None, True), span("DocComment", "///", None, True),
+            span("BlockComment", "/*", "*/", False), span("SqlString", "'", "'", False, "'"),
+            span("Chars", "<<", ">>", True, "\\"), span("Comment", "--", None, True),
+        ]})
+        pattern = build_span_regex(scanner.delimiters)
+        rng = random.Random(7)
+        for _ in range(500):
+            text = "".join(rng.choice("ab/*'<>\\-\n ") for _ in range(rng.randint(0, 40)))
+            expected = regex_scan(text, scanner.delimiters, pattern)
+            for size in (1, 3, 64):
+                chunks = [text[i:i + size] for i in range(0, len(text), size)]
+                self.assertEqual(list(scanner.iter_spans(chunks)), expected, (text, size))
+        # Leftmost-longest begin, doubled quote as escape
+        self.assertEqual(scanner.scan("x /// y\n'it''s' z"), [
+            Span(2, 7, "comment", "DocComment", "eol"), Span(8, 15, "string", "SqlString", "end"),
+        ])
+
+    def test_mask_keeps_positions(self):
+        masked = "".join(self.scanner.mask([SOURCE]))
+        self.assertEqual(len(masked), len(SOURCE))
+        self.assertEqual(masked.count("\n"), SOURCE.count("\n"))
+        self.assertEqual(masked.splitlines()[2], "var s =              ; var c =     ;")
+
+        only_comments = "".join(self.scanner.mask([SOURCE], kinds=["comment"], fill="#"))
+        self.assertIn('"a // b \\" c"', only_comments)
+        self.assertTrue(only_comments.startswith("#########\n"))
+
+    def test_strip(self):
+        text = "a/**/b; /* x\n y */ c; // d\nvar s = \"/* no */\";"
+        self.assertEqual("".join(self.scanner.strip([text], kinds=["comment"])),
+                         "a b; \n c; \nvar s = \"/* no */\";")
+
+    def test_streaming_is_bounded(self):
+        consumed = 0
+
+        def chunks():
+            nonlocal consumed
+            for chunk in ["/*"] + ["x" * 1000] * 200 + ["*/ y"]:
+                consumed += len(chunk)
+                yield chunk
+
+        written = 0
+        for output in self.scanner.mask(chunks()):
+            written += len(output)
+            # Only a partial delimiter is ever held back
+            self.assertGreaterEqual(written, consumed - 2)
+        self.assertEqual(written, consumed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import os
+import tempfile
+import time
+
+from ..src.xshd_parser import load_xshd
+from ..src.symbol_index import SourceLexicon, SymbolIndex, extract_symbols
+
+
+MODEL = """// model
+#define N 12; // constant
+var ball = 0;
+var <Hashtable> table = new Hashtable(64);
+channel pass 0;
+enum {red, green};
+/* Fake() = Skip; */
+P(x) = pass!x -> Q(N);
+Q(n) = [ball == N] Skip;
+var label = "Q() = fake";
+#assert P(1) deadlockfree;
+"""
+
+
+class TestSymbolIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.china_path = os.path.join(base_dir, 'Examples', 'china.pcsp')
+        cls.xshd_data = load_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd'))
+        cls.lexicon = SourceLexicon(cls.xshd_data)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'index.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+        return path
+
+    def test_extract_declarations(self):
+        symbols, references = extract_symbols(MODEL, self.lexicon)
+        declared = {(name, kind) for name, kind, _, _ in symbols}
+        self.assertEqual(declared, {
+            ("N", "constant"), ("ball", "variable"), ("table", "variable"), ("pass", "channel"),
+            ("red", "enumMember"), ("green", "enumMember"), ("P", "process"), ("Q", "process"),
+            ("label", "variable"), ("assert P(1) deadlockfree", "assertion"),
+        })
+        self.assertIn(("P", "process", 7, 0), symbols)
+        # Comments and strings are skipped, keywords are not references
+        referenced = {name for name, _, _ in references}
+        self.assertNotIn("Fake", referenced)
+        self.assertNotIn("fake", referenced)
+        self.assertNotIn("Skip", referenced)
+        self.assertIn(("Q", 7, 17), references)
+        self.assertIn(("N", 8, 16), references)
+        self.assertIn("Hashtable", referenced)
+
+    def test_china_model(self):
+        with open(self.china_path, encoding='utf-8-sig') as f:
+            symbols, _ = extract_symbols(f.read(), self.lexicon)
+        by_name = {name: kind for name, kind, _, _ in symbols}
+        self.assertEqual(by_name["zgoal"], "constant")
+        self.assertEqual(by_name["aloc"], "variable")
+        self.assertEqual(by_name["spass"], "channel")
+        self.assertEqual(by_name["short_pass"], "process")
+        self.assertEqual(by_name["AD"], "process")
+        self.assertIn("assertion", by_name.values())
+
+    def test_queries(self):
+        model_path = self.write('model.pcsp', MODEL)
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            self.assertEqual(index.update(self.tmp_dir.name), {"indexed": 1, "unchanged": 0, "removed": 0})
+            self.assertEqual([s.name for s in index.workspace_symbols("p")], ["P", "pass"])
+            definition = index.definition("Q")
+            self.assertEqual(len(definition), 1)
+            self.assertEqual((definition[0].path, definition[0].line, definition[0].kind),
+                             (os.path.abspath(model_path), 8, "process"))
+            self.assertEqual([r.line for r in index.references("N")], [7, 8])
+            # Go to definition from the reference to Q on line 7
+            self.assertEqual(index.definition_at(model_path, 7, 17), definition)
+            self.assertEqual(index.definition_at(model_path, 0, 0), [])
+
+    def test_incremental_update(self):
+        self.write('a.pcsp', "A() = Skip;\n", mtime=1_000_000_000)
+        self.write('b.pcsp', "B() = A();\n", mtime=1_000_000_000)
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            self.assertEqual(index.update(self.tmp_dir.name)["indexed"], 2)
+
+            # Touched but unchanged content is not re-indexed
+            self.write('a.pcsp', "A() = Skip;\n", mtime=2_000_000_000)
+            self.assertEqual(index.update(self.tmp_dir.name), {"indexed": 0, "unchanged": 2, "removed": 0})
+
+            self.write('b.pcsp', "B2() = A();\n", mtime=3_000_000_000)
+            os.remove(os.path.join(self.tmp_dir.name, 'a.pcsp'))
+            self.assertEqual(index.update(self.tmp_dir.name), {"indexed": 1, "unchanged": 0, "removed": 1})
+            self.assertEqual(index.definition("A"), [])
+            self.assertEqual(index.definition("B"), [])
+            self.assertEqual([s.name for s in index.definition("B2")], ["B2"])
+
+        # The index persists across sessions
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            self.assertEqual(index.update(self.tmp_dir.name)["unchanged"], 1)
+            self.assertEqual(len(index.references("A")), 1)
+
+    def test_files_gone_before_they_are_read(self):
+        a_path = self.write('a.pcsp', "A() = Skip;\n")
+        self.write('b.pcsp', "B() = A();\n")
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            index.update(self.tmp_dir.name)
+            # Dangling links are listed by the directory walk, but cannot be stat'ed
+            os.remove(a_path)
+            os.symlink(os.path.join(self.tmp_dir.name, 'missing.pcsp'), a_path)
+            os.symlink(os.path.join(self.tmp_dir.name, 'missing.pcsp'), os.path.join(self.tmp_dir.name, 'c.pcsp'))
+            self.assertEqual(index.update(self.tmp_dir.name), {"indexed": 0, "unchanged": 1, "removed": 1})
+            self.assertEqual(index.definition("A"), [])
+            self.assertEqual(len(index.definition("B")), 1)
+
+    def test_lexicon_change_rebuilds(self):
+        self.write('a.pcsp', "A() = Skip;\n")
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            index.update(self.tmp_dir.name)
+        changed = dict(self.xshd_data, keywords=dict(self.xshd_data["keywords"], Extra=["A"]))
+        with SymbolIndex(self.db_path, changed) as index:
+            self.assertEqual(index.update(self.tmp_dir.name)["indexed"], 1)
+            self.assertEqual(index.definition("A"), [])
+
+    @unittest.skipIf(os.environ.get("XSHD_PERF_SKIP") == "1", "timing assertions disabled by XSHD_PERF_SKIP")
+    def test_queries_are_fast(self):
+        models = os.path.join(self.tmp_dir.name, 'models')
+        os.makedirs(models)
+        for i in range(200):
+            with open(os.path.join(models, f'm{i}.pcsp'), 'w') as f:
+                f.write("".join(f"#define c{i}x{j} {j};\nP{i}x{j}() = e -> P{i}x{j}();\n" for j in range(50)))
+        with SymbolIndex(self.db_path, self.xshd_data) as index:
+            index.update(models)
+            start = time.perf_counter()
+            for i in range(100):
+                index.workspace_symbols(f"p{i}x")
+                index.definition(f"c{i}x7")
+            elapsed = (time.perf_counter() - start) / 200
+        self.assertLess(elapsed, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
 import unittest
 import os
 import json
+import re
+import tempfile
 
-from ..src.xshd_parser import parse_xshd
-from ..src.textmate_generator import generate_textmate_grammar, escape_regex
+from ..src.xshd_parser import parse_xshd, parse_xshd_string
+from ..src.textmate_generator import generate_textmate_grammar, escape_regex, build_textmate_grammar, deduplicate_rules
+from ..src.textmate_generator import write_textmate_grammar, write_textmate_grammar_stream, KeywordPattern
+from ..src.textmate_tokenizer import load_grammar
 
 class TestTextMateGenerator(unittest.TestCase):
 
@@ -233,6 +237,138 @@ class TestTextMateGenerator(unittest.TestCase):
         if os.path.exists(output_path):
             os.remove(output_path)
 
+    def test_duplicate_rules_are_emitted_once(self):
+        # Two RuleSets redefining the same String span, as in Examples/Syntax.xshd
+        string_def = {"begin": "\"", "end": "\"", "name": "String", "stopateol": False}
+        char_def = {"begin": "'", "end": "'", "name": "Character", "stopateol": True}
+        raw_def = {"begin": "`", "end": "`", "name": "Raw", "stopateol": False}
+        dup_xshd = {
+            "name": "DupLang", "extensions": [".dup"],
+            "rulesets": [{"ignorecase": False}, {"ignorecase": False}],
+            "strings": [string_def, char_def, raw_def, dict(string_def), dict(char_def)],
+            "keywords": {"A": ["x", "y"], "B": ["x", "y"]},
+            "comments": {}, "digits": None, "spans": [],
+        }
+        grammar = build_textmate_grammar(dup_xshd)
+        repository = grammar["repository"]
+
+        # The repeated String and Character rules are emitted once
+        string_rules = repository["strings"]["patterns"]
+        self.assertEqual(len(string_rules), 3)
+        self.assertEqual([rule["name"].split(".")[3] for rule in string_rules], ["string", "character", "raw"])
+        self.assertEqual(string_rules[1]["match"], "'(?:[^'\\\\\\n]++|\\\\.)*+(?:'|$)")
+
+        # The escape rule shared by both multi-line strings lives in the repository once
+        escape_name = "constant_character_escape_duplang"
+        self.assertIn(escape_name, repository)
+        for rule in (string_rules[0], string_rules[2]):
+            self.assertEqual(rule["patterns"][1], {"include": f"#{escape_name}"})
+
+        # Identical keyword rules from two categories are shared as well
+        keyword_patterns = repository["keywords"]["patterns"]
+        self.assertEqual(len(keyword_patterns), 1)
+
+        # Every include points at an existing repository entry
+        for include in set(re.findall(r'"include": "#([^"]+)"', json.dumps(grammar))):
+            self.assertTrue(include == "self" or include in repository, include)
+
+    def test_deduplicate_rules_shares_across_sections(self):
+        rule = {"name": "meta.x.lang", "match": "x"}
+        grammar = {
+            "name": "X", "scopeName": "source.x", "patterns": [],
+            "repository": {"a": {"patterns": [dict(rule)]}, "b": {"patterns": [dict(rule), {"match": "y"}]}},
+        }
+        deduped = deduplicate_rules(grammar)
+        self.assertEqual(deduped["repository"]["a"]["patterns"], [{"include": "#meta_x_lang"}])
+        self.assertEqual(deduped["repository"]["b"]["patterns"][0], {"include": "#meta_x_lang"})
+        self.assertEqual(deduped["repository"]["meta_x_lang"], rule)
+        # The input grammar is left untouched
+        self.assertEqual(grammar["repository"]["a"]["patterns"], [rule])
+
+    def test_string_rules_follow_escapecharacter(self):
+        xshd_data = {
+            "name": "EscLang", "rulesets": [{"ignorecase": False}], "keywords": {"K": ["var"]},
+            "comments": {}, "digits": None, "spans": [],
+            "strings": [
+                {"begin": "\"", "end": "\"", "name": "String", "stopateol": False, "escapecharacter": "\\"},
+                {"begin": "'", "end": "'", "name": "Character", "stopateol": True, "escapecharacter": "\\"},
+                {"begin": "`", "end": "`", "name": "Raw", "stopateol": False, "escapecharacter": None},
+                {"begin": "<", "end": ">", "name": "Angle", "stopateol": True, "escapecharacter": "^"},
+            ],
+        }
+        grammar = build_textmate_grammar(xshd_data)
+        rules = {rule["name"].split(".")[3]: rule for rule in grammar["repository"]["strings"]["patterns"]}
+
+        # Single-line strings are one possessive match that cannot run past the end of the line
+        self.assertEqual(rules["character"]["match"], "'(?:[^'\\\\\\n]++|\\\\.)*+(?:'|$)")
+        self.assertNotIn("begin", rules["character"])
+        self.assertEqual(rules["angle"]["match"], "<(?:[^>\\^\\n]++|\\^.)*+(?:>|$)")
+        # Multi-line strings keep begin/end: a possessive run of ordinary characters, then
+        # an escape rule only when one is declared
+        self.assertEqual(rules["string"]["patterns"], [
+            {"match": '[^"\\\\]++'},
+            {"match": "\\\\.", "name": "constant.character.escape.esclang"},
+        ])
+        self.assertNotIn("patterns", rules["raw"])
+
+        tokenizer = load_grammar(grammar)
+        tokens, state = tokenizer.tokenize_line("var c = '\\'' + 'unterminated")
+        self.assertEqual(state, ())
+        strings = [(s, e) for s, e, scopes in tokens if scopes[-1].startswith("string")]
+        self.assertEqual(strings, [(8, 12), (15, 28)])
+        tokens, _ = tokenizer.tokenize_line("var next", state)
+        self.assertEqual(tokens[0][2][-1], "keyword.other.esclang")
+
+    def test_streamed_grammar_is_identical(self):
+        keywords = [f"api{i}.call" for i in range(3000)] + ["a|b", "c-d"]
+        xshd_data = dict(self.parsed_sample_xshd_data)
+        xshd_data["keywords"] = dict(xshd_data["keywords"], Api=keywords, ApiAgain=list(keywords))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            materialized = os.path.join(tmp_dir, "a.tmLanguage.json")
+            streamed = os.path.join(tmp_dir, "b.tmLanguage.json")
+            write_textmate_grammar(build_textmate_grammar(xshd_data), materialized)
+            write_textmate_grammar_stream(xshd_data, streamed)
+            with open(materialized) as a, open(streamed) as b:
+                self.assertEqual(a.read(), b.read())
+            with open(streamed) as f:
+                grammar = json.load(f)
+        # Identical categories are still deduplicated without building their regex
+        api_rules = [rule for rule in grammar["repository"]["keywords"]["patterns"] if "api0" in rule["match"]]
+        self.assertEqual(len(api_rules), 1)
+
+    def test_keyword_pattern_chunks(self):
+        class SmallBatches(KeywordPattern):
+            __slots__ = ()
+            BATCH_SIZE = 2
+
+        pattern = SmallBatches(["ab", "a.c", "abcd"], ignorecase=True)
+        self.assertEqual(list(pattern.chunks()), ["(?i)\\b(", "abcd|a\\.c", "|ab", ")\\b"])
+        self.assertEqual(str(pattern), "(?i)\\b(abcd|a\\.c|ab)\\b")
+        self.assertEqual(pattern.digest(), KeywordPattern(["abcd", "ab", "a.c"], True).digest())
+
+    def test_doubled_end_delimiter_escapes_itself(self):
+        xshd_data = {
+            "name": "DblLang", "rulesets": [{"ignorecase": False}], "keywords": {"K": ["var"]},
+            "comments": {}, "digits": None, "spans": [],
+            "strings": [
+                {"begin": "\"", "end": "\"", "name": "String", "stopateol": False, "escapecharacter": "\""},
+                {"begin": "'", "end": "'", "name": "Character", "stopateol": True, "escapecharacter": "'"},
+            ],
+        }
+        grammar = build_textmate_grammar(xshd_data)
+        rules = {rule["name"].split(".")[3]: rule for rule in grammar["repository"]["strings"]["patterns"]}
+        self.assertEqual(rules["character"]["match"], "'(?:[^'\\n]++|'')*+(?:'|$)")
+        self.assertEqual([rule["match"] for rule in rules["string"]["patterns"]], ['[^"]++', '""'])
+        self.assertTrue(rules["string"]["applyEndPatternLast"])
+
+        tokenizer = load_grammar(grammar)
+        line = "var c = 'it''s' + \"say \"\"hi\"\"\" var"
+        tokens, state = tokenizer.tokenize_line(line)
+        self.assertEqual(state, ())
+        strings = [(s, e) for s, e, scopes in tokens if scopes[1:2] and scopes[1].startswith("string")]
+        self.assertEqual((strings[0], strings[1][0], strings[-1][1]), ((8, 15), 18, 30))
+        self.assertEqual(tokens[-1][2][-1], "keyword.other.dbllang")
+
     def test_empty_input_for_generator(self):
         # Test with completely empty or invalid xshd_data
         generate_textmate_grammar({}, os.path.join(self.output_dir, "empty_input.tmLanguage.json"))
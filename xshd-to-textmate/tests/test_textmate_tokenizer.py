@@ -0,0 +1,97 @@
+import unittest
+import os
+
+from ..src.textmate_tokenizer import load_grammar, split_lines, grammar_hash
+
+
+class TestTextMateTokenizer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.grammar = load_grammar(os.path.join(base_dir, 'Examples', 'pcsp.JSON-tmLanguage'))
+
+    def scopes_of(self, line, state=()):
+        tokens, end_state = self.grammar.tokenize_line(line, state)
+        return [(line[s:e], scopes[-1]) for s, e, scopes in tokens], end_state
+
+    def test_tokens_cover_the_line(self):
+        line = '#define N 12; // players'
+        tokens, _ = self.grammar.tokenize_line(line)
+        self.assertEqual(tokens[0][0], 0)
+        self.assertEqual(tokens[-1][1], len(line))
+        for (_, end, _), (start, _, _) in zip(tokens, tokens[1:]):
+            self.assertEqual(end, start)
+
+    def test_keywords_numbers_and_comments(self):
+        scopes, state = self.scopes_of('#define N 12; // players')
+        self.assertIn(('define', 'keyword.control.probabilitycspmodel'), scopes)
+        self.assertIn(('12', 'constant.numeric.probabilitycspmodel'), scopes)
+        self.assertIn(('// players', 'comment.line.//.probabilitycspmodel'), scopes)
+        self.assertEqual(state, ())
+
+    def test_block_comment_state_spans_lines(self):
+        _, state = self.scopes_of('var x = 1; /* start')
+        self.assertNotEqual(state, ())
+        scopes, state = self.scopes_of('still inside */ var y;', state)
+        self.assertEqual(scopes[0], ('still inside ', 'comment.block.probabilitycspmodel'))
+        self.assertIn(('var', 'keyword.control.probabilitycspmodel'), scopes)
+        self.assertEqual(state, ())
+
+    def test_string_escapes(self):
+        scopes, _ = self.scopes_of('"a\\"b"')
+        self.assertIn(('\\"', 'constant.character.escape.probabilitycspmodel'), scopes)
+        self.assertTrue(all(scope.startswith(('string', 'constant')) for _, scope in scopes))
+
+    def test_captures_and_content_name(self):
+        grammar = load_grammar({
+            "scopeName": "source.cap",
+            "patterns": [
+                {"match": "(let) (\\w+)", "name": "meta.let.cap",
+                 "captures": {"1": {"name": "keyword.cap"}, "2": {"name": "variable.cap"}}},
+                {"begin": "<", "end": ">", "name": "meta.tag.cap", "contentName": "string.tag.cap"},
+            ],
+        })
+        tokens, _ = grammar.tokenize_line("let x <y>")
+        by_text = {"let x <y>"[s:e]: scopes for s, e, scopes in tokens}
+        self.assertEqual(by_text["let"], ("source.cap", "meta.let.cap", "keyword.cap"))
+        self.assertEqual(by_text["x"], ("source.cap", "meta.let.cap", "variable.cap"))
+        self.assertEqual(by_text["<"], ("source.cap", "meta.tag.cap"))
+        self.assertEqual(by_text["y"], ("source.cap", "meta.tag.cap", "string.tag.cap"))
+
+    def test_empty_matches_do_not_loop(self):
+        grammar = load_grammar({"scopeName": "source.empty", "patterns": [{"match": "x*", "name": "x.empty"}]})
+        tokens, _ = grammar.tokenize_line("abxxc")
+        self.assertEqual(tokens[-1][1], 5)
+
+    def test_split_lines_and_hash(self):
+        self.assertEqual(split_lines("a\r\nb\rc\n"), ["a", "b", "c", ""])
+        self.assertEqual(grammar_hash({"a": 1, "b": 2}), grammar_hash({"b": 2, "a": 1}))
+
+    def test_state_keys_survive_a_new_grammar(self):
+        _, state = self.scopes_of('var x = 1; /* start')
+        keys = self.grammar.state_keys(state)
+        self.assertEqual(keys, ("source.probabilitycspmodel#/repository/comments/patterns/1",))
+        fresh = load_grammar(self.grammar.raw)
+        self.assertEqual(self.scopes_of('end */', state)[0],
+                         [(line[s:e], scopes[-1]) for line in ['end */']
+                          for s, e, scopes in fresh.tokenize_line(line, fresh.state_from_keys(keys))[0]])
+        self.assertIsNone(fresh.state_from_keys(("source.probabilitycspmodel#/repository/missing",)))
+
+    def test_advance_matches_tokenize_lines(self):
+        lines = ['x = "a /* b";', 'var y; /* open', 'still comment "', 'end */ z = 1;', '', 'w']
+        expected = [state for _, state in self.grammar.tokenize_lines(lines)]
+        for start in range(len(lines)):
+            for stop in range(start, len(lines) + 1):
+                state = expected[start - 1] if start else ()
+                text = "".join(line + "\n" for line in lines[start:stop])
+                self.assertEqual(self.grammar.advance(text, state)[0], expected[stop - 1] if stop else ())
+        self.assertEqual(self.grammar.advance("a\nb\n")[1], 0)  # Nothing to tokenize
+        # Inside a block, a lookbehind would see the previous line's newline; searched per line
+        grammar = load_grammar({"scopeName": "source.t", "patterns": [
+            {"begin": "(?<!\\s)<", "end": ">", "name": "meta.tag.t"}]})
+        self.assertEqual(grammar.advance("x\n<\n")[0], grammar.tokenize_line("<", ())[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import copy
+import os
+import tempfile
+
+from ..src.xshd_parser import load_xshd
+from ..src.textmate_generator import build_textmate_grammar
+from ..src.tokdiff import compare_grammars, first_divergence, format_report, _merge
+
+
+SOURCE = """#define N 2;
+P() = a -> Skip; // done
+/* block */ Q() = P();
+"""
+
+
+class TestTokdiff(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.examples = os.path.join(base_dir, 'Examples')
+        cls.grammar = build_textmate_grammar(load_xshd(os.path.join(cls.examples, 'Syntax.xshd')))
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, 'models'))
+        for name, text in (('a.pcsp', SOURCE), ('b.pcsp', "P() = a -> Skip;\n"), ('notes.txt', "// ignored")):
+            with open(os.path.join(self.tmp_dir.name, 'models', name), 'w') as f:
+                f.write(text)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_equivalent_grammars(self):
+        checked_in = os.path.join(self.examples, 'pcsp.JSON-tmLanguage')
+        report = compare_grammars(checked_in, self.grammar, [os.path.join(self.examples, 'china.pcsp'),
+                                                             os.path.join(self.tmp_dir.name, 'models')], workers=2)
+        self.assertEqual(report["summary"], {"files": 3, "identical": 3, "divergent": 0, "errors": 0,
+                                             "skipped_rules": 0})
+        self.assertGreater(report["files"][0]["tokens"], 1000)  # Largest file first
+        self.assertGreater(report["throughput"]["a"]["lines_per_second"], 0)
+
+    def test_first_divergent_token(self):
+        changed = copy.deepcopy(self.grammar)
+        changed["repository"]["comments"]["patterns"][0]["name"] = "comment.line.changed"
+        report = compare_grammars(self.grammar, changed, [os.path.join(self.tmp_dir.name, 'models')], workers=1)
+        self.assertEqual(report["summary"]["divergent"], 1)
+        divergence = next(r for r in report["files"] if r["divergence"])["divergence"]
+        self.assertEqual((divergence["line"], divergence["column"]), (1, 17))
+        self.assertEqual(divergence["a"]["scopes"][-1], "comment.line.//.probabilitycspmodel")
+        self.assertEqual(divergence["b"]["scopes"][-1], "comment.line.changed")
+        self.assertIn("a.pcsp:2:18", format_report(report))
+
+    def test_uncompilable_rules_are_reported(self):
+        # \h is Oniguruma-only: both rules are disabled, so the files tokenize identically
+        hex_a, hex_b = copy.deepcopy(self.grammar), copy.deepcopy(self.grammar)
+        hex_a["patterns"].insert(0, {"match": r"\b\h+\b", "name": "constant.numeric.hex"})
+        hex_b["patterns"].insert(0, {"match": r"\b\h{2}\b", "name": "constant.numeric.hex"})
+        report = compare_grammars(hex_a, hex_b, [os.path.join(self.tmp_dir.name, 'models')], workers=1)
+        self.assertEqual(report["summary"]["identical"], 2)
+        self.assertEqual(report["summary"]["skipped_rules"], 2)
+        scope = self.grammar["scopeName"]
+        self.assertEqual(report["skipped_rules"], {"a": [f"{scope}#/patterns/0/match"],
+                                                   "b": [f"{scope}#/patterns/0/match"]})
+        self.assertIn(f"SKIPPED   a: {scope}#/patterns/0/match", format_report(report))
+
+    def test_token_boundaries(self):
+        scopes = ("source",)
+        split = [[(0, 2, scopes), (2, 5, scopes)]]
+        whole = [[(0, 5, scopes)]]
+        divergence = first_divergence(["abcde"], split, whole)
+        self.assertEqual((divergence["column"], divergence["a"]["end"], divergence["b"]["end"]), (0, 2, 5))
+        self.assertIsNone(first_divergence(["abcde"], [_merge(split[0])], whole))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import copy
+import json
+import os
+import tempfile
+import time
+
+from ..src.textmate_tokenizer import load_grammar, split_lines
+from ..src.token_cache import TokenCache, TokenSnapshot, tokenize_snapshot
+
+
+class TestTokenCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.grammar = load_grammar(os.path.join(base_dir, 'Examples', 'pcsp.JSON-tmLanguage'))
+        with open(os.path.join(base_dir, 'Examples', 'china.pcsp'), encoding='utf-8-sig') as f:
+            cls.china = f.read()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        self.model = os.path.join(self.tmp_dir.name, 'model.pcsp')
+        self.write(self.china)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, text):
+        with open(self.model, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def assertMatchesTokenizer(self, snapshot, text):
+        lines = split_lines(text)
+        self.assertEqual(snapshot.line_count, len(lines))
+        for line, (tokens, state) in enumerate(self.grammar.tokenize_lines(lines)):
+            self.assertEqual(snapshot.line_tokens(line), tokens, line)
+            self.assertEqual(snapshot.end_state_keys(line), self.grammar.state_keys(state), line)
+
+    def test_miss_then_hit(self):
+        cache = TokenCache(self.cache_dir, self.grammar)
+        with cache.tokens(self.model) as snapshot:
+            self.assertMatchesTokenizer(snapshot, self.china)
+        with cache.tokens(self.model) as snapshot:
+            self.assertIsInstance(snapshot.columns, memoryview)
+            self.assertMatchesTokenizer(snapshot, self.china)
+        self.assertEqual((cache.stats["misses"], cache.stats["hits"]), (1, 1))
+        # Another process (a new cache object) finds the snapshot too
+        other = TokenCache(self.cache_dir, load_grammar(self.grammar.raw))
+        other.tokens(self.model).close()
+        self.assertEqual(other.stats["hits"], 1)
+
+    def test_grammar_change_misses(self):
+        TokenCache(self.cache_dir, self.grammar).tokens(self.model).close()
+        changed = copy.deepcopy(self.grammar.raw)
+        changed["repository"]["comments"]["patterns"][0]["name"] = "comment.line.changed"
+        cache = TokenCache(self.cache_dir, changed)
+        cache.tokens(self.model).close()
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_registry_grammar_change_misses(self):
+        included = os.path.join(self.tmp_dir.name, 'included.tmLanguage.json')
+        root = {"scopeName": "source.root", "patterns": [{"include": "source.included"}]}
+
+        def cache_with(name):
+            with open(included, 'w') as f:
+                json.dump({"scopeName": "source.included", "patterns": [{"match": "Skip", "name": name}]}, f)
+            return TokenCache(self.cache_dir, load_grammar(root, {"source.included": included}))
+
+        cache_with("keyword.one").tokens(self.model).close()
+        cache = cache_with("keyword.two")
+        with cache.tokens(self.model) as snapshot:
+            line = next(i for i, text in enumerate(split_lines(self.china)) if "Skip" in text)
+            self.assertIn("keyword.two", [scopes[-1] for _, _, scopes in snapshot.line_tokens(line)])
+        self.assertEqual(cache.stats["misses"], 1)
+        self.assertEqual(cache_with("keyword.two").grammar_hash, cache.grammar_hash)
+        self.assertNotEqual(cache.grammar_hash, load_grammar(root).hash)
+
+    def test_snapshots_shared_by_paths_are_kept(self):
+        other = os.path.join(self.tmp_dir.name, 'copy.pcsp')
+        with open(other, 'w', encoding='utf-8') as f:
+            f.write(self.china)
+        cache = TokenCache(self.cache_dir, self.grammar)
+        cache.tokens(self.model).close()
+        cache.tokens(other).close()
+        self.write(self.china + "P() = Skip;\n")
+        cache.tokens(self.model).close()
+        # copy.pcsp still has the old content, whose snapshot is kept
+        cache.tokens(other).close()
+        self.assertEqual((cache.stats["misses"], cache.stats["hits"]), (2, 2))
+        with open(other, 'w', encoding='utf-8') as f:
+            f.write(self.china + "Q() = Skip;\n")
+        cache.tokens(other).close()
+        snapshots = [name for name in os.listdir(self.cache_dir) if name.endswith(".tok")]
+        self.assertEqual(len(snapshots), 2)
+
+    def test_edits_reuse_line_states(self):
+        cache = TokenCache(self.cache_dir, self.grammar)
+        cache.tokens(self.model).close()
+        lines = self.china.split("\n")
+        middle = len(lines) // 2
+        lines[middle] += " /* opened"
+        lines[middle + 2] = "closed */ " + lines[middle + 2]
+        edited = "\n".join(lines)
+        self.write(edited)
+        with cache.tokens(self.model) as snapshot:
+            self.assertMatchesTokenizer(snapshot, edited)
+        self.assertEqual(cache.stats["tokenized_lines"], len(split_lines(self.china)) + 3)
+        # The snapshot of the old version is replaced
+        snapshots = [name for name in os.listdir(self.cache_dir) if name.endswith(".tok")]
+        self.assertEqual(len(snapshots), 1)
+
+        # Deleting the commented lines leaves the following lines in their old state
+        del lines[middle:middle + 3]
+        shortened = "\n".join(lines)
+        previous = TokenSnapshot.open(os.path.join(self.cache_dir, snapshots[0]))
+        snapshot, tokenized = tokenize_snapshot(self.grammar, shortened, previous=previous)
+        previous.close()
+        self.assertEqual(tokenized, 0)
+        self.assertMatchesTokenizer(snapshot, shortened)
+
+    @unittest.skipIf(os.environ.get("XSHD_PERF_SKIP") == "1", "timing assertions disabled by XSHD_PERF_SKIP")
+    def test_hits_do_not_depend_on_file_size(self):
+        self.write(self.china * 50)
+        cache = TokenCache(self.cache_dir, self.grammar)
+        cache.tokens(self.model).close()
+        start = time.perf_counter()
+        for _ in range(20):
+            with cache.tokens(self.model) as snapshot:
+                snapshot.line_tokens(snapshot.line_count - 1)
+        self.assertLess((time.perf_counter() - start) / 20, 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
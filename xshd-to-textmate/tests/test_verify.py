@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+
+from ..src.xshd_parser import load_xshd
+from ..src.verify import find_assertions, derive_model, parse_verdict, verify_model, checker_arguments
+
+
+MODEL = """#define N 2;
+P() = a -> P();
+// #assert P() commented;
+var s = "#assert P() in string;";
+#assert P() deadlockfree;
+#assert P() |= [] <> bad;
+#assert P() reaches goal
+    with prob;
+"""
+
+
+class TestVerify(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.xshd_data = load_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd'))
+        cls.china_path = os.path.join(base_dir, 'Examples', 'china.pcsp')
+        checker_path = os.path.join(os.path.dirname(__file__), 'fixtures', 'fake_checker.py')
+        cls.checker = f'"{sys.executable}" "{checker_path}" -pcsp {{model}} {{output}}'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.pcsp')
+        with open(self.model_path, 'w') as f:
+            f.write(MODEL)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_find_assertions(self):
+        assertions = find_assertions(MODEL, self.xshd_data)
+        self.assertEqual([a.text for a in assertions], [
+            "#assert P() deadlockfree;", "#assert P() |= [] <> bad;", "#assert P() reaches goal with prob;",
+        ])
+        self.assertEqual([a.line for a in assertions], [4, 5, 6])
+        self.assertTrue(MODEL[assertions[2].start:assertions[2].end].endswith("with prob;"))
+
+        with open(self.china_path, encoding='utf-8-sig') as f:
+            china = f.read()
+        self.assertEqual(len(find_assertions(china, self.xshd_data)), china.count("\n#assert"))
+
+    def test_derived_models_keep_positions(self):
+        assertions = find_assertions(MODEL, self.xshd_data)
+        derived = derive_model(MODEL, assertions, 1)
+        self.assertEqual(len(derived), len(MODEL))
+        self.assertEqual(derived.splitlines()[5], "#assert P() |= [] <> bad;")
+        self.assertEqual(derived.count("#assert P()"), 3)  # The kept one, plus the comment and string
+        self.assertNotIn("deadlockfree", derived)
+
+    def test_parse_verdict(self):
+        self.assertEqual(parse_verdict("The Assertion (P() deadlockfree) is VALID."), ("valid", None))
+        self.assertEqual(parse_verdict("The Assertion (P() deadlockfree) is NOT valid."), ("invalid", None))
+        self.assertEqual(parse_verdict("is Valid with Probability [0.1, 0.2];"), ("valid", (0.1, 0.2)))
+        self.assertEqual(parse_verdict("no verdict here"), (None, None))
+
+    def test_checker_arguments(self):
+        self.assertEqual(checker_arguments('"my checker" -pcsp {model} {output}', "/a b/m.pcsp", "/o"),
+                         ["my checker", "-pcsp", "/a b/m.pcsp", "/o"])
+
+    def test_verify_model_merges_results(self):
+        report = verify_model(self.model_path, self.xshd_data, self.checker, workers=2)
+        self.assertEqual(report["summary"], {"valid": 2, "invalid": 1, "error": 0})
+        verdicts = [(entry["line"], entry["verdict"], entry["probability"]) for entry in report["assertions"]]
+        self.assertEqual(verdicts, [(4, "valid", None), (5, "invalid", None), (6, "valid", (0.25, 0.5))])
+
+    def test_includes_resolve_next_to_the_model(self):
+        with open(os.path.join(self.tmp_dir.name, 'lib.csp'), 'w') as f:
+            f.write("Q() = b -> Q();\n")
+        with open(self.model_path, 'w') as f:
+            f.write('#include "lib.csp";\n// #include "ignored.csp";\n' + MODEL)
+        with tempfile.TemporaryDirectory() as work_dir:
+            report = verify_model(self.model_path, self.xshd_data, self.checker, workers=2, work_dir=work_dir)
+            with open(os.path.join(work_dir, 'model.assert0.pcsp')) as f:
+                derived = f.read()
+        self.assertEqual(report["summary"], {"valid": 2, "invalid": 1, "error": 0})
+        self.assertEqual([entry["line"] for entry in report["assertions"]], [6, 7, 8])
+        self.assertTrue(derived.startswith(f'#include "{os.path.join(self.tmp_dir.name, "lib.csp")}";'))
+        self.assertIn('// #include "ignored.csp";', derived)
+
+    def test_checker_failures_are_reported(self):
+        report = verify_model(self.model_path, self.xshd_data, "does-not-exist-checker {model} {output}")
+        self.assertEqual(report["summary"]["error"], 3)
+        self.assertTrue(report["assertions"][0]["output"])
+
+    @unittest.skipIf(os.environ.get("XSHD_PERF_SKIP") == "1", "timing assertions disabled by XSHD_PERF_SKIP")
+    def test_assertions_run_concurrently(self):
+        os.environ["FAKE_CHECKER_SLEEP"] = "0.5"
+        try:
+            start = time.perf_counter()
+            report = verify_model(self.model_path, self.xshd_data, self.checker, workers=3)
+            elapsed = time.perf_counter() - start
+        finally:
+            del os.environ["FAKE_CHECKER_SLEEP"]
+        self.assertEqual(report["summary"]["error"], 0)
+        # Three 0.5 s checks take well under the 1.5 s of a sequential run
+        self.assertLess(elapsed, 1.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import random
+import tempfile
+
+from ..src.textmate_tokenizer import load_grammar, split_lines
+from ..src.viewport import LineIndex, ViewportTokenizer
+
+
+class TestViewport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.grammar = load_grammar(os.path.join(base_dir, 'Examples', 'pcsp.JSON-tmLanguage'))
+        with open(os.path.join(base_dir, 'Examples', 'china.pcsp'), encoding='utf-8-sig') as f:
+            cls.china = f.read()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, content: bytes) -> str:
+        path = os.path.join(self.tmp_dir.name, 'model.pcsp')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_line_index(self):
+        text = "a\r\nbé\rc\n\nd"
+        with LineIndex(self.write(b"\xef\xbb\xbf" + text.encode())) as index:
+            self.assertEqual(len(index), 5)
+            self.assertEqual(index.lines(0, 5), split_lines(text))
+            self.assertEqual(index.lines(1, 3), ["bé", "c"])
+            self.assertEqual(index.text(3, 9), "\nd\n")
+        with LineIndex(self.write(b"")) as index:
+            self.assertEqual((len(index), index.lines(0, 1)), (1, [""]))
+
+    def test_viewports_match_a_full_tokenization(self):
+        # A block comment and a string left open across checkpoint boundaries
+        text = self.china + "/* open\n" + "x\n" * 10 + "*/ P() = Skip;\n" + self.china[:2000]
+        lines = split_lines(text)
+        expected = [tokens for tokens, _ in self.grammar.tokenize_lines(lines)]
+        rng = random.Random(7)
+        with ViewportTokenizer(self.grammar, self.write(text.replace("\n", "\r\n").encode()), interval=37) as viewport:
+            self.assertEqual(len(viewport), len(lines))
+            for _ in range(60):
+                start = rng.randrange(len(lines))
+                stop = start + rng.randint(0, 40)
+                self.assertEqual(viewport.tokenize(start, stop), expected[start:stop], (start, stop))
+            self.assertEqual(viewport.tokenize(len(lines) - 3, len(lines) + 10), expected[-3:])
+
+    def test_first_paint_skips_lines(self):
+        repeated = (self.china.rstrip("\n") + "\n") * 20
+        with ViewportTokenizer(self.grammar, self.write(repeated.encode())) as viewport:
+            target = len(viewport) - 30
+            tokens = viewport.tokenize(target, target + 20)
+            lines = split_lines(repeated)
+            state = viewport.state_at(target)
+            self.assertEqual(tokens, [t for t, _ in self.grammar.tokenize_lines(lines[target:target + 20], state)])
+            # Only lines on which a comment, string or span may begin are tokenized on the way
+            self.assertLess(viewport.stats["tokenized_lines"], target // 5)
+            self.assertGreater(viewport.stats["skipped_lines"], target // 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import tempfile
+
+from ..src import workload
+from ..src.workload import generate_xshd, generate_pcsp, scaled_parameters, write_workload, xshd_shape
+from ..src.xshd_parser import parse_xshd
+
+
+class TestWorkload(unittest.TestCase):
+
+    def parse_text(self, xshd_text):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.xshd', delete=False) as f:
+            f.write(xshd_text)
+            path = f.name
+        try:
+            return parse_xshd(path)
+        finally:
+            os.remove(path)
+
+    def test_generated_xshd_counts(self):
+        data = self.parse_text(generate_xshd(seed=3, rulesets=3, categories=4, keys_per_category=10,
+                                             spans=6, nesting_depth=2))
+        self.assertIsNotNone(data)
+        self.assertEqual(len(data["rulesets"]), 3)
+        self.assertEqual(len(data["keywords"]), 12)
+        self.assertEqual(sum(len(kw) for kw in data["keywords"].values()), 120)
+        self.assertEqual(len(data["spans"]), 18)
+        for rs in data["rulesets"]:
+            self.assertEqual(len(rs["spans"]), 6)
+
+        # Nesting chain: main -> Nested1RuleSet -> Nested2RuleSet
+        rules = [span["rule"] for span in data["spans"] if span["rule"]]
+        self.assertEqual(rules, ["Nested1RuleSet", "Nested2RuleSet"])
+
+        # String and comment spans are recognised by the parser
+        self.assertIn("//", data["comments"]["line_comment_start"])
+        self.assertIn("/*", data["comments"]["block_comment_start"])
+        self.assertTrue(any(s["begin"] == '"' for s in data["strings"]))
+
+    def test_xshd_is_deterministic(self):
+        self.assertEqual(generate_xshd(seed=7, categories=2), generate_xshd(seed=7, categories=2))
+        self.assertNotEqual(generate_xshd(seed=7, categories=2), generate_xshd(seed=8, categories=2))
+
+    def test_generated_pcsp(self):
+        keywords = ["alphaKey", "betaKey"]
+        source = generate_pcsp(20000, keywords, seed=1)
+        self.assertGreaterEqual(len(source), 20000)
+        self.assertLess(len(source), 21000)
+        self.assertEqual(source, generate_pcsp(20000, keywords, seed=1))
+        self.assertIn("#define", source)
+        self.assertIn("#assert", source)
+        self.assertTrue(any(kw in source for kw in keywords))
+        self.assertEqual(source.count("/*"), source.count("*/"))
+
+    def test_scaled_parameters_grow(self):
+        small, large = scaled_parameters(1), scaled_parameters(100)
+        small_keys = small["rulesets"] * small["categories"] * small["keys_per_category"]
+        large_keys = large["rulesets"] * large["categories"] * large["keys_per_category"]
+        self.assertGreaterEqual(large_keys, 100 * workload.BASE_KEYS)
+        self.assertLess(large_keys, 110 * small_keys)
+        self.assertEqual(large["pcsp_bytes"], 100 * small["pcsp_bytes"])
+        self.assertLess(large["nesting_depth"], large["rulesets"])
+
+    def test_base_scale_has_the_shape_of_the_example(self):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        example = xshd_shape(parse_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd')))
+        self.assertEqual(example, {"rulesets": workload.BASE_RULESETS, "categories": workload.BASE_CATEGORIES,
+                                   "keys": workload.BASE_KEYS, "spans": workload.BASE_SPANS,
+                                   "nested_spans": workload.BASE_NESTED_SPANS})
+
+        params = scaled_parameters(1)
+        del params["pcsp_bytes"]
+        generated = xshd_shape(self.parse_text(generate_xshd(**params)))
+        self.assertEqual((generated["rulesets"], generated["categories"], generated["nested_spans"]),
+                         (example["rulesets"], example["categories"], example["nested_spans"]))
+        self.assertGreaterEqual(generated["keys"], example["keys"])
+        self.assertLess(generated["keys"], example["keys"] + example["categories"])
+        self.assertGreaterEqual(generated["spans"], example["spans"])
+
+    def test_write_workload(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xshd_path, pcsp_path = write_workload(tmp_dir, scale=2, seed=0)
+            self.assertIsNotNone(parse_xshd(xshd_path))
+            self.assertGreaterEqual(os.path.getsize(pcsp_path), scaled_parameters(2)["pcsp_bytes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
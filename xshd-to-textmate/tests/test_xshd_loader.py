@@ -0,0 +1,109 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from ..src.errors import XshdImportError
+from ..src.xshd_parser import load_xshd
+from ..src.xshd_loader import DefinitionLoader, split_reference
+from ..src.api import convert_files
+
+
+class TestXshdLoader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        cls.imports_dir = os.path.join(os.path.dirname(__file__), 'fixtures', 'imports')
+        cls.lib_dir = os.path.join(cls.imports_dir, 'lib')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_split_reference(self):
+        self.assertEqual(split_reference("Common/Comments"), ("Common", "Comments"))
+        self.assertEqual(split_reference("Common/"), ("Common", None))
+        self.assertIsNone(split_reference("Comments"))
+
+    def test_cross_file_references(self):
+        data = DefinitionLoader([self.lib_dir]).load(os.path.join(self.imports_dir, 'Lang.xshd'))
+        self.assertEqual([r["name"] for r in data["rulesets"]],
+                         [None, "Shared", "Common/", "Base/Attributes", "Common/DocTags"])
+        rules = {s["name"]: s["rule"] for s in data["spans"]}
+        self.assertEqual(rules["Template"], "Common/")
+        self.assertEqual(rules["Attribute"], "Base/Attributes")
+        # Rules inside imported RuleSets point at their renamed RuleSets
+        self.assertEqual(rules["BlockComment"], "Common/DocTags")
+        self.assertEqual(data["keywords"]["Literals"], ["false", "true"])
+        self.assertEqual(data["keywords"]["AttributeNames"], ["inline"])
+        self.assertEqual(data["keywords"]["DocTags"], ["@param", "@return"])
+        self.assertEqual(data["comments"]["line_comment_start"], ["//"])
+        self.assertEqual(data["comments"]["block_comment_start"], ["/*"])
+        # reference= stands for the main RuleSet of Common
+        shared = data["rulesets"][1]
+        self.assertEqual([s["name"] for s in shared["spans"]], ["String"])
+
+    def test_unresolved_references(self):
+        with self.assertRaises(XshdImportError) as raised:
+            DefinitionLoader().load(os.path.join(self.imports_dir, 'Lang.xshd'))
+        self.assertEqual(raised.exception.reference, "Base/Attributes")
+
+        missing = os.path.join(self.tmp_dir.name, 'Missing.xshd')
+        shutil.copy(os.path.join(self.imports_dir, 'Common.xshd'), self.tmp_dir.name)
+        with open(missing, 'w') as f:
+            f.write('<SyntaxDefinition name="Missing"><RuleSet><Import ruleSet="Common/Nope"/></RuleSet>'
+                    '</SyntaxDefinition>')
+        with self.assertRaisesRegex(XshdImportError, "'Nope'"):
+            DefinitionLoader().load(missing)
+
+    def test_cycle(self):
+        with self.assertRaises(XshdImportError) as raised:
+            DefinitionLoader().load(os.path.join(self.imports_dir, 'CycleA.xshd'))
+        chain = raised.exception.chain
+        self.assertEqual(len(chain), 3)
+        self.assertTrue(chain[0].endswith("CycleA.xshd#Outer"))
+        self.assertTrue(chain[1].endswith("CycleB.xshd#Inner"))
+        self.assertEqual(chain[0], chain[-1])
+
+    def test_definitions_without_references_are_unchanged(self):
+        loader = DefinitionLoader()
+        for path in (os.path.join(self.base_dir, 'Examples', 'Syntax.xshd'),
+                     os.path.join(os.path.dirname(__file__), 'fixtures', 'sample.xshd')):
+            self.assertEqual(loader.load(path), load_xshd(path), path)
+
+    def test_memoized_parses(self):
+        for name in ('Lang.xshd', 'Common.xshd'):
+            shutil.copy(os.path.join(self.imports_dir, name), self.tmp_dir.name)
+        other = os.path.join(self.tmp_dir.name, 'Other.xshd')
+        with open(other, 'w') as f:
+            f.write('<SyntaxDefinition name="Other"><RuleSet><Import ruleSet="Common/Comments"/></RuleSet>'
+                    '</SyntaxDefinition>')
+        loader = DefinitionLoader([self.lib_dir])
+        out_dir = os.path.join(self.tmp_dir.name, 'out')
+        grammars = convert_files([os.path.join(self.tmp_dir.name, 'Lang.xshd'), other], out_dir, loader=loader)
+        self.assertEqual(len(grammars), 2)
+        self.assertEqual(sorted(os.listdir(out_dir)), ["Lang.tmLanguage.json", "Other.tmLanguage.json"])
+        # Lang, Common and Base once each, Other once
+        self.assertEqual(loader.stats["parsed"], 4)
+
+        common = os.path.join(self.tmp_dir.name, 'Common.xshd')
+        with open(common) as f:
+            content = f.read()
+        with open(common, 'w') as f:
+            f.write(content.replace("@param", "@throws"))
+        self.assertEqual(loader.load(other)["keywords"]["DocTags"], ["@return", "@throws"])
+        self.assertEqual(loader.stats["parsed"], 5)
+
+        # Same content again (new mtime): hashed, not parsed
+        with open(common, 'w') as f:
+            f.write(content.replace("@param", "@throws"))
+        os.utime(common, ns=(0, 0))
+        loader.load(other)
+        self.assertEqual(loader.stats["parsed"], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
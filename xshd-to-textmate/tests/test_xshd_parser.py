@@ -151,8 +151,19 @@ class TestXSHDParser(unittest.TestCase):
                 self.assertIsNone(span["color"])# No color attribute
                 self.assertFalse(span["stopateol"]) # Default
                 self.assertFalse(span["multiline"]) # Default
+                self.assertIsNone(span["escapecharacter"]) # No escapecharacter attribute
                 break
         self.assertTrue(span_found, "Span 'OnlyNameSpan' not found in parsed data")
 
+    def test_parse_escapecharacter(self):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        data = parse_xshd(os.path.join(base_dir, 'Examples', 'Syntax.xshd'))
+        strings = {s["name"]: s for s in data["strings"]}
+        self.assertEqual(strings["String"]["escapecharacter"], "\\")
+        self.assertEqual(strings["Character"]["escapecharacter"], "\\")
+        self.assertTrue(strings["Character"]["stopateol"])
+        assertion = next(span for span in data["spans"] if span["name"] == "Assertion")
+        self.assertIsNone(assertion["escapecharacter"])
+
 if __name__ == '__main__':
     unittest.main()
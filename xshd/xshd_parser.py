@@ -1,35 +0,0 @@
-import argparse
-import json
-import xml.etree.ElementTree as ET
-
-# (The rest of the parser code will be added in subsequent steps)
-# For now, let's define a placeholder for syntax_info
-syntax_info = {}
-
-def parse_xshd(file_path):
-    """
-    Parses an XSHD file and extracts syntax highlighting information.
-    (This function will be implemented in detail later)
-    """
-    # Placeholder implementation
-    global syntax_info
-    try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        # For now, just putting a placeholder value
-        syntax_info = {"name": root.get("name", "Unknown Syntax")}
-    except ET.ParseError as e:
-        print(f"Error parsing XML: {e}")
-        syntax_info = {"error": "Failed to parse XSHD file"}
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        syntax_info = {"error": f"File not found: {file_path}"}
-
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Parse XSHD file and output JSON.")
-    parser.add_argument("file_path", help="Path to the XSHD file")
-    args = parser.parse_args()
-
-    parse_xshd(args.file_path)
-    print(json.dumps(syntax_info, indent=4))